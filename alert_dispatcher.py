@@ -0,0 +1,300 @@
+import asyncio
+import collections
+import os
+import random
+import smtplib
+import threading
+from datetime import datetime
+from email.message import EmailMessage
+
+# aiosmtplib is optional, without it smtp sends run on a worker thread instead
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+# queue and batching defaults
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_DIGEST_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEFAULT_CONCURRENCY = 4
+
+# retry defaults, backoff doubles after every failed attempt
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 1.0
+
+# digests that gave up are kept for inspection, the oldest dropped past this many
+DEFAULT_MAX_FAILED = 1000
+
+DEFAULT_SENDER = "price-alerts@company.com"
+
+def alert_records(alert_products):
+    """
+    Turn a frame of alert rows into plain dicts with the price difference worked out
+    """
+    if alert_products.empty:
+        return []
+    
+    records = alert_products[['product_name', 'our_price', 'competitor_name', 'competitor_price']].copy()
+    records['price_diff'] = records['our_price'] - records['competitor_price']
+    records['percentage'] = (records['price_diff'] / records['our_price']) * 100
+    
+    return records.to_dict('records')
+
+def build_digest(recipient, alerts, sender=DEFAULT_SENDER):
+    """
+    One email summarising a batch of alerts for a recipient
+    """
+    lines = [
+        f"PRICE ALERT: {len(alerts)} products with competitor price drops",
+        f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+    ]
+    lines.extend(
+        f"{alert['product_name']}: ours ${alert['our_price']:.2f}, "
+        f"{alert['competitor_name']} ${alert['competitor_price']:.2f} "
+        f"(-${alert['price_diff']:.2f} / {alert['percentage']:.1f}%)"
+        for alert in alerts
+    )
+    
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    message['Subject'] = f"Price alert: {len(alerts)} competitor price drops"
+    message.set_content("\n".join(lines))
+    
+    return message
+
+class FileTransport:
+    """
+    Writes every digest to an .eml file instead of sending it, for local testing
+    """
+    
+    def __init__(self, directory=os.path.join('logs', 'outbox')):
+        self.directory = directory
+    
+    async def send(self, message):
+        await asyncio.to_thread(self._write, message)
+    
+    def _write(self, message):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        
+        recipient = message['To'].replace('@', '_at_')
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{recipient}.eml"
+        with open(os.path.join(self.directory, filename), 'wb') as f:
+            f.write(message.as_bytes())
+
+class SmtpTransport:
+    """
+    Sends digests over SMTP. Point it at localhost:1025 with a debug server
+    (python -m aiosmtpd -n -l localhost:1025) to see mails without delivering them.
+    """
+    
+    def __init__(self, host='localhost', port=25, username=None, password=None, use_tls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+    
+    async def send(self, message):
+        if aiosmtplib is not None:
+            await aiosmtplib.send(
+                message,
+                hostname=self.host,
+                port=self.port,
+                username=self.username,
+                password=self.password,
+                start_tls=self.use_tls,
+                timeout=self.timeout
+            )
+        else:
+            await asyncio.to_thread(self._send_blocking, message)
+    
+    def _send_blocking(self, message):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+class AlertDispatcher:
+    """
+    Sends alert digests from a background event loop so callers never wait on email.
+    
+    submit() drops alerts on a bounded queue and returns straight away. The loop
+    groups alerts per recipient into digests of up to digest_size (or whatever
+    has built up after flush_interval seconds), sends at most concurrency digests
+    at a time and retries failures with exponential backoff. Digests that still
+    fail end up in failed, which keeps the newest max_failed of them.
+    """
+    
+    def __init__(self, transport, sender=DEFAULT_SENDER, queue_size=DEFAULT_QUEUE_SIZE,
+                 digest_size=DEFAULT_DIGEST_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 concurrency=DEFAULT_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_seconds=DEFAULT_BACKOFF_SECONDS, max_failed=DEFAULT_MAX_FAILED):
+        self.transport = transport
+        self.sender = sender
+        self.queue_size = queue_size
+        self.digest_size = digest_size
+        self.flush_interval = flush_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        
+        self.stats = {'queued': 0, 'rejected': 0, 'sent_digests': 0, 'sent_alerts': 0, 'retries': 0, 'failed_digests': 0}
+        self.failed = collections.deque(maxlen=max_failed)
+        
+        self._loop = None
+        self._thread = None
+        self._queue = None
+        self._started = threading.Event()
+        self._stats_lock = threading.Lock()
+    
+    def start(self):
+        """
+        Spin up the background loop (safe to call more than once)
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        
+        self._started.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+    
+    def submit(self, recipient, alerts, timeout=1.0):
+        """
+        Queue alert dicts for a recipient. Returns how many were accepted, alerts
+        that don't fit in the queue within timeout seconds are counted as rejected.
+        """
+        self.start()
+        
+        future = asyncio.run_coroutine_threadsafe(self._enqueue(recipient, alerts, timeout), self._loop)
+        return future.result()
+    
+    def stop(self, timeout=30):
+        """
+        Flush whatever is queued, wait for in-flight sends and shut the loop down
+        """
+        if self._thread is None:
+            return
+        
+        future = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+        future.result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+    
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+    
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._in_flight = set()
+        
+        # recipient -> alerts waiting to go out, plus when the oldest one arrived
+        self._pending = {}
+        self._first_seen = {}
+        
+        self._batcher = self._loop.create_task(self._batch_alerts())
+        
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+    
+    async def _enqueue(self, recipient, alerts, timeout):
+        accepted = 0
+        deadline = self._loop.time() + timeout
+        
+        for alert in alerts:
+            # wait for room while there's time left, then take only what fits right now.
+            # wait_for with no time left would still build and cancel a put for every alert
+            remaining = deadline - self._loop.time()
+            try:
+                if remaining > 0:
+                    await asyncio.wait_for(self._queue.put((recipient, alert)), remaining)
+                else:
+                    self._queue.put_nowait((recipient, alert))
+                accepted += 1
+            except (asyncio.TimeoutError, asyncio.QueueFull):
+                break
+        
+        self._count('queued', accepted)
+        self._count('rejected', len(alerts) - accepted)
+        return accepted
+    
+    async def _batch_alerts(self):
+        while True:
+            try:
+                recipient, alert = await asyncio.wait_for(self._queue.get(), self.flush_interval)
+                self._pending.setdefault(recipient, []).append(alert)
+                self._first_seen.setdefault(recipient, self._loop.time())
+                self._queue.task_done()
+            except asyncio.TimeoutError:
+                pass
+            
+            now = self._loop.time()
+            for recipient in list(self._pending):
+                full = len(self._pending[recipient]) >= self.digest_size
+                stale = now - self._first_seen[recipient] >= self.flush_interval
+                if full or stale:
+                    self._dispatch(recipient, self._pending.pop(recipient))
+                    del self._first_seen[recipient]
+    
+    def _dispatch(self, recipient, alerts):
+        # digests bigger than digest_size get split so no single mail is huge
+        for start in range(0, len(alerts), self.digest_size):
+            task = self._loop.create_task(self._send_with_retry(recipient, alerts[start:start + self.digest_size]))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+    
+    async def _send_with_retry(self, recipient, alerts):
+        message = build_digest(recipient, alerts, self.sender)
+        
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self.transport.send(message)
+                    self._count('sent_digests')
+                    self._count('sent_alerts', len(alerts))
+                    return
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        print(f"Alert digest to {recipient} failed after {attempt + 1} attempts: {str(e)}")
+                        self._count('failed_digests')
+                        self.failed.append((recipient, alerts, str(e)))
+                        return
+                    
+                    # exponential backoff with a bit of jitter so retries don't line up
+                    self._count('retries')
+                    delay = self.backoff_seconds * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+    
+    async def _drain(self):
+        # let the batcher pick everything up, then force out the partial digests
+        await self._queue.join()
+        self._batcher.cancel()
+        await asyncio.gather(self._batcher, return_exceptions=True)
+        
+        for recipient in list(self._pending):
+            self._dispatch(recipient, self._pending.pop(recipient))
+        self._first_seen.clear()
+        
+        if self._in_flight:
+            await asyncio.gather(*list(self._in_flight), return_exceptions=True)
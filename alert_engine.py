@@ -0,0 +1,160 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+import db
+
+# meta keys for the engine's bookkeeping and settings
+HIGH_WATER_MARK_KEY = 'alert_engine.last_history_id'
+MIN_DIFF_KEY = 'alert_engine.min_diff'
+MIN_PERCENTAGE_KEY = 'alert_engine.min_percentage'
+
+# what check_alerts hands back for each event
+EVENT_COLUMNS = [
+    'event', 'product_id', 'product_name', 'competitor_name', 'our_price',
+    'competitor_price', 'price_diff', 'percentage', 'previous_price_diff'
+]
+
+def get_thresholds(conn=None):
+    """
+    The saved (min_diff, min_percentage) a competitor has to undercut us by to alert
+    """
+    min_diff = float(db.get_meta(MIN_DIFF_KEY, 0, conn=conn))
+    min_percentage = float(db.get_meta(MIN_PERCENTAGE_KEY, 0, conn=conn))
+    
+    return min_diff, min_percentage
+
+def set_thresholds(min_diff, min_percentage):
+    """
+    Save the alert thresholds, in dollars and percent of our price
+    """
+    with db.connection() as conn:
+        db.set_meta(MIN_DIFF_KEY, float(min_diff), conn=conn)
+        db.set_meta(MIN_PERCENTAGE_KEY, float(min_percentage), conn=conn)
+        conn.commit()
+
+def check_alerts(min_diff=None, min_percentage=None):
+    """
+    Diff every price that changed since the last run against the alert state.
+    
+    Only price_history rows newer than the engine's high-water mark are looked
+    at, so the work scales with what was ingested, not with the catalogue.
+    Returns a frame of events:
+      new       - competitor now undercuts us past the thresholds, no alert yet
+      worsened  - already alerted, and the gap has grown since that alert
+      resolved  - was alerting, isn't any more
+    Thresholds default to the saved ones (see set_thresholds).
+    """
+    try:
+        with db.connection() as conn:
+            # take the write lock up front so two runs can't claim the same rows
+            conn.execute("BEGIN IMMEDIATE")
+            
+            saved_diff, saved_percentage = get_thresholds(conn)
+            min_diff = saved_diff if min_diff is None else min_diff
+            min_percentage = saved_percentage if min_percentage is None else min_percentage
+            
+            last_seen = int(db.get_meta(HIGH_WATER_MARK_KEY, 0, conn=conn))
+            newest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM price_history").fetchone()[0]
+            
+            if newest <= last_seen:
+                conn.rollback()
+                return pd.DataFrame(columns=EVENT_COLUMNS)
+            
+            # current price and last alert for every pair touched since the last run
+            changed = pd.read_sql_query(
+                '''
+                WITH changed AS (
+                    SELECT DISTINCT product_id, competitor_name FROM price_history
+                    WHERE id > ? AND id <= ?
+                )
+                SELECT latest_prices.product_id, latest_prices.product_name, latest_prices.competitor_name,
+                       latest_prices.our_price, latest_prices.competitor_price,
+                       alert_state.price_diff AS previous_price_diff
+                FROM changed
+                JOIN latest_prices
+                  ON latest_prices.product_id = changed.product_id
+                 AND latest_prices.competitor_name = changed.competitor_name
+                LEFT JOIN alert_state
+                  ON alert_state.product_id = changed.product_id
+                 AND alert_state.competitor_name = changed.competitor_name
+                ''',
+                conn,
+                params=(last_seen, newest)
+            )
+            
+            events = _classify(changed, min_diff, min_percentage)
+            _save_state(conn, events)
+            
+            db.set_meta(HIGH_WATER_MARK_KEY, newest, conn=conn)
+            conn.commit()
+        
+        return events
+    except Exception as e:
+        print(f"Alert check error: {str(e)}")
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+def _classify(changed, min_diff, min_percentage):
+    # a column of nothing but NULLs comes back as object, make it numeric
+    changed['previous_price_diff'] = changed['previous_price_diff'].astype(float)
+    changed['price_diff'] = changed['our_price'] - changed['competitor_price']
+    changed['percentage'] = (changed['price_diff'] / changed['our_price']) * 100
+    
+    alerting = (
+        (changed['price_diff'] > 0)
+        & (changed['price_diff'] >= min_diff)
+        & (changed['percentage'] >= min_percentage)
+    ).to_numpy()
+    was_alerting = changed['previous_price_diff'].notna().to_numpy()
+    got_worse = (changed['price_diff'] > changed['previous_price_diff']).to_numpy()
+    
+    changed['event'] = np.select(
+        [alerting & ~was_alerting, alerting & was_alerting & got_worse, ~alerting & was_alerting],
+        ['new', 'worsened', 'resolved'],
+        default=''
+    )
+    
+    events = changed[changed['event'] != '']
+    return events[EVENT_COLUMNS].reset_index(drop=True)
+
+def _save_state(conn, events):
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    
+    raised = events[events['event'] != 'resolved']
+    conn.executemany(
+        '''
+        INSERT INTO alert_state (product_id, competitor_name, product_name, our_price,
+                                 competitor_price, price_diff, percentage, alerted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (product_id, competitor_name) DO UPDATE SET
+            product_name = excluded.product_name,
+            our_price = excluded.our_price,
+            competitor_price = excluded.competitor_price,
+            price_diff = excluded.price_diff,
+            percentage = excluded.percentage,
+            alerted_at = excluded.alerted_at
+        ''',
+        [
+            (row.product_id, row.competitor_name, row.product_name, float(row.our_price),
+             float(row.competitor_price), float(row.price_diff), float(row.percentage), now)
+            for row in raised.itertuples(index=False)
+        ]
+    )
+    
+    resolved = events[events['event'] == 'resolved']
+    conn.executemany(
+        "DELETE FROM alert_state WHERE product_id = ? AND competitor_name = ?",
+        list(resolved[['product_id', 'competitor_name']].itertuples(index=False, name=None))
+    )
+
+def get_active_alerts():
+    """
+    Every pair currently in the alerting state, biggest gap first
+    """
+    try:
+        with db.connection(readonly=True) as conn:
+            return pd.read_sql_query("SELECT * FROM alert_state ORDER BY price_diff DESC", conn)
+    except Exception as e:
+        print(f"Alert state error: {str(e)}")
+        return pd.DataFrame()
@@ -0,0 +1,262 @@
+import atexit
+import glob
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# Alerts are appended as JSON lines to logs/alerts.jsonl. Once that file gets
+# too big or too old it's renamed to alerts.<first>_<last>.jsonl(.gz), with the
+# time range of its records in the name, so reads for a window can skip whole
+# files without opening them.
+
+DEFAULT_DIRECTORY = 'logs'
+ACTIVE_FILENAME = 'alerts.jsonl'
+
+# rotation defaults
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_AGE = timedelta(days=1)
+DEFAULT_MAX_FILES = 100
+
+# records held in memory before they're written out in one go
+DEFAULT_BUFFER_SIZE = 1000
+
+# timestamps in rotated filenames
+FILENAME_TIME_FORMAT = '%Y%m%dT%H%M%S'
+
+# every line starts with {"ts":"<iso timestamp>", so the time can be read without parsing json
+TS_PREFIX = '{"ts":"'
+TS_LENGTH = len('2025-01-01T00:00:00')
+
+# what gets logged for each alert, when the frame has it
+RECORD_COLUMNS = [
+    'event', 'product_id', 'product_name', 'competitor_name',
+    'our_price', 'competitor_price', 'price_diff', 'percentage'
+]
+
+def alert_log_records(alert_products, timestamp=None):
+    """
+    Turn a frame of alert rows into log records, working out the price difference if needed
+    """
+    if alert_products.empty:
+        return []
+    
+    ts = (timestamp or datetime.now()).isoformat(timespec='seconds')
+    
+    records = alert_products[[c for c in RECORD_COLUMNS if c in alert_products.columns]].copy()
+    if 'price_diff' not in records.columns:
+        records['price_diff'] = records['our_price'] - records['competitor_price']
+    if 'percentage' not in records.columns:
+        records['percentage'] = (records['price_diff'] / records['our_price']) * 100
+    
+    records['price_diff'] = records['price_diff'].round(2)
+    records['percentage'] = records['percentage'].round(2)
+    records.insert(0, 'ts', ts)
+    
+    return records.to_dict('records')
+
+class AlertLog:
+    """
+    Append-only JSON Lines alert log with size/age rotation and optional gzip.
+    
+    write() only buffers, records hit the disk in a single write once
+    buffer_size of them have built up or flush() is called.
+    """
+    
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 compress=True, max_files=DEFAULT_MAX_FILES, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.max_files = max_files
+        self.buffer_size = buffer_size
+        
+        self._buffer = []
+        self._lock = threading.Lock()
+    
+    @property
+    def active_path(self):
+        return os.path.join(self.directory, ACTIVE_FILENAME)
+    
+    def write(self, records):
+        """
+        Buffer alert records (dicts with a 'ts' key first), flushing when the buffer is full
+        """
+        lines = [json.dumps(record, separators=(',', ':'), default=str) + '\n' for record in records]
+        
+        with self._lock:
+            self._buffer.extend(lines)
+            if len(self._buffer) >= self.buffer_size:
+                self._flush_locked()
+        
+        return len(lines)
+    
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        
+        data = ''.join(self._buffer)
+        
+        if self._should_rotate(len(data.encode('utf-8'))):
+            self._rotate()
+        
+        with open(self.active_path, 'a', encoding='utf-8') as f:
+            f.write(data)
+        
+        self._buffer = []
+    
+    def _should_rotate(self, incoming_bytes):
+        try:
+            size = os.path.getsize(self.active_path)
+        except OSError:
+            return False
+        
+        if size == 0:
+            return False
+        if size + incoming_bytes > self.max_bytes:
+            return True
+        
+        first, _ = _time_range(self.active_path)
+        return first is not None and datetime.now() - first >= self.max_age
+    
+    def _rotate(self):
+        first, last = _time_range(self.active_path)
+        first = first or datetime.now()
+        last = last or first
+        
+        name = f"alerts.{first.strftime(FILENAME_TIME_FORMAT)}_{last.strftime(FILENAME_TIME_FORMAT)}"
+        rotated = os.path.join(self.directory, name)
+        
+        # two rotations inside the same second would collide otherwise
+        suffix = 1
+        while glob.glob(rotated + '*.jsonl*'):
+            rotated = os.path.join(self.directory, f"{name}-{suffix}")
+            suffix += 1
+        
+        if self.compress:
+            with open(self.active_path, 'rb') as src, gzip.open(rotated + '.jsonl.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.active_path)
+        else:
+            os.replace(self.active_path, rotated + '.jsonl')
+        
+        self._prune()
+    
+    def _prune(self):
+        if self.max_files is None:
+            return
+        
+        rotated = rotated_files(self.directory)
+        for path, _, _ in rotated[:max(len(rotated) - self.max_files, 0)]:
+            os.remove(path)
+
+def _line_time(line):
+    if not line.startswith(TS_PREFIX):
+        return None
+    try:
+        return datetime.fromisoformat(line[len(TS_PREFIX):len(TS_PREFIX) + TS_LENGTH])
+    except ValueError:
+        return None
+
+def _time_range(path):
+    # first line from the top, last line from a small read off the end
+    with open(path, 'r', encoding='utf-8') as f:
+        first = _line_time(f.readline())
+    
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 4096, 0))
+        tail = f.read().decode('utf-8', errors='ignore').splitlines()
+    last = _line_time(tail[-1]) if tail else None
+    
+    return first, last
+
+def rotated_files(directory=DEFAULT_DIRECTORY):
+    """
+    Rotated log files as (path, first, last) tuples, oldest first
+    """
+    files = []
+    
+    for path in glob.glob(os.path.join(directory, 'alerts.*_*.jsonl*')):
+        stamp = os.path.basename(path).split('.')[1]
+        try:
+            first, last = stamp.split('-')[0].split('_')
+            files.append((
+                path,
+                datetime.strptime(first, FILENAME_TIME_FORMAT),
+                datetime.strptime(last, FILENAME_TIME_FORMAT)
+            ))
+        except ValueError:
+            continue
+    
+    return sorted(files, key=lambda item: (item[1], item[0]))
+
+def read_alerts(start=None, end=None, directory=DEFAULT_DIRECTORY):
+    """
+    Alerts logged between start and end (datetimes, inclusive, either can be None).
+    
+    Rotated files outside the window are skipped by name, and lines are filtered
+    on their timestamp prefix before any json gets parsed.
+    """
+    # buffered records count too
+    if directory == _default_log.directory:
+        _default_log.flush()
+    
+    paths = [
+        path for path, first, last in rotated_files(directory)
+        if (start is None or last >= start.replace(microsecond=0)) and (end is None or first <= end)
+    ]
+    
+    active_path = os.path.join(directory, ACTIVE_FILENAME)
+    if os.path.exists(active_path):
+        paths.append(active_path)
+    
+    low = start.isoformat(timespec='seconds') if start is not None else None
+    high = end.isoformat(timespec='seconds') if end is not None else None
+    
+    records = []
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                # iso timestamps sort as strings, so compare them without parsing
+                ts = line[len(TS_PREFIX):len(TS_PREFIX) + TS_LENGTH]
+                if (low is None or ts >= low) and (high is None or ts <= high):
+                    records.append(json.loads(line))
+    
+    if not records:
+        return pd.DataFrame(columns=['ts'] + RECORD_COLUMNS)
+    
+    alerts = pd.DataFrame.from_records(records)
+    alerts['ts'] = pd.to_datetime(alerts['ts'])
+    return alerts.sort_values('ts', kind='stable').reset_index(drop=True)
+
+# shared log used by the app, flushed on the way out so nothing buffered is lost
+_default_log = AlertLog()
+atexit.register(_default_log.flush)
+
+def get_alert_log():
+    return _default_log
+
+def log_alerts(alert_products, flush=True):
+    """
+    Append a frame of alerts to the shared log, returns how many were written
+    """
+    written = _default_log.write(alert_log_records(alert_products))
+    
+    if flush:
+        _default_log.flush()
+    
+    return written
@@ -1,29 +1,88 @@
 import streamlit as st
 import pandas as pd
-import io
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import plotly.express as px
 import numpy as np
 
 # import our modules
+import data_cache
+import alert_engine
+import alert_log
 import db
+import ingest
+import instrumentation
 import price_compare
+import trends
 import email_alert
 
-# init the database when app starts
-db.init_db()
+# most rows the search tab will render for one query
+SEARCH_RESULT_LIMIT = 500
 
-# page config with no emoji
-st.set_page_config(
-    page_title="Price Monitoring Dashboard",
-    page_icon=None,
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# product columns -> headers shown in the product tables
+COLUMN_LABELS = {
+    'id': 'ID',
+    'product_id': 'Product ID',
+    'product_name': 'Product Name',
+    'our_price': 'Our Price',
+    'competitor_name': 'Competitor',
+    'competitor_price': 'Their Price',
+    'last_updated': 'Last Updated',
+    'message': 'Status'
+}
 
-# Add some custom CSS for better styling
-st.markdown("""
+# column picker for the comparison table, label -> column
+TABLE_COLUMNS = {label: col for col, label in COLUMN_LABELS.items()}
+
+# sort choices for the comparison table, label -> column sqlite orders by
+SORT_OPTIONS = {
+    'Upload Order': 'id',
+    'Product ID': 'product_id',
+    'Product Name': 'product_name',
+    'Competitor': 'competitor_name',
+    'Our Price': 'our_price',
+    'Their Price': 'competitor_price',
+    'Price Gap': 'price_gap',
+    'Last Updated': 'last_updated'
+}
+
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250, 500]
+
+# sort choices for the price matrix, label -> product_summary column
+MATRIX_SORT_OPTIONS = {
+    'Product ID': 'product_id',
+    'Product Name': 'product_name',
+    'Gap to Cheapest': 'gap_to_cheapest',
+    'Our Rank': 'our_rank',
+    'Our Price': 'our_price',
+    'Cheapest Price': 'min_competitor_price',
+    'Competitors': 'competitors',
+    'Last Updated': 'last_updated'
+}
+
+# product_summary columns -> headers in the price matrix
+SUMMARY_LABELS = {
+    'product_name': 'Product Name',
+    'our_price': 'Our Price',
+    'our_rank': 'Our Rank',
+    'min_competitor_price': 'Min',
+    'median_competitor_price': 'Median',
+    'max_competitor_price': 'Max',
+    'cheapest_competitor': 'Cheapest',
+    'gap_to_cheapest': 'Gap to Cheapest'
+}
+
+CHEAPEST_CELL_STYLE = 'background-color: rgba(255, 0, 0, 0.15); font-weight: bold'
+
+# look-back choices for the most volatile pairs, label -> days
+VOLATILITY_WINDOWS = {'Last 7 days': 7, 'Last 30 days': 30, 'Last 90 days': 90}
+
+# row colours for the status categories
+ALERT_ROW_STYLE = 'background-color: rgba(255, 0, 0, 0.1)'
+GOOD_ROW_STYLE = 'background-color: rgba(0, 255, 0, 0.1)'
+
+# custom CSS for better styling
+PAGE_CSS = """
 <style>
     .dataframe {
         width: 100%;
@@ -54,50 +113,98 @@ st.markdown("""
         border-bottom: 2px solid #4c78e0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+def setup_page():
+    # page config with no emoji, has to be the first streamlit call of a run
+    st.set_page_config(
+        page_title="Price Monitoring Dashboard",
+        page_icon=None,
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
 
 def main():
+    setup_page()
+    
+    # every instrumented call this rerun makes is also counted for this session
+    if 'diagnostics' not in st.session_state:
+        st.session_state['diagnostics'] = instrumentation.Collector()
+    instrumentation.set_session_collector(st.session_state['diagnostics'])
+    
+    # init the database when app starts
+    db.init_db()
+    
     # sidebar navigation
     st.sidebar.title("Price Monitoring Dashboard")
     
     nav_options = [
         "Home", 
         "Price Comparison Table", 
+        "Price Matrix", 
         "Upload Data", 
         "Search & Filter", 
+        "Price Trends", 
         "Alert Settings"
     ]
     
+    # diagnostics stays out of the menu unless asked for with ?diagnostics=1
+    if st.query_params.get('diagnostics') == '1' or os.environ.get('MARKETPULSE_DIAGNOSTICS'):
+        nav_options.append("Diagnostics")
+    
     page = st.sidebar.radio("Navigation", nav_options)
     
-    # run the selected page
-    if page == "Home":
-        home_page()
-    elif page == "Price Comparison Table":
-        price_table_page()
-    elif page == "Upload Data":
-        upload_page()
-    elif page == "Search & Filter":
-        search_filter_page()
-    elif page == "Alert Settings":
-        alert_settings_page()
+    # a profile requested on the diagnostics page covers the next page run
+    if st.session_state.pop('profile_next_run', False):
+        st.session_state['last_profile'] = {'page': page}
+        with instrumentation.capture_profile(st.session_state['last_profile']):
+            run_page(page)
+    else:
+        run_page(page)
+    
+    # how often reruns got served from the cache instead of the database
+    info = data_cache.cache_info()
+    st.sidebar.caption(f"Data cache: {info['hits']} hits / {info['misses']} misses ({info['entries']} cached)")
+
+def run_page(page):
+    # timed as a whole, so rendering shows up as whatever the db / pandas calls don't explain
+    with instrumentation.timed(f"page.{page}"):
+        if page == "Home":
+            home_page()
+        elif page == "Price Comparison Table":
+            price_table_page()
+        elif page == "Price Matrix":
+            price_matrix_page()
+        elif page == "Upload Data":
+            upload_page()
+        elif page == "Search & Filter":
+            search_filter_page()
+        elif page == "Price Trends":
+            trends_page()
+        elif page == "Alert Settings":
+            alert_settings_page()
+        elif page == "Diagnostics":
+            diagnostics_page()
 
 def home_page():
     st.title("E-commerce Price Monitoring Dashboard")
     
-    # get current data
-    df = db.get_all_products()
+    # get stats for dashboard, from the in-memory products if another page has
+    # loaded them, otherwise aggregated in sqlite, reused until the database changes
+    stats = data_cache.get_price_change_stats()
     
-    if df.empty:
+    if stats['total_products'] == 0:
         st.warning("No data available. Please upload data first.")
         return
     
-    # add price comparison status to data
-    df = price_compare.compare_prices(df)
-    
-    # get stats for dashboard
-    stats = price_compare.get_price_change_stats(df)
-    last_update = db.get_last_update_date()
+    # the rest is cheap, both on one pooled connection
+    with db.connection(readonly=True) as conn:
+        last_update = db.get_last_update_date(conn)
+        
+        # largest gaps come straight off the price_gap index
+        alerts_df = db.get_top_price_gaps(5, conn=conn)
     
     # main stats in columns
     col1, col2, col3 = st.columns(3)
@@ -137,16 +244,28 @@ def home_page():
     fig.update_layout(height=400)
     st.plotly_chart(fig, use_container_width=True)
     
+    # same split for each competitor, from the same place as the stats above
+    competitor_stats = data_cache.get_competitor_stats()
+    
+    if len(competitor_stats) > 1:
+        st.subheader("Price Position by Competitor")
+        
+        competitor_df = pd.DataFrame.from_dict(competitor_stats, orient='index')
+        fig = px.bar(
+            competitor_df,
+            x=competitor_df.index,
+            y=['competitors_cheaper', 'we_are_cheaper', 'identical_prices'],
+            color_discrete_sequence=["#ff9999", "#99ff99", "#cccccc"],
+            labels={'x': 'Competitor', 'value': 'Products', 'variable': 'Status'}
+        )
+        fig.update_layout(height=400)
+        st.plotly_chart(fig, use_container_width=True)
+    
     # show top 5 price drop alerts
     st.subheader("Top Price Drop Alerts")
-    alerts_df = df[df['status'] == 'alert'].copy()
     
     if not alerts_df.empty:
-        # sort by largest price difference
-        alerts_df['price_diff'] = alerts_df['our_price'] - alerts_df['competitor_price']
-        alerts_df = alerts_df.sort_values('price_diff', ascending=False).head(5)
-        
-        # drop status and message columns
+        # just the columns worth showing
         display_df = alerts_df[['product_name', 'our_price', 'competitor_name', 'competitor_price', 'price_diff']]
         display_df = display_df.rename(columns={
             'product_name': 'Product', 
@@ -167,51 +286,156 @@ def home_page():
 def price_table_page():
     st.title("Price Comparison Table")
     
-    # get data and add comparison status
-    df = db.get_all_products()
+    total_rows = data_cache.get_product_count()
     
-    if df.empty:
+    if total_rows == 0:
         st.warning("No data available. Please upload data first.")
         return
     
-    df = price_compare.compare_prices(df)
+    # sorting and paging happen in sqlite, we only ever pull one page
+    col1, col2, col3 = st.columns(3)
     
-    # make a display dataframe with formatted columns
-    display_df = df.copy()
+    with col1:
+        sort_label = st.selectbox("Sort by", list(SORT_OPTIONS))
     
-    # rename columns for better display
-    display_df = display_df.rename(columns={
-        'product_id': 'Product ID',
-        'product_name': 'Product Name',
-        'our_price': 'Our Price',
-        'competitor_name': 'Competitor',
-        'competitor_price': 'Their Price',
-        'last_updated': 'Last Updated',
-        'message': 'Status'
-    })
+    with col2:
+        order = st.radio("Order", ["Ascending", "Descending"], horizontal=True)
     
-    # format currency values
-    display_df['Our Price'] = display_df['Our Price'].apply(lambda x: f"${x:.2f}")
-    display_df['Their Price'] = display_df['Their Price'].apply(lambda x: f"${x:.2f}")
+    with col3:
+        page_size = st.selectbox("Rows per page", PAGE_SIZE_OPTIONS, index=1)
     
-    # drop the status column as we'll use it for styling
-    display_df = display_df.drop(columns=['status'])
+    column_labels = st.multiselect("Columns", list(TABLE_COLUMNS), default=list(TABLE_COLUMNS))
+    columns = [TABLE_COLUMNS[label] for label in column_labels]
     
-    # apply styling based on status
-    def apply_row_styling(row):
-        if row.name in df[df['status'] == 'alert'].index:
-            return ['background-color: rgba(255, 0, 0, 0.1)'] * len(row)
-        elif row.name in df[df['status'] == 'good'].index:
-            return ['background-color: rgba(0, 255, 0, 0.1)'] * len(row)
-        return [''] * len(row)
+    total_pages = max(1, -(-total_rows // page_size))
+    page_number = st.number_input(f"Page (of {total_pages:,})", min_value=1, max_value=total_pages, value=1, step=1)
+    offset = (page_number - 1) * page_size
+    
+    page_df = db.get_products_page(
+        page_size,
+        offset,
+        sort_by=SORT_OPTIONS[sort_label],
+        ascending=(order == "Ascending"),
+        columns=columns
+    )
+    
+    if page_df.empty:
+        st.info("No rows on this page.")
+        return
+    
+    # status and messages for just the rows on screen
+    page_df = price_compare.compare_prices(page_df, with_messages=('message' in columns))
+    
+    # prices always come back for the status, hide them again if they weren't picked
+    hidden_columns = [col for col in ['our_price', 'competitor_price'] if col not in columns]
+    page_df = page_df.drop(columns=hidden_columns)
+    
+    st.caption(f"Showing rows {offset + 1:,}-{offset + len(page_df):,} of {total_rows:,}")
+    render_product_table(page_df)
+
+def price_matrix_page():
+    st.title("Price Matrix")
+    
+    # one row per product from product_summary, which every ingest keeps current
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        sort_label = st.selectbox("Sort by", list(MATRIX_SORT_OPTIONS), index=2)
+    
+    with col2:
+        order = st.radio("Order", ["Ascending", "Descending"], index=1, horizontal=True)
+    
+    with col3:
+        page_size = st.selectbox("Products per page", PAGE_SIZE_OPTIONS, index=1)
+    
+    undercut_only = st.checkbox("Only products where a competitor is cheaper")
+    
+    total_products = db.count_summary_products(undercut_only)
+    
+    if total_products == 0:
+        if undercut_only:
+            st.info("No competitor undercuts us on any product.")
+        else:
+            st.warning("No data available. Please upload data first.")
+        return
+    
+    total_pages = max(1, -(-total_products // page_size))
+    page_number = st.number_input(f"Page (of {total_pages:,})", min_value=1, max_value=total_pages, value=1, step=1)
+    offset = (page_number - 1) * page_size
+    
+    with db.connection(readonly=True) as conn:
+        summary = db.get_summary_page(
+            page_size,
+            offset,
+            sort_by=MATRIX_SORT_OPTIONS[sort_label],
+            ascending=(order == "Ascending"),
+            undercut_only=undercut_only,
+            conn=conn
+        )
+        prices = db.get_competitor_prices(summary['product_id'].tolist(), conn=conn)
+    
+    if summary.empty:
+        st.info("No products on this page.")
+        return
+    
+    # only this page's prices get pivoted, one column per competitor
+    matrix = prices.pivot(index='product_id', columns='competitor_name', values='competitor_price')
+    competitors = sorted(matrix.columns)
+    
+    display_df = summary.set_index('product_id')[list(SUMMARY_LABELS)].join(matrix[competitors])
+    
+    # the cheapest competitor price of every row is highlighted
+    cheapest = matrix[competitors].reindex(display_df.index).eq(display_df['min_competitor_price'], axis=0)
+    styles = pd.DataFrame('', index=display_df.index, columns=display_df.columns)
+    styles[competitors] = np.where(cheapest, CHEAPEST_CELL_STYLE, '')
+    
+    display_df = display_df.rename(columns=SUMMARY_LABELS)
+    styles = styles.rename(columns=SUMMARY_LABELS)
+    
+    price_columns = ['Our Price', 'Min', 'Median', 'Max', 'Gap to Cheapest'] + competitors
+    formats = {col: '${:.2f}' for col in price_columns}
+    
+    st.caption(
+        f"Showing products {offset + 1:,}-{offset + len(display_df):,} of {total_products:,}. "
+        "Our Rank is 1 when no competitor is cheaper than us."
+    )
+    st.dataframe(
+        display_df.style.apply(lambda _: styles, axis=None).format(formats, na_rep='-'),
+        use_container_width=True
+    )
+
+def render_product_table(df):
+    """
+    Format and style rows that went through compare_prices, colouring each row by its status
+    """
+    # rename columns for better display
+    display_df = df.drop(columns=['status']).rename(columns=COLUMN_LABELS)
+    
+    # format currency values
+    for col in ['Our Price', 'Their Price']:
+        if col in display_df.columns:
+            display_df[col] = display_df[col].map('${:.2f}'.format)
+    
+    # the cached frame holds real dates, show them the way they were uploaded
+    if 'Last Updated' in display_df.columns and pd.api.types.is_datetime64_any_dtype(display_df['Last Updated']):
+        display_df['Last Updated'] = display_df['Last Updated'].dt.strftime('%Y-%m-%d')
+    
+    # one style per row straight from the status vector, no lookups per row
+    status = df['status'].to_numpy(dtype=object)
+    row_styles = np.select([status == 'alert', status == 'good'], [ALERT_ROW_STYLE, GOOD_ROW_STYLE], default='')
+    styles = pd.DataFrame(
+        np.repeat(row_styles[:, None], len(display_df.columns), axis=1),
+        index=display_df.index,
+        columns=display_df.columns
+    )
     
     # display with styling
-    st.dataframe(display_df.style.apply(apply_row_styling, axis=1), use_container_width=True)
+    st.dataframe(display_df.style.apply(lambda _: styles, axis=None), use_container_width=True)
 
 def upload_page():
     st.title("Upload Product Data")
     
-    st.write("Upload a CSV file with product price data.")
+    st.write("Upload a CSV or Excel file with product price data. Every sheet of a workbook with the required columns gets loaded.")
     st.write("Required columns: product_id, product_name, our_price, competitor_name, competitor_price, last_updated")
     
     # Add two columns for the upload and sample data buttons
@@ -219,36 +443,40 @@ def upload_page():
     
     with col1:
         st.subheader("Upload Your Own Data")
-        uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
+        uploaded_file = st.file_uploader("Choose a CSV or Excel file", type=["csv", "xlsx", "xlsm", "xls"])
         
         if uploaded_file is not None:
             # try to read the file
             try:
-                df = pd.read_csv(uploaded_file)
+                is_excel = ingest.is_excel_file(uploaded_file)
+                
+                # only peek at the top, the rest gets streamed in on save
+                if is_excel:
+                    preview_df = ingest.preview_excel(uploaded_file)
+                else:
+                    preview_df = ingest.preview_csv(uploaded_file)
                 
                 # check for required columns
-                required_columns = ['product_id', 'product_name', 'our_price', 'competitor_name', 'competitor_price', 'last_updated']
-                missing_columns = [col for col in required_columns if col not in df.columns]
+                missing_columns = [col for col in db.REQUIRED_COLUMNS if col not in preview_df.columns]
                 
                 if missing_columns:
                     st.error(f"Missing required columns: {', '.join(missing_columns)}")
                     return
                 
-                # basic validation
-                if (df['our_price'] < 0).any() or (df['competitor_price'] < 0).any():
-                    st.error("Negative prices are not allowed.")
-                    return
-                
                 # preview the data
                 st.write("Data Preview:")
-                st.dataframe(df.head())
+                st.dataframe(preview_df)
                 
                 # save button
                 if st.button("Save Uploaded Data"):
-                    success, message = db.save_data_to_db(df)
+                    if is_excel:
+                        success, message = save_excel_with_progress(uploaded_file)
+                    else:
+                        success, message = save_csv_with_progress(uploaded_file, uploaded_file.size)
                     
                     if success:
                         st.success(message)
+                        show_alert_changes()
                     else:
                         st.error(message)
             
@@ -281,9 +509,9 @@ def upload_page():
                         st.dataframe(sample_df.head(10))
                         sample_data_loaded = True
                         
-                        # We'll use a session state to keep track of the sample data
+                        # just remember where the sample lives, it gets streamed in on save
                         if 'sample_data' not in st.session_state:
-                            st.session_state.sample_data = sample_df
+                            st.session_state.sample_data = sample_path
                 else:
                     st.error("Sample data file not found. Please check the 'sample_data' directory.")
             except Exception as e:
@@ -292,13 +520,16 @@ def upload_page():
         # Separate button to save sample data
         if 'sample_data' in st.session_state:
             if st.button("Save Sample Data to Database"):
-                success, message = db.save_data_to_db(st.session_state.sample_data)
+                sample_path = st.session_state.sample_data
+                with open(sample_path, 'rb') as sample_file:
+                    success, message = save_csv_with_progress(sample_file, os.path.getsize(sample_path))
                 
                 if success:
                     st.success(message)
+                    show_alert_changes()
                 else:
                     st.error(message)
-
+    
     # Add a section to delete the database
     st.subheader("Database Management")
     st.warning("Warning: Deleting the database will remove all stored product data.")
@@ -312,19 +543,73 @@ def upload_page():
         else:
             st.error(message)
 
+def save_csv_with_progress(csv_file, total_bytes):
+    """
+    Stream a CSV file object into the database batch by batch with a progress bar
+    """
+    progress_bar = st.progress(0.0, text="Saving data...")
+    
+    def update_progress(rows_written):
+        # how far the reader has got through the file is a good enough estimate
+        fraction = csv_file.tell() / total_bytes if total_bytes else 1.0
+        progress_bar.progress(min(fraction, 1.0), text=f"Saved {rows_written:,} rows...")
+    
+    # a file saved before is recognised by its hash and not loaded again
+    success, message = ingest.ingest_file(csv_file, progress=update_progress)
+    progress_bar.empty()
+    
+    return success, message
+
+def save_excel_with_progress(excel_file):
+    """
+    Stream every product sheet of an Excel file object into the database
+    batch by batch. The reader's position says nothing about progress in a
+    workbook, so this just counts rows.
+    """
+    status = st.empty()
+    status.info("Saving data...")
+    
+    def update_progress(rows_written):
+        status.info(f"Saved {rows_written:,} rows...")
+    
+    success, message = ingest.ingest_file(excel_file, progress=update_progress)
+    status.empty()
+    
+    return success, message
+
+def show_alert_changes():
+    """
+    Run the incremental alert check and show what changed since the last one
+    """
+    events = alert_engine.check_alerts()
+    
+    if events.empty:
+        st.info("No new, worsened or resolved price alerts.")
+        return events
+    
+    counts = events['event'].value_counts()
+    st.info(
+        f"Price alerts: {counts.get('new', 0)} new, {counts.get('worsened', 0)} worsened, "
+        f"{counts.get('resolved', 0)} resolved."
+    )
+    
+    # only the alerts that actually changed get logged
+    raised = events[events['event'] != 'resolved']
+    if not raised.empty:
+        email_alert.log_alert_instead(raised)
+    
+    return events
+
 def search_filter_page():
     st.title("Search & Filter Products")
     
-    # get all data first
-    all_data = db.get_all_products()
+    # get all data first, already compared and cached between reruns
+    all_data = data_cache.get_compared_products()
     
     if all_data.empty:
         st.warning("No data available. Please upload data first.")
         return
     
-    # add price comparison info
-    all_data = price_compare.compare_prices(all_data)
-    
     # create tabs for search and filters
     tab1, tab2 = st.tabs(["Search", "Quick Filters"])
     
@@ -333,17 +618,18 @@ def search_filter_page():
         search_term = st.text_input("Search by product or competitor name")
         
         if search_term:
-            # could use the db search function, but since we already have all data
-            # with the status info, we can just filter it here
-            filtered_data = all_data[
-                all_data['product_name'].str.contains(search_term, case=False) | 
-                all_data['competitor_name'].str.contains(search_term, case=False)
-            ]
+            # full-text search in sqlite, then classify just the matches
+            filtered_data = db.search_products(search_term, limit=SEARCH_RESULT_LIMIT)
             
             if filtered_data.empty:
                 st.info(f"No results found for '{search_term}'")
             else:
-                st.write(f"Found {len(filtered_data)} results:")
+                filtered_data = price_compare.compare_prices(filtered_data, with_messages=False)
+                
+                if len(filtered_data) == SEARCH_RESULT_LIMIT:
+                    st.write(f"Showing the {SEARCH_RESULT_LIMIT} best matches:")
+                else:
+                    st.write(f"Found {len(filtered_data)} results:")
                 display_filtered_data(filtered_data)
     
     with tab2:
@@ -369,53 +655,156 @@ def search_filter_page():
                     display_filtered_data(we_are_cheaper)
 
 def display_filtered_data(df):
-    # prepare for display
-    display_df = df.copy()
+    # build messages just for these rows, then style them like the main table
+    render_product_table(price_compare.add_messages(df))
+
+def trends_page():
+    st.title("Price Trends")
     
-    # rename columns for better display
-    display_df = display_df.rename(columns={
-        'product_id': 'Product ID',
-        'product_name': 'Product Name',
-        'our_price': 'Our Price',
-        'competitor_name': 'Competitor',
-        'competitor_price': 'Their Price',
-        'last_updated': 'Last Updated',
-        'message': 'Status'
-    })
+    first_day, last_day = trends.get_trend_range()
     
-    # format currency values
-    display_df['Our Price'] = display_df['Our Price'].apply(lambda x: f"${x:.2f}")
-    display_df['Their Price'] = display_df['Their Price'].apply(lambda x: f"${x:.2f}")
+    if first_day is None:
+        st.warning("No data available. Please upload data first.")
+        return
     
-    # drop the status column as we'll use it for styling
-    display_df = display_df.drop(columns=['status'])
+    st.caption(f"History from {first_day} to {last_day}")
     
-    # apply styling based on status
-    def apply_row_styling(row):
-        if row.name in df[df['status'] == 'alert'].index:
-            return ['background-color: rgba(255, 0, 0, 0.1)'] * len(row)
-        elif row.name in df[df['status'] == 'good'].index:
-            return ['background-color: rgba(0, 255, 0, 0.1)'] * len(row)
-        return [''] * len(row)
+    # one row per competitor per day from the rollup, cheap no matter how much history there is
+    st.subheader("Competitor Price Gap Over Time")
+    competitor_trends = trends.get_competitor_trends()
     
-    # display with styling
-    st.dataframe(display_df.style.apply(apply_row_styling, axis=1), use_container_width=True)
+    fig = px.line(
+        competitor_trends,
+        x='day',
+        y='avg_gap_percentage',
+        color='competitor_name',
+        labels={'day': 'Day', 'avg_gap_percentage': 'Avg. gap (% of our price, + means they are cheaper)', 'competitor_name': 'Competitor'}
+    )
+    fig.update_layout(height=400)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # a single product's daily series with the rolling figures
+    st.subheader("Product Price History")
+    
+    default_id = db.get_first_product_id()
+    if default_id is None:
+        st.info("No products to show yet.")
+        return
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        product_id = st.text_input("Product ID", value=str(default_id))
+    
+    with col2:
+        window = st.slider("Rolling window (observations)", min_value=2, max_value=30, value=trends.DEFAULT_WINDOW_DAYS)
+    
+    series = trends.get_price_series(product_id.strip(), window=window)
+    
+    if series.empty:
+        st.info("No history for that product.")
+    else:
+        # competitor prices solid, their rolling averages dashed
+        long_df = series.melt(
+            id_vars=['day', 'competitor_name'],
+            value_vars=['competitor_price', 'rolling_average'],
+            var_name='measure',
+            value_name='price'
+        )
+        fig = px.line(
+            long_df,
+            x='day',
+            y='price',
+            color='competitor_name',
+            line_dash='measure',
+            labels={'day': 'Day', 'price': 'Price', 'competitor_name': 'Competitor', 'measure': ''}
+        )
+        
+        ours = series.drop_duplicates('day')
+        fig.add_scatter(x=ours['day'], y=ours['our_price'], name='Our price', line={'color': 'black', 'width': 3})
+        fig.update_layout(height=450)
+        st.plotly_chart(fig, use_container_width=True)
+        
+        # where each competitor stands on the newest day
+        latest = series.groupby('competitor_name', observed=True).tail(1)[[
+            'competitor_name', 'day', 'competitor_price', 'rolling_average', 'rolling_volatility', 'days_since_change'
+        ]]
+        st.dataframe(
+            latest.rename(columns={
+                'competitor_name': 'Competitor',
+                'day': 'Last Seen',
+                'competitor_price': 'Their Price',
+                'rolling_average': 'Rolling Avg.',
+                'rolling_volatility': 'Rolling Volatility',
+                'days_since_change': 'Days Since Change'
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    # which competitors are moving their prices around the most
+    st.subheader("Most Volatile Competitor Prices")
+    window_label = st.radio("Period", list(VOLATILITY_WINDOWS), index=1, horizontal=True)
+    volatile = trends.get_most_volatile(days=VOLATILITY_WINDOWS[window_label])
+    
+    if volatile.empty:
+        st.info("Not enough history in that period.")
+    else:
+        st.dataframe(
+            volatile[[
+                'product_id', 'product_name', 'competitor_name', 'average_price',
+                'relative_volatility', 'price_changes', 'days_since_change'
+            ]].rename(columns={
+                'product_id': 'Product ID',
+                'product_name': 'Product Name',
+                'competitor_name': 'Competitor',
+                'average_price': 'Avg. Price',
+                'relative_volatility': 'Volatility %',
+                'price_changes': 'Changes',
+                'days_since_change': 'Days Since Change'
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
 
 def alert_settings_page():
     st.title("Email Alert Settings")
     
-    # email alert status message
-    st.warning("Email alert is in process")
-    st.info("This feature will be implemented in a future update.")
+    # where digests end up depends on whether smtp is configured
+    if os.environ.get('MARKETPULSE_SMTP_HOST'):
+        st.info(f"Alert digests are sent through {os.environ['MARKETPULSE_SMTP_HOST']}.")
+    else:
+        st.info("No SMTP server configured, alert digests are written to logs/outbox.")
+    
+    # how far a competitor has to undercut us before it counts as an alert
+    st.subheader("Alert Thresholds")
+    min_diff, min_percentage = alert_engine.get_thresholds()
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        new_min_diff = st.number_input("Minimum difference ($)", min_value=0.0, value=min_diff, step=1.0)
+    
+    with col2:
+        new_min_percentage = st.number_input("Minimum difference (%)", min_value=0.0, max_value=100.0, value=min_percentage, step=0.5)
+    
+    if st.button("Save Thresholds"):
+        alert_engine.set_thresholds(new_min_diff, new_min_percentage)
+        st.success("Thresholds saved.")
+    
+    # only looks at prices that changed since the last check
+    if st.button("Check for Alert Changes"):
+        events = show_alert_changes()
+        if not events.empty:
+            st.dataframe(events, use_container_width=True)
     
     # get cheaper competitor data for alert preview
-    all_data = db.get_all_products()
+    all_data = data_cache.get_compared_products()
     
     if all_data.empty:
         st.warning("No data available. Please upload data first.")
         return
     
-    all_data = price_compare.compare_prices(all_data)
     alert_data = all_data[all_data['status'] == 'alert']
     
     # alert preview
@@ -459,6 +848,91 @@ def alert_settings_page():
         
         # display table
         st.dataframe(display_df, use_container_width=True)
+        
+        # queue a digest, the dispatcher sends it in the background
+        recipient = st.text_input("Recipient email", value=email_alert.DEFAULT_RECIPIENT)
+        if st.button("Send Alert Digest"):
+            success, message = email_alert.send_price_alert(alert_data, recipient)
+            
+            if success:
+                st.success(message)
+            else:
+                st.error(message)
+    
+    # how the background dispatcher is getting on
+    stats = email_alert.get_dispatcher_stats()
+    if stats is not None:
+        st.caption(
+            f"Dispatcher: {stats['sent_alerts']} alerts sent in {stats['sent_digests']} digests, "
+            f"{stats['pending']} pending, {stats['retries']} retries, {stats['failed_digests']} failed digests"
+        )
+    
+    # alerts logged recently, read straight from the rotating alert log
+    st.subheader("Alert Log")
+    days = st.selectbox("Show alerts logged in the last", [1, 7, 30], format_func=lambda d: f"{d} day{'s' if d > 1 else ''}")
+    logged = alert_log.read_alerts(start=datetime.now() - timedelta(days=days))
+    
+    if logged.empty:
+        st.info("No alerts logged in that window.")
+    else:
+        st.dataframe(logged.sort_values('ts', ascending=False), use_container_width=True)
+
+def diagnostics_page():
+    st.title("Diagnostics")
+    
+    enabled = st.toggle("Record timings", value=instrumentation.is_enabled(),
+                        help="Applies to the whole app process, not just this session")
+    if enabled != instrumentation.is_enabled():
+        if enabled:
+            instrumentation.enable()
+        else:
+            instrumentation.disable()
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("Profile Next Page Run"):
+            # picked up by main() on the next rerun
+            st.session_state['profile_next_run'] = True
+            st.info("Switch to the page to profile, the capture shows up here afterwards.")
+    
+    with col2:
+        if st.button("Reset Session Timings"):
+            st.session_state['diagnostics'].reset()
+    
+    session = st.session_state['diagnostics']
+    
+    st.subheader("This Session")
+    summary = session.summary()
+    if summary.empty:
+        st.info("Nothing recorded yet, turn on timings and use the other pages.")
+    else:
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        
+        # page time that no instrumented call accounts for is mostly streamlit rendering
+        pages = summary[summary['name'].str.startswith('page.')]
+        calls = summary[~summary['name'].str.startswith('page.')]
+        if not pages.empty:
+            st.caption(
+                f"Pages: {pages['total_ms'].sum():,.0f} ms, of which db / pandas calls {calls['total_ms'].sum():,.0f} ms "
+                "(nested calls count more than once)"
+            )
+        
+        st.write("Latency histogram (calls per bucket)")
+        st.dataframe(session.histograms(), use_container_width=True)
+    
+    with st.expander("Whole process"):
+        st.dataframe(instrumentation.get_global_collector().summary(), use_container_width=True, hide_index=True)
+    
+    capture = st.session_state.get('last_profile')
+    if capture and 'error' in capture:
+        st.warning(capture['error'])
+    elif capture and 'profile' in capture:
+        st.subheader(f"Profile of {capture['page']}")
+        st.caption(f"Peak traced memory: {capture['peak_bytes'] / 2**20:,.1f} MiB")
+        st.text(capture['profile'])
+        st.write("Top allocation sites")
+        st.text("\n".join(capture['allocations']))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Parity check and timing for the vectorised price_compare.compare_prices.
+
+Runs the old row-by-row implementation and the current one over every file in
+sample_data/ and over a synthetic frame, checks status/message come out the
+same, and prints how long each took.
+
+    python benchmarks/bench_compare_prices.py --rows 1000000
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# make the app modules importable when run from anywhere
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+import price_compare
+
+def legacy_compare_prices(df):
+    # the original iterrows implementation, kept here as the reference
+    if df.empty:
+        return df
+    
+    result_df = df.copy()
+    result_df['status'] = ''
+    result_df['message'] = ''
+    
+    for idx, row in result_df.iterrows():
+        my_price = row['our_price']
+        comp_price = row['competitor_price']
+        
+        if comp_price < my_price:
+            price_diff = my_price - comp_price
+            percentage = (price_diff / my_price) * 100
+            result_df.at[idx, 'status'] = 'alert'
+            result_df.at[idx, 'message'] = f"Price Drop Alert (${price_diff:.2f} / {percentage:.1f}% cheaper)"
+        elif my_price < comp_price:
+            price_diff = comp_price - my_price
+            percentage = (price_diff / comp_price) * 100
+            result_df.at[idx, 'status'] = 'good'
+            result_df.at[idx, 'message'] = f"We are cheaper (${price_diff:.2f} / {percentage:.1f}% cheaper)"
+        else:
+            result_df.at[idx, 'status'] = 'neutral'
+            result_df.at[idx, 'message'] = "Prices are identical"
+    
+    return result_df
+
+def synthetic_frame(rows, seed=42):
+    # cent-rounded prices with a good share of exact ties, like real feeds
+    rng = np.random.default_rng(seed)
+    our_price = np.round(rng.uniform(1, 2000, rows), 2)
+    competitor_price = np.round(our_price * rng.choice([0.9, 0.95, 1.0, 1.05, 1.1], rows), 2)
+    
+    return pd.DataFrame({
+        'product_id': [f"P{i:07d}" for i in range(rows)],
+        'product_name': "Synthetic Product",
+        'our_price': our_price,
+        'competitor_name': rng.choice(['TechGiant', 'AudioKing', 'ShopMax', 'BudgetBuy'], rows),
+        'competitor_price': competitor_price,
+        'last_updated': '2025-08-01',
+    })
+
+def timed(func, df):
+    started = time.perf_counter()
+    result = func(df)
+    return result, time.perf_counter() - started
+
+def check_parity(label, df):
+    expected, legacy_seconds = timed(legacy_compare_prices, df)
+    actual, new_seconds = timed(price_compare.compare_prices, df)
+    _, status_only_seconds = timed(lambda frame: price_compare.compare_prices(frame, with_messages=False), df)
+    
+    same_status = expected['status'].equals(actual['status'].astype(str).astype(object))
+    same_message = expected['message'].equals(actual['message'])
+    speedup = legacy_seconds / new_seconds if new_seconds > 0 else float('inf')
+    
+    print(f"{label:<40} rows={len(df):>9,}  legacy={legacy_seconds:8.3f}s  "
+          f"vectorised={new_seconds:8.3f}s  status_only={status_only_seconds:7.3f}s  speedup={speedup:7.1f}x  "
+          f"status={'ok' if same_status else 'MISMATCH'}  message={'ok' if same_message else 'MISMATCH'}")
+    
+    return same_status and same_message
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help="size of the synthetic frame")
+    args = parser.parse_args()
+    
+    all_match = True
+    
+    for path in sorted(glob.glob(os.path.join(ROOT_DIR, 'sample_data', '*.csv'))):
+        all_match &= check_parity(os.path.basename(path), pd.read_csv(path))
+    
+    all_match &= check_parity("synthetic", synthetic_frame(args.rows))
+    
+    if not all_match:
+        print("Output differs from the legacy implementation")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Ingest throughput check for db.save_data_to_db.
+
+Loads a synthetic feed into a fresh database twice, first as brand new pairs
+and then as the next day's prices for the same pairs with a few products
+renamed, and times both against the original row-at-a-time insert into a
+plain table, keeping the fastest of --repeat runs. Afterwards the full-text
+index is checked against latest_prices, since bulk loads keep it in step
+themselves rather than through the triggers.
+
+The bulk append times the insert path on its own: the same feed prepared by
+the loader and executemany'd into that plain table inside one transaction
+under the load pragmas, the like-for-like comparison with the row-at-a-time
+insert.
+
+    python benchmarks/bench_ingest.py --rows 100000
+
+Exits 1 when either load is slower than --min-ratio times the row-at-a-time
+insert (or below --min-rows-per-sec), the bulk append is slower than
+--min-bulk-ratio times it, or the search index doesn't match.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+# make the app modules importable when run from anywhere
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+import db
+
+from synthetic import generate_rows
+
+# the full loads also keep latest_prices, the search index and the rollups up to
+# date and measure about 2x the row-at-a-time insert; this catches a slide back
+DEFAULT_MIN_RATIO = 1.5
+
+# bulk append against the insert it replaced, measured about 8x on 100k rows
+DEFAULT_MIN_BULK_RATIO = 5.0
+
+# share of products the second load renames
+RENAMED_SHARE = 0.01
+
+def legacy_save_data_to_db(df, db_path):
+    # the original iterrows implementation, kept here as the reference
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        our_price REAL NOT NULL,
+        competitor_name TEXT NOT NULL,
+        competitor_price REAL NOT NULL,
+        last_updated DATE NOT NULL
+    )
+    ''')
+    
+    df = df.copy()
+    df['last_updated'] = pd.to_datetime(df['last_updated']).dt.date
+    
+    for _, row in df.iterrows():
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO products (product_id, product_name, our_price, competitor_name, competitor_price, last_updated)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            row['product_id'],
+            row['product_name'],
+            row['our_price'],
+            row['competitor_name'],
+            row['competitor_price'],
+            row['last_updated']
+        ))
+    
+    conn.commit()
+    conn.close()
+
+def bulk_append(df, db_path):
+    # the loader's insert path into the same plain table, plus the row hash it adds
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        our_price REAL NOT NULL,
+        competitor_name TEXT NOT NULL,
+        competitor_price REAL NOT NULL,
+        last_updated DATE NOT NULL,
+        row_hash BLOB
+    )
+    ''')
+    
+    with db._bulk_pragmas(conn):
+        for records in db._iter_record_chunks(df, db.DEFAULT_CHUNK_SIZE):
+            conn.executemany('''
+            INSERT INTO products (product_id, product_name, our_price, competitor_name, competitor_price, last_updated, row_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', records)
+        conn.commit()
+    
+    conn.close()
+
+def next_day(df):
+    # same pairs a day later with new prices, and a few products under a new name
+    df = df.copy()
+    df['last_updated'] = (pd.to_datetime(df['last_updated']) + pd.Timedelta(days=1)).dt.strftime('%Y-%m-%d')
+    df['competitor_price'] = (df['competitor_price'] * 0.97).round(2)
+    
+    products = df['product_id'].unique()
+    renamed = products[:max(int(len(products) * RENAMED_SHARE), 1)]
+    df.loc[df['product_id'].isin(renamed), 'product_name'] += ' (new model)'
+    return df
+
+def rows_per_sec(rows, seconds):
+    return rows / seconds if seconds > 0 else float('inf')
+
+def best_rate(repeat, func):
+    # fastest of a few runs, the slower ones are the machine doing something else
+    return max(func() for _ in range(repeat))
+
+def timed_plain_save(save, df, work_dir):
+    # save into a fresh plain-table database
+    db_path = os.path.join(work_dir, 'plain.db')
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    
+    started = time.perf_counter()
+    save(df, db_path)
+    return rows_per_sec(len(df), time.perf_counter() - started)
+
+def timed_save(df):
+    started = time.perf_counter()
+    success, message = db.save_data_to_db(df)
+    elapsed = time.perf_counter() - started
+    if not success:
+        raise RuntimeError(message)
+    return rows_per_sec(len(df), elapsed)
+
+def search_index_matches():
+    try:
+        with db.connection() as conn:
+            conn.execute("INSERT INTO latest_prices_fts (latest_prices_fts) VALUES ('integrity-check')")
+        return True
+    except sqlite3.DatabaseError as e:
+        print(f"search index check failed: {str(e)}")
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help="size of the synthetic feed")
+    parser.add_argument('--competitors', type=int, default=4, help="competitors per product")
+    parser.add_argument('--min-ratio', type=float, default=DEFAULT_MIN_RATIO,
+                        help="slowest allowed load, as a multiple of the row-at-a-time rate")
+    parser.add_argument('--min-bulk-ratio', type=float, default=DEFAULT_MIN_BULK_RATIO,
+                        help="slowest allowed bulk append, as a multiple of the row-at-a-time rate")
+    parser.add_argument('--min-rows-per-sec', type=float, default=0, help="absolute floor for both loads")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each load, the fastest is kept")
+    args = parser.parse_args()
+    
+    first = generate_rows(args.rows, args.competitors)
+    second = next_day(first)
+    
+    with tempfile.TemporaryDirectory(prefix='marketpulse-bench-') as work_dir:
+        reference = best_rate(args.repeat, lambda: timed_plain_save(legacy_save_data_to_db, first, work_dir))
+        bulk = best_rate(args.repeat, lambda: timed_plain_save(bulk_append, first, work_dir))
+        
+        rates = {'new pairs': 0.0, 'next day': 0.0}
+        index_ok = True
+        for run in range(args.repeat):
+            # each run starts from an empty database
+            db.set_db_path(os.path.join(work_dir, f"bench_{run}.db"))
+            db.init_db()
+            
+            rates['new pairs'] = max(rates['new pairs'], timed_save(first))
+            rates['next day'] = max(rates['next day'], timed_save(second))
+            index_ok = search_index_matches() and index_ok
+            db.close_connections()
+    
+    floor = max(reference * args.min_ratio, args.min_rows_per_sec)
+    
+    print(f"{len(first):,} rows per load\n")
+    print(f"  {'row-at-a-time':<16} {reference:>12,.0f} rows/sec")
+    failures = []
+    bulk_slow = bulk < reference * args.min_bulk_ratio
+    if bulk_slow:
+        failures.append('bulk append')
+    print(f"  {'bulk append':<16} {bulk:>12,.0f} rows/sec  {bulk / reference:5.1f}x{'  TOO SLOW' if bulk_slow else ''}")
+    for label, rate in rates.items():
+        slow = rate < floor
+        if slow:
+            failures.append(label)
+        print(f"  {label:<16} {rate:>12,.0f} rows/sec  {rate / reference:5.1f}x{'  TOO SLOW' if slow else ''}")
+    print(f"\nfloor {floor:,.0f} rows/sec, bulk append floor {reference * args.min_bulk_ratio:,.0f}, search index {'ok' if index_ok else 'MISMATCH'}")
+    
+    if failures or not index_ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Memory report for the in-memory product frame.
+
+Builds a synthetic latest_prices frame shaped like db.get_all_products returns
+it (several competitors per product, object strings, float64 prices, text
+dates), then prints memory_usage(deep=True) per column for:
+
+  original  - compare_prices with object status and per-row message strings
+  compact   - db.compact_products + compare_prices(with_messages=False),
+              which is what data_cache holds
+    
+    python benchmarks/bench_memory.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# make the app modules importable when run from anywhere
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+import db
+import price_compare
+
+from synthetic import generate_rows
+
+def synthetic_products(rows):
+    # as it comes back from sqlite: an id column, object strings, text dates
+    df = generate_rows(rows, competitors_per_product=4)
+    df.insert(0, 'id', np.arange(1, len(df) + 1, dtype=np.int64))
+    return df
+
+def original_frame(df):
+    # what the dashboard used to hold: object status and a message on every row
+    result = price_compare.compare_prices(df)
+    result['status'] = result['status'].astype(object)
+    return result
+
+def compact_frame(df):
+    return price_compare.compare_prices(db.compact_products(df), with_messages=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help="size of the synthetic frame")
+    args = parser.parse_args()
+    
+    df = synthetic_products(args.rows)
+    frames = {'original': original_frame(df), 'compact': compact_frame(df)}
+    
+    usage = pd.DataFrame({
+        label: frame.memory_usage(deep=True, index=False) for label, frame in frames.items()
+    })
+    dtypes = pd.DataFrame({f"{label} dtype": frame.dtypes.astype(str) for label, frame in frames.items()})
+    
+    report = usage.join(dtypes, how='outer')
+    report.loc['total', ['original', 'compact']] = usage.sum()
+    
+    print(f"{args.rows:,} rows, bytes per column (deep)\n")
+    print(report.fillna('-').to_string(float_format=lambda v: f"{v:,.0f}"))
+    
+    original, compact = usage['original'].sum(), usage['compact'].sum()
+    print(f"\noriginal {original / 2**20:,.1f} MiB ({original / args.rows:,.0f} B/row), "
+          f"compact {compact / 2**20:,.1f} MiB ({compact / args.rows:,.0f} B/row), "
+          f"{original / compact:,.1f}x smaller")
+    
+    # the compact frame has to classify exactly like the original one
+    same_status = frames['original']['status'].equals(frames['compact']['status'].astype(object))
+    print(f"status parity: {'ok' if same_status else 'MISMATCH'}")
+    
+    if not same_status:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Timings for the whole pipeline at a few sizes, saved as JSON and optionally
+compared against an earlier run.
+
+For every size a synthetic feed (see synthetic.py) is saved into a fresh
+database in a scratch directory, then each step is timed:
+
+  save_data_to_db, get_all_products, search_products, compare_prices,
+  get_price_change_stats (in pandas and in sql) and log_alert_instead
+
+    python benchmarks/bench_pipeline.py --sizes 10000,100000,1000000 -o before.json
+    python benchmarks/bench_pipeline.py --baseline before.json -o after.json
+    python benchmarks/bench_pipeline.py --compare before.json after.json
+
+A step counts as a regression when it's more than --threshold slower than the
+baseline (and slow enough to measure). Comparing exits 1 if there are any.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+# make the app modules importable when run from anywhere
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+import db
+import email_alert
+import price_compare
+
+from synthetic import generate_rows
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# 20% slower than the baseline counts as a regression
+DEFAULT_THRESHOLD = 0.2
+
+# steps quicker than this are mostly noise, never flag them
+MIN_COMPARABLE_SECONDS = 0.02
+
+def best_of(repeat, func):
+    # fastest of a few runs, the slower ones are the machine doing something else
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def run_size(rows, args, work_dir):
+    df = generate_rows(rows, args.competitors, args.days)
+    
+    db.set_db_path(os.path.join(work_dir, f"bench_{rows}.db"))
+    db.init_db()
+    
+    timings = {}
+    
+    # saving isn't repeatable on the same database, so it's timed once
+    (success, message), timings['save_data_to_db'] = best_of(1, lambda: db.save_data_to_db(df))
+    if not success:
+        raise RuntimeError(message)
+    
+    products, timings['get_all_products'] = best_of(args.repeat, db.get_all_products)
+    _, timings['search_products'] = best_of(args.repeat, lambda: db.search_products("Laptop Model 1"))
+    compared, timings['compare_prices'] = best_of(args.repeat, lambda: price_compare.compare_prices(products))
+    _, timings['get_price_change_stats'] = best_of(args.repeat, lambda: price_compare.get_price_change_stats(compared))
+    _, timings['get_price_stats_sql'] = best_of(args.repeat, db.get_price_stats)
+    
+    alerts = compared[compared['status'] == 'alert']
+    _, timings['log_alert_instead'] = best_of(args.repeat, lambda: email_alert.log_alert_instead(alerts))
+    
+    db.close_connections()
+    
+    return {
+        'rows': len(df),
+        'latest_rows': len(products),
+        'alerts': len(alerts),
+        'seconds': timings,
+    }
+
+def run(args):
+    results = {}
+    
+    # everything the steps write (database, alert logs) goes into a scratch directory
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='marketpulse-bench-') as work_dir:
+        os.chdir(work_dir)
+        try:
+            for rows in args.sizes:
+                result = run_size(rows, args, work_dir)
+                results[str(rows)] = result
+                print_size(rows, result)
+        finally:
+            os.chdir(original_dir)
+    
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.platform(),
+            'cpus': os.cpu_count(),
+            'competitors_per_product': args.competitors,
+            'days': args.days,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+def print_size(rows, result):
+    print(f"\n{rows:,} rows ({result['latest_rows']:,} latest, {result['alerts']:,} alerts)")
+    for step, seconds in result['seconds'].items():
+        rate = result['rows'] / seconds if seconds > 0 else float('inf')
+        print(f"  {step:<24} {seconds:9.3f}s  {rate:>14,.0f} rows/sec")
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Print every step side by side, return the list of regressions
+    """
+    regressions = []
+    
+    print(f"\n{'size':>10}  {'step':<24} {'baseline':>10} {'current':>10} {'change':>8}")
+    for size, result in current['results'].items():
+        before = baseline['results'].get(size)
+        if before is None:
+            continue
+        
+        for step, seconds in result['seconds'].items():
+            old = before['seconds'].get(step)
+            if old is None:
+                continue
+            
+            change = (seconds - old) / old if old > 0 else 0.0
+            flagged = change > threshold and max(old, seconds) >= MIN_COMPARABLE_SECONDS
+            if flagged:
+                regressions.append((size, step, old, seconds))
+            
+            print(f"{int(size):>10,}  {step:<24} {old:9.3f}s {seconds:9.3f}s {change:+7.0%}{'  REGRESSION' if flagged else ''}")
+    
+    return regressions
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=",".join(str(size) for size in DEFAULT_SIZES),
+                        type=lambda value: [int(size) for size in value.split(',')],
+                        help="comma separated row counts")
+    parser.add_argument('--competitors', type=int, default=4, help="competitors per product")
+    parser.add_argument('--days', type=int, default=1, help="days of history per product and competitor")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per read step, the fastest is kept")
+    parser.add_argument('--output', '-o', help="write the results here as json")
+    parser.add_argument('--baseline', help="results json to compare this run against")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="compare two saved runs, nothing is run")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+    
+    if args.compare:
+        baseline, current = (load(path) for path in args.compare)
+    else:
+        baseline = load(args.baseline) if args.baseline else None
+        current = run(args)
+        
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"\nResults written to {args.output}")
+    
+    if baseline is None:
+        return
+    
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Synthetic price feeds for the benchmarks.
+
+Every product is listed by competitors_per_product competitors and has one
+row per competitor per day of history, so a feed has
+products * competitors_per_product * days rows, shaped like an upload.
+"""
+import numpy as np
+import pandas as pd
+
+COMPETITORS = ['TechGiant', 'AudioKing', 'ShopMax', 'BudgetBuy', 'ElectroMart', 'Amazon', 'Flipkart', 'MegaStore']
+
+CATEGORIES = ['Laptop', 'Headphones', 'Smart TV', 'Mouse', 'Keyboard', 'Monitor', 'Tablet', 'Speaker', 'Camera', 'Router']
+
+def generate_products(products=1000, competitors_per_product=4, days=1, start_date='2025-08-01', seed=42):
+    """
+    A products frame with the upload columns. Prices are cent-rounded, with a
+    good share of exact ties like real feeds, and drift a little day to day.
+    """
+    rng = np.random.default_rng(seed)
+    competitors_per_product = min(competitors_per_product, len(COMPETITORS))
+    
+    # product, competitor and day for every row, product-major like an export
+    product = np.repeat(np.arange(products), competitors_per_product * days)
+    competitor_slot = np.tile(np.repeat(np.arange(competitors_per_product), days), products)
+    day = np.tile(np.arange(days), products * competitors_per_product)
+    
+    # each product gets its own set of competitors
+    offsets = rng.integers(0, len(COMPETITORS), products)
+    competitor = (offsets[product] + competitor_slot) % len(COMPETITORS)
+    
+    base_price = np.round(rng.uniform(5, 2000, products), 2)
+    drift = 1 + rng.normal(0, 0.01, (products, days)).cumsum(axis=1)
+    our_price = np.round(base_price[product] * drift[product, day], 2)
+    competitor_price = np.round(our_price * rng.choice([0.9, 0.95, 1.0, 1.05, 1.1], len(product)), 2)
+    
+    dates = pd.date_range(start_date, periods=days).strftime('%Y-%m-%d').to_numpy()
+    names = np.array([f"{CATEGORIES[n % len(CATEGORIES)]} Model {n}" for n in range(products)], dtype=object)
+    ids = np.array([f"P{n:07d}" for n in range(products)], dtype=object)
+    
+    return pd.DataFrame({
+        'product_id': ids[product],
+        'product_name': names[product],
+        'our_price': our_price,
+        'competitor_name': np.array(COMPETITORS, dtype=object)[competitor],
+        'competitor_price': competitor_price,
+        'last_updated': dates[day],
+    })
+
+def generate_rows(rows, competitors_per_product=4, days=1, seed=42):
+    """
+    A feed of (about) rows rows, picking the product count to fit
+    """
+    products = max(rows // (competitors_per_product * days), 1)
+    return generate_products(products, competitors_per_product, days, seed=seed)
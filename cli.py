@@ -0,0 +1,268 @@
+import argparse
+import json
+import sys
+
+# Headless entry point for cron jobs and scripts. Only the data modules are
+# imported, never streamlit or plotly, and the heavier ones are imported by
+# the subcommand that needs them so `marketpulse --help` starts instantly.
+
+EXPORT_FORMATS = ('csv', 'json', 'xlsx')
+
+def cmd_ingest(args):
+    import ingest
+    
+    success, message, reports = ingest.ingest_files(
+        args.files,
+        workers=args.workers,
+        batch_size=args.batch_size or ingest.DEFAULT_BATCH_SIZE
+    )
+    
+    # per-file timings, parse time is how long that file's worker spent on it
+    for report in reports:
+        if report['skipped']:
+            print(f"{report['file']}: skipped, {report['skipped']}")
+            continue
+        
+        status = f"error: {report['error']}" if report['error'] else "ok"
+        print(f"{report['file']}: {report['rows']:,} rows in {report['batches']} batches, parsed in {report['parse_seconds']:.2f}s ({status})")
+    print(message)
+    
+    if not success:
+        return 1
+    
+    if args.check_alerts:
+        return cmd_alerts(args)
+    return 0
+
+def _compared_products(status=None):
+    import db
+    import price_compare
+    
+    df = db.get_all_products()
+    if df.empty:
+        return df
+    
+    df = price_compare.compare_prices(df)
+    if status:
+        df = df[df['status'] == status]
+    
+    return df
+
+def _write_frame(df, output, fmt):
+    if fmt == 'json':
+        text = df.to_json(orient='records', date_format='iso', indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(text)
+        else:
+            print(text)
+    elif fmt == 'xlsx':
+        if not output:
+            raise ValueError("xlsx export needs --output")
+        df.to_excel(output, index=False)
+    else:
+        df.to_csv(output or sys.stdout, index=False)
+
+def cmd_compare(args):
+    df = _compared_products(args.status)
+    
+    if df.empty:
+        print("No products to compare.", file=sys.stderr)
+        return 0
+    
+    # just the headline columns for a terminal, export has the rest
+    columns = ['product_id', 'product_name', 'competitor_name', 'our_price', 'competitor_price', 'status']
+    print(df[columns].head(args.limit).to_string(index=False))
+    
+    if len(df) > args.limit:
+        print(f"... {len(df) - args.limit:,} more rows, use export for all of them", file=sys.stderr)
+    return 0
+
+def cmd_export(args):
+    df = _compared_products(args.status)
+    fmt = args.format or (args.output.rsplit('.', 1)[-1].lower() if args.output and '.' in args.output else 'csv')
+    
+    if fmt not in EXPORT_FORMATS:
+        print(f"Unknown export format: {fmt}", file=sys.stderr)
+        return 2
+    
+    _write_frame(df, args.output, fmt)
+    
+    if args.output:
+        print(f"Exported {len(df):,} rows to {args.output}", file=sys.stderr)
+    return 0
+
+def cmd_stats(args):
+    import db
+    
+    stats = db.get_price_stats(by_competitor=args.by_competitor)
+    
+    if args.json:
+        print(json.dumps(stats, indent=2, default=float))
+        return 0
+    
+    rows = stats.items() if args.by_competitor else [(None, stats)]
+    for competitor, values in rows:
+        if competitor is not None:
+            print(f"[{competitor}]")
+        for key, value in values.items():
+            print(f"{key}: {value:,.2f}" if isinstance(value, float) else f"{key}: {value:,}")
+    
+    print(f"last_updated: {db.get_last_update_date()}")
+    return 0
+
+def cmd_alerts(args):
+    import alert_engine
+    import alert_log
+    
+    events = alert_engine.check_alerts(args.min_diff, args.min_percentage)
+    
+    raised = events[events['event'] != 'resolved']
+    if not args.no_log and not raised.empty:
+        alert_log.log_alerts(raised)
+    
+    if args.json:
+        print(events.to_json(orient='records', indent=2))
+    elif events.empty:
+        print("No new, worsened or resolved price alerts.")
+    else:
+        counts = events['event'].value_counts()
+        print(
+            f"{counts.get('new', 0)} new, {counts.get('worsened', 0)} worsened, "
+            f"{counts.get('resolved', 0)} resolved"
+        )
+        print(events.to_string(index=False))
+    
+    return 0
+
+def cmd_snapshot(args):
+    import snapshot
+    
+    failed = False
+    for table in args.tables:
+        success, message = snapshot.export_snapshot(table, args.directory)
+        print(message)
+        failed = failed or not success
+    
+    return 1 if failed else 0
+
+def _print_retention_report(report):
+    if 'deleted' in report:
+        print(f"as of {report['as_of'] or 'no history yet'}, policy {report['policy']}{' (dry run, nothing changed)' if report['dry_run'] else ''}")
+        for table, rows in report['deleted'].items():
+            print(f"  {table}: {rows:,} rows deleted")
+        print(f"  weekly_prices: {report['weekly_rows_written']:,} rows written")
+        
+        after_seconds = report.get('query_seconds_after', {})
+        for name, before in report.get('query_seconds_before', {}).items():
+            after = after_seconds.get(name)
+            print(f"  {name}: {before * 1000:,.1f}ms -> {f'{after * 1000:,.1f}ms' if after is not None else 'n/a'}")
+        print(f"  freeable: {report['size_after']['free_bytes'] / 2**20:,.1f} MiB")
+    
+    if 'vacuum' in report:
+        vacuum = report['vacuum']
+        print(f"vacuum: {vacuum['size_before']['bytes'] / 2**20:,.1f} MiB -> {vacuum['size_after']['bytes'] / 2**20:,.1f} MiB "
+              f"({vacuum['bytes_reclaimed'] / 2**20:,.1f} MiB reclaimed)")
+
+def cmd_retention(args):
+    import retention
+    
+    policy = (args.raw_days, args.daily_days, args.horizon_days)
+    
+    try:
+        if args.save:
+            saved = retention.get_policy()
+            retention.set_policy(*(given if given is not None else current for given, current in zip(policy, saved)))
+        
+        if args.scheduled:
+            report = retention.run_scheduled(measure=not args.no_measure)
+            if report is None:
+                print("Nothing due.", file=sys.stderr)
+                return 0
+        else:
+            report = retention.apply_retention(*policy, dry_run=args.dry_run, measure=not args.no_measure)
+            if not args.dry_run and not args.no_vacuum:
+                report['vacuum'] = retention.vacuum(full=args.full_vacuum)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_retention_report(report)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='marketpulse', description="MarketPulse price monitoring, without the UI")
+    parser.add_argument('--db', help="database file to use instead of data/price_monitor.db")
+    
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    def add_alert_options(sub):
+        sub.add_argument('--min-diff', type=float, help="alert threshold in dollars (default: the saved one)")
+        sub.add_argument('--min-percentage', type=float, help="alert threshold in percent (default: the saved one)")
+        sub.add_argument('--no-log', action='store_true', help="don't write raised alerts to the alert log")
+        sub.add_argument('--json', action='store_true', help="print alert events as json")
+    
+    ingest_parser = subparsers.add_parser('ingest', help="load CSV / Excel files into the database, parsed in parallel")
+    ingest_parser.add_argument('files', nargs='+')
+    ingest_parser.add_argument('--batch-size', type=int, help="rows per batch (default: ingest.DEFAULT_BATCH_SIZE)")
+    ingest_parser.add_argument('--workers', type=int, help="parser processes (default: one per core, at most one per file)")
+    ingest_parser.add_argument('--check-alerts', action='store_true', help="run the alert check after loading")
+    add_alert_options(ingest_parser)
+    ingest_parser.set_defaults(func=cmd_ingest)
+    
+    compare_parser = subparsers.add_parser('compare', help="print the price comparison")
+    compare_parser.add_argument('--status', choices=['alert', 'good', 'neutral'])
+    compare_parser.add_argument('--limit', type=int, default=50)
+    compare_parser.set_defaults(func=cmd_compare)
+    
+    stats_parser = subparsers.add_parser('stats', help="print the dashboard stats")
+    stats_parser.add_argument('--by-competitor', action='store_true')
+    stats_parser.add_argument('--json', action='store_true')
+    stats_parser.set_defaults(func=cmd_stats)
+    
+    alerts_parser = subparsers.add_parser('alerts', help="check for new / worsened / resolved alerts")
+    add_alert_options(alerts_parser)
+    alerts_parser.set_defaults(func=cmd_alerts)
+    
+    export_parser = subparsers.add_parser('export', help="export the compared products")
+    export_parser.add_argument('--output', '-o', help="file to write, stdout if left out")
+    export_parser.add_argument('--format', choices=EXPORT_FORMATS, help="defaults to the output file's extension")
+    export_parser.add_argument('--status', choices=['alert', 'good', 'neutral'])
+    export_parser.set_defaults(func=cmd_export)
+    
+    snapshot_parser = subparsers.add_parser('snapshot', help="write Arrow / partitioned parquet snapshots (needs pyarrow)")
+    snapshot_parser.add_argument('tables', nargs='*', default=['latest_prices'], help="latest_prices (default) and/or price_history")
+    snapshot_parser.add_argument('--directory', help="default: data/snapshots/<database name>")
+    snapshot_parser.set_defaults(func=cmd_snapshot)
+    
+    retention_parser = subparsers.add_parser('retention', help="downsample and purge old history, then vacuum")
+    retention_parser.add_argument('--raw-days', type=int, help="days of raw price history to keep (default: the saved policy)")
+    retention_parser.add_argument('--daily-days', type=int, help="days of daily rollups to keep before folding them into weeks")
+    retention_parser.add_argument('--horizon-days', type=int, help="days of weekly rollups to keep, 0 keeps them forever")
+    retention_parser.add_argument('--save', action='store_true', help="save the given periods as the policy")
+    retention_parser.add_argument('--dry-run', action='store_true', help="report what would go, change nothing")
+    retention_parser.add_argument('--scheduled', action='store_true', help="for cron: only run what's due, with the saved policy")
+    retention_parser.add_argument('--no-vacuum', action='store_true', help="leave the freed pages in the file")
+    retention_parser.add_argument('--full-vacuum', action='store_true', help="rebuild the whole file instead of an incremental vacuum")
+    retention_parser.add_argument('--no-measure', action='store_true', help="skip timing the history queries before and after")
+    retention_parser.add_argument('--json', action='store_true', help="print the report as json")
+    retention_parser.set_defaults(func=cmd_retention)
+    
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    
+    import db
+    
+    if args.db:
+        db.set_db_path(args.db)
+    db.init_db()
+    
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
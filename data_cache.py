@@ -0,0 +1,279 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import db
+import price_compare
+import snapshot
+
+# how many loaded results we hang on to at once
+MAX_ENTRIES = 8
+
+# (name, generation) -> value, least recently used first
+_lock = threading.Lock()
+_entries = OrderedDict()
+_counters = {'hits': 0, 'misses': 0, 'full_loads': 0, 'delta_refreshes': 0}
+
+def cached(name, loader):
+    """
+    Return loader()'s result for the current database generation, only calling
+    loader when the database has changed since it was last cached.
+    Cached values are shared, so callers must copy before modifying them.
+    """
+    generation = db.get_data_generation()
+    key = (name, generation)
+    
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _counters['hits'] += 1
+            return _entries[key]
+        _counters['misses'] += 1
+    
+    # load outside the lock so one slow query doesn't block every other session
+    value = loader()
+    
+    with _lock:
+        # anything from an older generation is stale now, get rid of it
+        for stale_key in [k for k in _entries if k[1] != generation]:
+            del _entries[stale_key]
+        
+        _entries[key] = value
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    
+    return value
+
+# The compared products and their per-competitor sums, kept current by
+# applying only the pairs whose price_history is newer than the model's
+# high-water mark. A dict that's replaced whole, never changed in place, so a
+# session still holding the previous one isn't pulled out from under.
+_model_lock = threading.Lock()
+_model = None
+
+# once this share of the frame has changed, reloading it all is cheaper than patching
+FULL_RELOAD_RATIO = 0.25
+
+# what _competitor_sums adds up per competitor
+SUM_COLUMNS = ['total', 'competitors_cheaper', 'we_are_cheaper', 'competitor_advantage', 'our_advantage']
+
+def _competitor_sums(df):
+    # counts and summed gaps behind the dashboard stats, one row per competitor.
+    # The counts go by the status compare_prices gave each row, so a sub-cent
+    # gap counts the same here as in the table and in db.get_price_stats
+    if df.empty:
+        return pd.DataFrame(columns=SUM_COLUMNS, dtype=float)
+    
+    status = df['status'].to_numpy(dtype=object)
+    competitor_cheaper = status == 'alert'
+    we_are_cheaper = status == 'good'
+    
+    gap = df['our_price'].to_numpy(dtype=float) - df['competitor_price'].to_numpy(dtype=float)
+    sums = pd.DataFrame({
+        'total': 1,
+        'competitors_cheaper': competitor_cheaper.astype(np.int64),
+        'we_are_cheaper': we_are_cheaper.astype(np.int64),
+        'competitor_advantage': np.where(competitor_cheaper, gap, 0.0),
+        'our_advantage': np.where(we_are_cheaper, -gap, 0.0),
+    }, index=df.index)
+    
+    return sums.groupby(df['competitor_name'].to_numpy(dtype=object)).sum()
+
+def _stats(total, competitors_cheaper, we_are_cheaper, competitor_advantage, our_advantage):
+    return db.stats_from_row(
+        int(total),
+        int(competitors_cheaper),
+        int(we_are_cheaper),
+        competitor_advantage / competitors_cheaper if competitors_cheaper else None,
+        our_advantage / we_are_cheaper if we_are_cheaper else None
+    )
+
+def _load_model(generation):
+    # the high-water mark is read first, rows committed while loading just get applied again next time
+    high_water = db.get_history_high_water()
+    products = price_compare.compare_prices(_load_products(), with_messages=False)
+    
+    # patching looks rows up by id, so keep them in id order
+    if not products.empty and not products['id'].is_monotonic_increasing:
+        products = products.sort_values('id', ignore_index=True)
+    
+    _counters['full_loads'] += 1
+    return {
+        'generation': generation,
+        'high_water': high_water,
+        'products': products,
+        'sums': _competitor_sums(products),
+    }
+
+def _align(products, changed):
+    # give the changed rows the compact frame's dtypes, widening the frame's
+    # where the new rows don't fit (a new category, a price float32 can't hold)
+    products = products.copy()
+    changed = changed.copy()
+    changed['last_updated'] = pd.to_datetime(changed['last_updated'], format='%Y-%m-%d', errors='coerce')
+    
+    for col in ['product_id', 'product_name', 'competitor_name']:
+        if isinstance(products[col].dtype, pd.CategoricalDtype):
+            new_categories = pd.Index(changed[col].unique()).difference(products[col].cat.categories)
+            if len(new_categories):
+                products[col] = products[col].cat.add_categories(new_categories)
+            changed[col] = pd.Categorical(changed[col], categories=products[col].cat.categories)
+    
+    for col in ['id', 'our_price', 'competitor_price']:
+        dtype = products[col].dtype
+        narrow = changed[col].astype(dtype)
+        if np.array_equal(np.round(narrow.to_numpy(dtype=float), 2), np.round(changed[col].to_numpy(dtype=float), 2), equal_nan=True):
+            changed[col] = narrow
+        else:
+            products[col] = products[col].astype(changed[col].dtype)
+    
+    return products, changed
+
+def _apply_changes(model, generation, full_load):
+    high_water, changed = db.get_changed_products(model['high_water'])
+    
+    if changed is None:
+        return _load_model(generation) if full_load else None
+    if changed.empty:
+        return dict(model, generation=generation, high_water=max(high_water, model['high_water']))
+    
+    products = model['products']
+    if products.empty or len(changed) > len(products) * FULL_RELOAD_RATIO:
+        return _load_model(generation) if full_load else None
+    
+    products, changed = _align(products, changed)
+    changed = price_compare.compare_prices(changed, with_messages=False)
+    
+    # pairs already in the frame are overwritten where they are, new pairs go on the end
+    ids = products['id'].to_numpy()
+    positions = np.minimum(np.searchsorted(ids, changed['id'].to_numpy()), len(ids) - 1)
+    found = ids[positions] == changed['id'].to_numpy()
+    positions = positions[found]
+    
+    # the stats move by what the replaced rows had and what their replacements have
+    sums = model['sums'].sub(_competitor_sums(products.iloc[positions]), fill_value=0)
+    sums = sums.add(_competitor_sums(changed), fill_value=0)
+    sums = sums[sums['total'] > 0]
+    
+    updated = changed[found]
+    for col in products.columns:
+        products.iloc[positions, products.columns.get_loc(col)] = updated[col].to_numpy()
+    
+    added = changed[~found]
+    if not added.empty:
+        products = pd.concat([products, added], ignore_index=True)
+    
+    _counters['delta_refreshes'] += 1
+    return {
+        'generation': generation,
+        'high_water': high_water,
+        'products': products,
+        'sums': sums,
+    }
+
+def _current_model(full_load=True):
+    # full_load=False only brings an existing model up to date from the delta,
+    # and gives None where that would mean loading the whole table
+    global _model
+    
+    generation = db.get_data_generation()
+    
+    # one refresh at a time, everyone else waits for it rather than doing the same work
+    with _model_lock:
+        model = _model
+        if model is not None and model['generation'] == generation:
+            with _lock:
+                _counters['hits'] += 1
+            return model
+        
+        # a deleted or swapped database file starts a new epoch, nothing carries over
+        if model is None or model['generation'][0] != generation[0]:
+            if not full_load:
+                return None
+            model = _load_model(generation)
+        else:
+            model = _apply_changes(model, generation, full_load)
+            if model is None:
+                return None
+        
+        with _lock:
+            _counters['misses'] += 1
+        
+        _model = model
+        return model
+
+def get_compared_products():
+    """
+    All products, compacted (see db.compact_products) and run through
+    compare_prices (status only, no messages). After an ingest only the
+    changed pairs are read and classified. The frame is shared, so callers
+    must copy before modifying it.
+    """
+    return _current_model()['products']
+
+def _load_products():
+    # a current Arrow snapshot loads much faster than SELECT * out of sqlite
+    products = snapshot.load_products()
+    if products is None:
+        return db.get_all_products(compact=True)
+    return db.compact_products(products)
+
+def get_price_change_stats():
+    """
+    Dashboard stats (same dict as price_compare.get_price_change_stats).
+    Worked out from the compared products' sums when they're already in
+    memory, otherwise aggregated in SQL, so no rows get loaded just for this.
+    """
+    model = _current_model(full_load=False)
+    if model is None:
+        return cached('price_change_stats', db.get_price_stats)
+    
+    sums = model['sums']
+    return _stats(*(sums[col].sum() for col in SUM_COLUMNS))
+
+def get_competitor_stats():
+    """
+    Dashboard stats per competitor, competitor name -> stats dict. Like
+    get_price_change_stats, from memory when the products are loaded.
+    """
+    model = _current_model(full_load=False)
+    if model is None:
+        return cached('competitor_stats', lambda: db.get_price_stats(by_competitor=True))
+    
+    sums = model['sums'].sort_index()
+    return {name: _stats(*row) for name, row in zip(sums.index, sums[SUM_COLUMNS].itertuples(index=False))}
+
+def get_product_count():
+    """
+    Number of rows in the products table
+    """
+    return cached('product_count', db.count_products)
+
+def cache_info():
+    """
+    Hit/miss counters and what's currently held, for showing in the UI
+    """
+    with _lock:
+        return {
+            'hits': _counters['hits'],
+            'misses': _counters['misses'],
+            'entries': len(_entries) + (_model is not None),
+            'full_loads': _counters['full_loads'],
+            'delta_refreshes': _counters['delta_refreshes'],
+        }
+
+def clear():
+    """
+    Drop everything cached and reset the counters
+    """
+    global _model
+    
+    with _model_lock:
+        _model = None
+    
+    with _lock:
+        _entries.clear()
+        for counter in _counters:
+            _counters[counter] = 0
@@ -1,28 +1,300 @@
 import sqlite3
+import numpy as np
 import pandas as pd
 import os
 import datetime
+import hashlib
+import pathlib
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+import instrumentation
+
+# resolved once by get_db_path, every connection after that reuses it
+_db_path = None
+
+# keep a few idle connections of each kind around instead of reconnecting per call
+MAX_IDLE_CONNECTIONS = 4
+
+# how long a connection waits on another writer's lock before giving up
+BUSY_TIMEOUT_MS = 5000
+
+# idle connections keyed on readonly, plus an epoch so connections opened against
+# a database that's since been deleted or moved get closed instead of reused
+_pool_lock = threading.Lock()
+_idle_connections = {True: [], False: []}
+_pool_epoch = 0
+_pool_pid = os.getpid()
+
+# a connection that never writes, used only to ask sqlite whether anybody else has
+_watcher_lock = threading.Lock()
+_watcher = None
 
 def get_db_path():
-    # create db directory if it doesn't exist
-    db_dir = os.path.join(os.getcwd(), 'data')
+    global _db_path
+    
+    if _db_path is None:
+        # create db directory if it doesn't exist
+        db_dir = os.path.join(os.getcwd(), 'data')
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        
+        # remember the full path to the database file
+        _db_path = os.path.join(db_dir, 'price_monitor.db')
+    
+    return _db_path
+
+def set_db_path(db_path):
+    """
+    Point every db function at a different database file
+    """
+    global _db_path
+    
+    db_dir = os.path.dirname(os.path.abspath(db_path))
     if not os.path.exists(db_dir):
         os.makedirs(db_dir)
     
-    # return the full path to the database file
-    return os.path.join(db_dir, 'price_monitor.db')
+    close_connections()
+    _db_path = os.path.abspath(db_path)
 
-def init_db():
-    # get the database file path
+def get_snapshot_dir():
+    """
+    Where this database's snapshots go by default, snapshots/<database name> next
+    to the file (data/snapshots/price_monitor for the default one)
+    """
+    db_path = get_db_path()
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(os.path.dirname(db_path), 'snapshots', name)
+
+def _open_connection(readonly):
     db_path = get_db_path()
     
+    if readonly:
+        # read-only connections can't take the write lock by accident
+        conn = sqlite3.connect(f"{pathlib.Path(db_path).as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        
+        # WAL lets readers keep going while somebody writes
+        conn.execute("PRAGMA journal_mode=WAL")
+    
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+def _reset_pool_after_fork():
+    global _pool_pid
+    
+    # connections can't cross a fork, a child process starts with an empty pool
+    if os.getpid() != _pool_pid:
+        _idle_connections[True] = []
+        _idle_connections[False] = []
+        _pool_pid = os.getpid()
+
+@contextmanager
+def connection(readonly=False):
+    """
+    Borrow a pooled connection for a block of work:
+    
+        with db.connection(readonly=True) as conn:
+            df = db.get_all_products(conn)
+            last_update = db.get_last_update_date(conn)
+    
+    Any transaction left open when the block ends is rolled back, so writers
+    have to commit themselves.
+    """
+    with _pool_lock:
+        _reset_pool_after_fork()
+        idle = _idle_connections[readonly]
+        conn = idle.pop() if idle else None
+        epoch = _pool_epoch
+    
+    if conn is None:
+        conn = _open_connection(readonly)
+    
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        
+        with _pool_lock:
+            idle = _idle_connections[readonly]
+            if epoch == _pool_epoch and len(idle) < MAX_IDLE_CONNECTIONS:
+                idle.append(conn)
+                conn = None
+        
+        if conn is not None:
+            conn.close()
+
+def _use_connection(conn, readonly=False):
+    # run on the caller's connection if they passed one, otherwise borrow our own
+    if conn is not None:
+        return nullcontext(conn)
+    return connection(readonly=readonly)
+
+def close_connections():
+    """
+    Close every idle pooled connection; ones in use get closed when they're returned
+    """
+    global _pool_epoch
+    
+    with _pool_lock:
+        _reset_pool_after_fork()
+        _pool_epoch += 1
+        idle = _idle_connections[True] + _idle_connections[False]
+        _idle_connections[True] = []
+        _idle_connections[False] = []
+    
+    for conn in idle:
+        conn.close()
+    
+    _close_watcher()
+
+def _close_watcher():
+    global _watcher
+    
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.close()
+            _watcher = None
+
+@instrumentation.instrumented
+def get_data_generation():
+    """
+    A token that changes whenever anything commits to the database, from this
+    process or any other, or the database file gets deleted or swapped out.
+    Cheap enough to call on every page render.
+    """
+    global _watcher
+    
+    with _pool_lock:
+        epoch = _pool_epoch
+    
+    with _watcher_lock:
+        try:
+            if _watcher is None:
+                _watcher = _open_connection(readonly=True)
+            
+            # data_version moves every time another connection commits
+            data_version = _watcher.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            # no database file yet, nothing to version
+            data_version = None
+    
+    return (epoch, data_version)
+
+@instrumentation.instrumented
+def init_db():
     # gonna connect to the database now
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        # lets retention hand freed pages back a few at a time. Switching needs a
+        # VACUUM, instant while the file is still empty; older files get switched
+        # by retention's first VACUUM
+        if not cursor.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cursor.execute("VACUUM")
+        
+        # keep track of which migrations this file already has
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at TEXT NOT NULL
+        )
+        ''')
+        
+        # the original products table is where every migration starts from,
+        # later versions rename it so only make it on a fresh database
+        if get_schema_version(conn) == 0:
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                our_price REAL NOT NULL,
+                competitor_name TEXT NOT NULL,
+                competitor_price REAL NOT NULL,
+                last_updated DATE NOT NULL
+            )
+            ''')
+        
+        # save our work
+        conn.commit()
+        
+        # bring older databases up to date in place
+        migrate_db(conn)
+        
+        # tells this file apart from one that replaced it at the same path
+        if get_meta(DATABASE_ID_KEY, conn=conn) is None:
+            set_meta(DATABASE_ID_KEY, uuid.uuid4().hex, conn=conn)
+            conn.commit()
     
-    # make a table if we don't have one already
+    return True
+
+def _migration_1_indexes(cursor):
+    # positive gap means the competitor is cheaper, negative means we are.
+    # ALTER TABLE can only add VIRTUAL generated columns, but the index below
+    # stores the computed value so range scans on it never touch the table
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS products (
+    ALTER TABLE products ADD COLUMN price_gap REAL
+    GENERATED ALWAYS AS (our_price - competitor_price) VIRTUAL
+    ''')
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_product_id ON products (product_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_competitor_name ON products (competitor_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_last_updated ON products (last_updated)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_price_gap ON products (price_gap)")
+
+def _migration_2_fts(cursor):
+    # external content table, the text lives in products and fts only keeps the index
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            product_name,
+            competitor_name,
+            content='products',
+            content_rowid='id'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # some sqlite builds ship without fts5, search falls back to LIKE there
+        print(f"FTS5 unavailable, search will use LIKE: {str(e)}")
+        return
+    
+    # keep the index in step with every write to products
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, product_name, competitor_name)
+        VALUES (new.id, new.product_name, new.competitor_name);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, product_name, competitor_name)
+        VALUES ('delete', old.id, old.product_name, old.competitor_name);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF product_name, competitor_name ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, product_name, competitor_name)
+        VALUES ('delete', old.id, old.product_name, old.competitor_name);
+        INSERT INTO products_fts (rowid, product_name, competitor_name)
+        VALUES (new.id, new.product_name, new.competitor_name);
+    END
+    ''')
+    
+    # index whatever was already in the table
+    cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+def _migration_3_latest_and_history(cursor):
+    # every row ever uploaded goes to an append-only history table
+    cursor.execute('''
+    CREATE TABLE price_history (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         product_id TEXT NOT NULL,
         product_name TEXT NOT NULL,
@@ -32,42 +304,483 @@ def init_db():
         last_updated DATE NOT NULL
     )
     ''')
+    cursor.execute('''
+    INSERT INTO price_history (product_id, product_name, our_price, competitor_name, competitor_price, last_updated)
+    SELECT product_id, product_name, our_price, competitor_name, competitor_price, last_updated
+    FROM products ORDER BY id
+    ''')
+    cursor.execute("CREATE INDEX idx_price_history_key ON price_history (product_id, competitor_name, last_updated)")
+    cursor.execute("CREATE INDEX idx_price_history_last_updated ON price_history (last_updated)")
     
-    # save our work and close up shop
-    conn.commit()
-    conn.close()
+    # fts points at products by name, so take it down before the rename
+    cursor.execute("DROP TRIGGER IF EXISTS products_fts_insert")
+    cursor.execute("DROP TRIGGER IF EXISTS products_fts_delete")
+    cursor.execute("DROP TRIGGER IF EXISTS products_fts_update")
+    cursor.execute("DROP TABLE IF EXISTS products_fts")
     
-    return True
+    # products becomes the compact one-row-per-pair table the dashboard reads
+    cursor.execute("ALTER TABLE products RENAME TO latest_prices")
+    for name in ['product_id', 'competitor_name', 'last_updated', 'price_gap']:
+        cursor.execute(f"DROP INDEX IF EXISTS idx_products_{name}")
+        cursor.execute(f"CREATE INDEX idx_latest_prices_{name} ON latest_prices ({name})")
     
-    # create metadata object
-    metadata = MetaData()
-    
-    # define our products table - nothing fancy here
-    products = Table(
-        'products',
-        metadata,
-        Column('id', Integer, primary_key=True),
-        Column('product_id', String, nullable=False),
-        Column('product_name', String, nullable=False),
-        Column('our_price', Float, nullable=False),
-        Column('competitor_name', String, nullable=False),
-        Column('competitor_price', Float, nullable=False),
-        Column('last_updated', Date, nullable=False),
+    # keep only the newest row per product/competitor pair
+    cursor.execute('''
+    DELETE FROM latest_prices WHERE id NOT IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY product_id, competitor_name
+                ORDER BY last_updated DESC, id DESC
+            ) AS row_number
+            FROM latest_prices
+        )
+        WHERE row_number = 1
     )
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX idx_latest_prices_key ON latest_prices (product_id, competitor_name)")
     
-    # create the tables if they don't exist yet
-    metadata.create_all(engine)
-    return engine
+    _create_latest_prices_fts(cursor)
+
+# Keep latest_prices_fts in step with single-row edits. Bulk loads take these two
+# down for their transaction and index a chunk at a time instead, see _pause_fts_triggers.
+# Upserts rewrite product_name on every price change, only reindex when a name really changed
+LATEST_PRICES_FTS_TRIGGERS = {
+    'latest_prices_fts_insert': '''
+    CREATE TRIGGER IF NOT EXISTS latest_prices_fts_insert AFTER INSERT ON latest_prices BEGIN
+        INSERT INTO latest_prices_fts (rowid, product_name, competitor_name)
+        VALUES (new.id, new.product_name, new.competitor_name);
+    END
+    ''',
+    'latest_prices_fts_update': '''
+    CREATE TRIGGER IF NOT EXISTS latest_prices_fts_update AFTER UPDATE OF product_name, competitor_name ON latest_prices
+    WHEN old.product_name IS NOT new.product_name OR old.competitor_name IS NOT new.competitor_name
+    BEGIN
+        INSERT INTO latest_prices_fts (latest_prices_fts, rowid, product_name, competitor_name)
+        VALUES ('delete', old.id, old.product_name, old.competitor_name);
+        INSERT INTO latest_prices_fts (rowid, product_name, competitor_name)
+        VALUES (new.id, new.product_name, new.competitor_name);
+    END
+    ''',
+}
 
-def save_data_to_db(df):
-    # gotta fix the dates so they look nice
-    df['last_updated'] = pd.to_datetime(df['last_updated']).dt.date
+def _create_latest_prices_fts(cursor):
+    # same setup as products_fts had, pointed at latest_prices
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS latest_prices_fts USING fts5(
+            product_name,
+            competitor_name,
+            content='latest_prices',
+            content_rowid='id'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 unavailable, search will use LIKE: {str(e)}")
+        return
     
-    # better check if we got all the stuff we need
-    required_fields = ['product_id', 'product_name', 'our_price', 'competitor_name', 
-                      'competitor_price', 'last_updated']
+    for trigger in LATEST_PRICES_FTS_TRIGGERS.values():
+        cursor.execute(trigger)
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS latest_prices_fts_delete AFTER DELETE ON latest_prices BEGIN
+        INSERT INTO latest_prices_fts (latest_prices_fts, rowid, product_name, competitor_name)
+        VALUES ('delete', old.id, old.product_name, old.competitor_name);
+    END
+    ''')
+    
+    cursor.execute("INSERT INTO latest_prices_fts (latest_prices_fts) VALUES ('rebuild')")
+
+def _migration_4_alert_state(cursor):
+    # small key/value store for things like high-water marks and settings
+    cursor.execute('''
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
     
-    for field in required_fields:
+    # the last alert we raised for each product/competitor pair that's still alerting
+    cursor.execute('''
+    CREATE TABLE alert_state (
+        product_id TEXT NOT NULL,
+        competitor_name TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        our_price REAL NOT NULL,
+        competitor_price REAL NOT NULL,
+        price_diff REAL NOT NULL,
+        percentage REAL NOT NULL,
+        alerted_at TEXT NOT NULL,
+        PRIMARY KEY (product_id, competitor_name)
+    )
+    ''')
+
+def _migration_5_daily_rollups(cursor):
+    # one row per pair per day, the last price seen that day plus the day's range.
+    # Trend queries read this instead of every uploaded row
+    cursor.execute('''
+    CREATE TABLE daily_prices (
+        product_id TEXT NOT NULL,
+        competitor_name TEXT NOT NULL,
+        day DATE NOT NULL,
+        our_price REAL NOT NULL,
+        competitor_price REAL NOT NULL,
+        min_competitor_price REAL NOT NULL,
+        max_competitor_price REAL NOT NULL,
+        observations INTEGER NOT NULL,
+        PRIMARY KEY (product_id, competitor_name, day)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX idx_daily_prices_day ON daily_prices (day)")
+    
+    # and one row per competitor per day on top of that, for the overview charts
+    cursor.execute('''
+    CREATE TABLE daily_competitor_stats (
+        day DATE NOT NULL,
+        competitor_name TEXT NOT NULL,
+        products INTEGER NOT NULL,
+        competitors_cheaper INTEGER NOT NULL,
+        we_are_cheaper INTEGER NOT NULL,
+        avg_our_price REAL NOT NULL,
+        avg_competitor_price REAL NOT NULL,
+        avg_gap_percentage REAL NOT NULL,
+        PRIMARY KEY (day, competitor_name)
+    ) WITHOUT ROWID
+    ''')
+    
+    _rebuild_daily_rollups(cursor)
+
+def _rebuild_daily_rollups(cursor):
+    # both rollups from scratch out of price_history, for migrations and anything that rewrites history
+    cursor.execute("DELETE FROM daily_prices")
+    cursor.execute('''
+    INSERT INTO daily_prices
+    SELECT product_id, competitor_name, day, our_price, competitor_price,
+           min_competitor_price, max_competitor_price, observations
+    FROM (
+        SELECT product_id, competitor_name, last_updated AS day, our_price, competitor_price,
+               MIN(competitor_price) OVER pair_day AS min_competitor_price,
+               MAX(competitor_price) OVER pair_day AS max_competitor_price,
+               COUNT(*) OVER pair_day AS observations,
+               ROW_NUMBER() OVER (PARTITION BY product_id, competitor_name, last_updated ORDER BY id DESC) AS row_number
+        FROM price_history
+        WINDOW pair_day AS (PARTITION BY product_id, competitor_name, last_updated)
+    )
+    WHERE row_number = 1
+    ''')
+    
+    cursor.execute("DELETE FROM daily_competitor_stats")
+    cursor.execute(f"INSERT INTO daily_competitor_stats {DAILY_COMPETITOR_STATS_SELECT} GROUP BY day, competitor_name")
+
+# daily_competitor_stats rows, from daily_prices (add a WHERE before the GROUP BY to limit the days)
+DAILY_COMPETITOR_STATS_SELECT = '''
+SELECT day, competitor_name,
+       COUNT(*),
+       SUM(CASE WHEN competitor_price < our_price THEN 1 ELSE 0 END),
+       SUM(CASE WHEN our_price < competitor_price THEN 1 ELSE 0 END),
+       AVG(our_price),
+       AVG(competitor_price),
+       AVG(CASE WHEN our_price > 0 THEN (our_price - competitor_price) / our_price * 100 ELSE 0 END)
+FROM daily_prices
+'''
+
+def _refresh_daily_competitor_stats(cursor):
+    # recompute only the days in temp.touched_days, the rest of the rollup stays as it was
+    touched = "WHERE day IN (SELECT day FROM temp.touched_days)"
+    cursor.execute(f"DELETE FROM daily_competitor_stats {touched}")
+    cursor.execute(f"INSERT INTO daily_competitor_stats {DAILY_COMPETITOR_STATS_SELECT} {touched} GROUP BY day, competitor_name")
+
+def _migration_6_product_summary(cursor):
+    # one row per product summarising its competitors, for the price matrix
+    cursor.execute('''
+    CREATE TABLE product_summary (
+        product_id TEXT PRIMARY KEY,
+        product_name TEXT NOT NULL,
+        our_price REAL NOT NULL,
+        competitors INTEGER NOT NULL,
+        min_competitor_price REAL NOT NULL,
+        median_competitor_price REAL NOT NULL,
+        max_competitor_price REAL NOT NULL,
+        cheapest_competitor TEXT NOT NULL,
+        gap_to_cheapest REAL NOT NULL,
+        our_rank INTEGER NOT NULL,
+        last_updated DATE NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX idx_product_summary_our_rank ON product_summary (our_rank)")
+    cursor.execute("CREATE INDEX idx_product_summary_gap_to_cheapest ON product_summary (gap_to_cheapest)")
+    
+    _refresh_product_summary(cursor)
+
+# product_summary rows out of temp.summary_pairs (see _refresh_product_summary), which
+# holds the summarised pairs sorted by product, competitor price and competitor name.
+# A product's pairs are the positions first_position .. first_position + competitors - 1,
+# cheapest first, so the cheapest competitor and the median (the middle price, or the
+# mean of the middle two) are lookups by position. Our price / name come from the pair
+# updated most recently, and our_rank is 1 when nobody undercuts us
+PRODUCT_SUMMARY_SELECT = '''
+WITH grouped AS (
+    SELECT product_id,
+           MIN(position) AS first_position,
+           COUNT(*) AS competitors,
+           MAX(competitor_price) AS max_competitor_price,
+           MAX(last_updated) AS last_updated
+    FROM temp.summary_pairs
+    GROUP BY product_id
+),
+products AS (
+    SELECT grouped.*,
+           (SELECT MAX(latest_id) FROM temp.summary_pairs AS same_day
+            WHERE same_day.position BETWEEN first_position AND first_position + competitors - 1
+              AND same_day.last_updated = grouped.last_updated) AS newest_id
+    FROM grouped
+)
+SELECT products.product_id,
+       newest.product_name,
+       newest.our_price,
+       competitors,
+       cheapest.competitor_price,
+       (SELECT AVG(competitor_price) FROM temp.summary_pairs AS middle
+        WHERE middle.position IN (first_position + (competitors - 1) / 2, first_position + competitors / 2)),
+       max_competitor_price,
+       cheapest.competitor_name,
+       newest.our_price - cheapest.competitor_price,
+       1 + (SELECT COUNT(*) FROM temp.summary_pairs AS cheaper
+            WHERE cheaper.position BETWEEN first_position AND first_position + competitors - 1
+              AND cheaper.competitor_price < newest.our_price),
+       products.last_updated
+FROM products
+JOIN temp.summary_pairs AS cheapest ON cheapest.position = first_position
+JOIN latest_prices AS newest ON newest.id = newest_id
+'''
+
+def _refresh_product_summary(cursor, touched_only=False):
+    # the products in temp.touched_products (see _create_load_tables) with touched_only,
+    # otherwise the whole summary is rebuilt. Their pairs are copied out in order
+    # once, one sort instead of a lookup and sort per product and statistic
+    touched = "WHERE product_id IN (SELECT product_id FROM temp.touched_products)" if touched_only else ""
+    
+    cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS summary_pairs (
+        position INTEGER PRIMARY KEY,
+        product_id TEXT,
+        competitor_name TEXT,
+        competitor_price REAL,
+        last_updated DATE,
+        latest_id INTEGER
+    )
+    ''')
+    cursor.execute("DELETE FROM temp.summary_pairs")
+    cursor.execute(f'''
+    INSERT INTO temp.summary_pairs (product_id, competitor_name, competitor_price, last_updated, latest_id)
+    SELECT product_id, competitor_name, competitor_price, last_updated, id FROM latest_prices
+    {touched}
+    ORDER BY product_id, competitor_price, competitor_name
+    ''')
+    
+    cursor.execute(f"DELETE FROM product_summary {touched}")
+    cursor.execute(f"INSERT INTO product_summary {PRODUCT_SUMMARY_SELECT}")
+    cursor.execute("DELETE FROM temp.summary_pairs")
+
+def _migration_7_ingest_ledger(cursor):
+    # every file and batch that's been loaded, by content hash, so a repeat can be skipped
+    cursor.execute('''
+    CREATE TABLE ingest_ledger (
+        hash BLOB PRIMARY KEY,
+        kind TEXT NOT NULL,
+        source TEXT,
+        rows INTEGER,
+        new_rows INTEGER,
+        ingested_at TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    
+    # history rows get a hash of their values, the unique index turns repeats into no-ops
+    cursor.execute("ALTER TABLE price_history ADD COLUMN row_hash BLOB")
+    cursor.connection.create_function('row_hash', len(REQUIRED_COLUMNS), lambda *values: _row_hash(values), deterministic=True)
+    cursor.execute(f"UPDATE price_history SET row_hash = row_hash({', '.join(REQUIRED_COLUMNS)})")
+    
+    # whatever got loaded twice before now goes, keeping the first copy
+    cursor.execute('''
+    DELETE FROM price_history
+    WHERE id NOT IN (SELECT MIN(id) FROM price_history GROUP BY row_hash)
+    ''')
+    if cursor.rowcount > 0:
+        _rebuild_daily_rollups(cursor)
+    
+    cursor.execute("CREATE UNIQUE INDEX idx_price_history_row_hash ON price_history (row_hash)")
+
+def _migration_8_weekly_rollups(cursor):
+    # daily_prices older than the retention policy keeps get folded into weeks
+    # (starting on monday): the last prices of the week plus its range
+    cursor.execute('''
+    CREATE TABLE weekly_prices (
+        product_id TEXT NOT NULL,
+        competitor_name TEXT NOT NULL,
+        week DATE NOT NULL,
+        last_day DATE NOT NULL,
+        our_price REAL NOT NULL,
+        competitor_price REAL NOT NULL,
+        min_competitor_price REAL NOT NULL,
+        max_competitor_price REAL NOT NULL,
+        observations INTEGER NOT NULL,
+        PRIMARY KEY (product_id, competitor_name, week)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX idx_weekly_prices_week ON weekly_prices (week)")
+
+def _migration_9_drop_redundant_index(cursor):
+    # idx_latest_prices_key starts with product_id and serves the same lookups,
+    # this one only made every upsert maintain a fifth index
+    cursor.execute("DROP INDEX IF EXISTS idx_latest_prices_product_id")
+
+def _migration_10_vectorised_row_hashes(cursor):
+    # loads hash a whole chunk at once now (_row_hashes), rehash the history
+    # migration 7 hashed a row at a time so repeats still match
+    cursor.execute("DROP INDEX IF EXISTS idx_price_history_row_hash")
+    
+    conn = cursor.connection
+    last_id = 0
+    while True:
+        chunk = pd.read_sql_query(
+            f"SELECT id, {', '.join(REQUIRED_COLUMNS)} FROM price_history WHERE id > ? ORDER BY id LIMIT ?",
+            conn,
+            params=(last_id, DEFAULT_CHUNK_SIZE)
+        )
+        if chunk.empty:
+            break
+        
+        cursor.executemany("UPDATE price_history SET row_hash = ? WHERE id = ?", zip(_row_hashes(chunk), chunk['id'].tolist()))
+        last_id = int(chunk['id'].iloc[-1])
+    
+    cursor.execute("CREATE UNIQUE INDEX idx_price_history_row_hash ON price_history (row_hash)")
+
+def _migration_11_covering_day_index(cursor):
+    # the daily_competitor_stats refresh reads only these columns of a day's rows,
+    # so with them in the index it never goes back to the table
+    cursor.execute("DROP INDEX IF EXISTS idx_daily_prices_day")
+    cursor.execute("CREATE INDEX idx_daily_prices_day ON daily_prices (day, competitor_name, our_price, competitor_price)")
+
+# (version, migration) pairs, applied in order to any database that's behind.
+# only ever append to this list, never edit a migration that has shipped
+MIGRATIONS = [
+    (1, _migration_1_indexes),
+    (2, _migration_2_fts),
+    (3, _migration_3_latest_and_history),
+    (4, _migration_4_alert_state),
+    (5, _migration_5_daily_rollups),
+    (6, _migration_6_product_summary),
+    (7, _migration_7_ingest_ledger),
+    (8, _migration_8_weekly_rollups),
+    (9, _migration_9_drop_redundant_index),
+    (10, _migration_10_vectorised_row_hashes),
+    (11, _migration_11_covering_day_index),
+]
+
+def get_schema_version(conn):
+    """
+    Highest migration version applied to this database, 0 for a fresh one
+    """
+    result = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return result[0] or 0
+
+@instrumentation.instrumented
+def migrate_db(conn):
+    """
+    Apply any migrations newer than the database's schema version.
+    Each one runs in its own transaction together with its version row.
+    """
+    current_version = get_schema_version(conn)
+    
+    for version, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (version, datetime.datetime.now().isoformat(timespec='seconds'))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    return get_schema_version(conn)
+
+@instrumentation.instrumented
+def get_meta(key, default=None, conn=None):
+    """
+    Read a value from the meta key/value table
+    """
+    with _use_connection(conn, readonly=True) as conn:
+        result = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    
+    return result[0] if result else default
+
+def get_database_id(conn=None):
+    """
+    The random id init_db gave this database file, None before init_db
+    """
+    try:
+        return get_meta(DATABASE_ID_KEY, conn=conn)
+    except sqlite3.OperationalError:
+        # no meta table yet
+        return None
+
+@instrumentation.instrumented
+def set_meta(key, value, conn=None):
+    """
+    Write a value to the meta key/value table. On a borrowed connection this
+    commits; on the caller's connection it's left to the caller's transaction.
+    """
+    with _use_connection(conn) as write_conn:
+        write_conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+        if conn is None:
+            write_conn.commit()
+
+# columns every upload has to have, in the order we insert them
+REQUIRED_COLUMNS = ['product_id', 'product_name', 'our_price', 'competitor_name',
+                    'competitor_price', 'last_updated']
+
+PRICE_COLUMNS = ('our_price', 'competitor_price')
+
+# siphash keys (16 bytes each) for the two halves of a row hash. Changing them
+# changes every hash, so they need a migration like 10 to rehash history
+ROW_HASH_KEYS = ('marketpulse-row0', 'marketpulse-row1')
+
+# what the read helpers select, so generated columns don't leak into the frames
+PRODUCT_COLUMNS = ['id'] + REQUIRED_COLUMNS
+PRODUCT_SELECT = ", ".join(PRODUCT_COLUMNS)
+
+# how many rows we hand to executemany at a time
+DEFAULT_CHUNK_SIZE = 50000
+
+# meta key for the id init_db gives every new database
+DATABASE_ID_KEY = 'database_id'
+
+# meta key retention keeps the day price_history was pruned back to. Rows older
+# than that lost their row_hash with the prune, and their days are already in
+# the rollups, so a load drops them instead of counting them twice
+PRUNED_BEFORE_KEY = 'retention.pruned_before'
+
+# compact_products makes a string column categorical when at most this share of it is distinct
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# negative number means KiB for sqlite, so this is ~64MB of page cache
+BULK_CACHE_SIZE_KIB = 64000
+
+@instrumentation.instrumented(rows=lambda result, args, kwargs: len(args[0] if args else kwargs['df']))
+def validate_products(df):
+    """
+    Check a products frame has the required columns and no negative prices
+    """
+    # better check if we got all the stuff we need
+    for field in REQUIRED_COLUMNS:
         if field not in df.columns:
             return False, f"Missing required field: {field}"
     
@@ -75,137 +788,769 @@ def save_data_to_db(df):
     if (df['our_price'] < 0).any() or (df['competitor_price'] < 0).any():
         return False, "Negative prices are not allowed"
     
+    return True, ""
+
+def _row_hash(values):
+    # what migration 7 hashed rows with, one at a time. Migration 10 replaced
+    # these hashes with _row_hashes
+    product_id, product_name, our_price, competitor_name, competitor_price, last_updated = values
+    key = "\x1f".join((
+        str(product_id), str(product_name), repr(float(our_price)),
+        str(competitor_name), repr(float(competitor_price)), str(last_updated)
+    ))
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+def _batch_hash(records):
+    # a batch is identified by its rows' hashes in order
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        digest.update(record[-1])
+    return digest.digest()
+
+def _row_hashes(frame):
+    # 16 byte hash of every row of a REQUIRED_COLUMNS frame, in one pass over the
+    # columns: two 64-bit halves from pandas' keyed siphash. Prices go through float
+    # and the rest through str, so a row hashes the same whether it comes from a
+    # feed or back out of sqlite
+    normalised = pd.DataFrame({
+        column: frame[column].astype('float64') if column in PRICE_COLUMNS else frame[column].astype(str)
+        for column in REQUIRED_COLUMNS
+    })
+    halves = np.empty((len(normalised), 2), dtype='<u8')
+    for half, key in enumerate(ROW_HASH_KEYS):
+        halves[:, half] = pd.util.hash_pandas_object(normalised, index=False, hash_key=key).to_numpy()
+    
+    packed = halves.tobytes()
+    return [packed[start:start + 16] for start in range(0, len(packed), 16)]
+
+def _iter_record_chunks(df, chunk_size):
+    # hand back plain python tuples a slice at a time so we never build
+    # a second full copy of the frame just to insert it
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size][REQUIRED_COLUMNS].copy()
+        
+        # gotta fix the dates so they look nice. numpy formats a day as YYYY-MM-DD
+        # a lot faster than strftime; a missing date stays missing for NOT NULL to catch
+        dates = pd.to_datetime(chunk['last_updated'])
+        chunk['last_updated'] = dates.to_numpy().astype('datetime64[D]').astype(str)
+        chunk.loc[dates.isna().to_numpy(), 'last_updated'] = None
+        
+        # object dtype turns numpy scalars into python ones sqlite can bind,
+        # and each row carries its hash last for the duplicate check
+        columns = [chunk[column].astype(object).tolist() for column in REQUIRED_COLUMNS]
+        yield list(zip(*columns, _row_hashes(chunk)))
+
+@contextmanager
+def _bulk_pragmas(conn):
+    # the writer connection is pooled, so remember what it had and put it back after
+    previous_synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    previous_cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    
+    # NORMAL sync is safe with WAL, and a bigger cache keeps the indexes in memory
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{BULK_CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    
     try:
-        # where we storing this stuff?
-        db_path = get_db_path()
+        yield conn
+    finally:
+        # an exception can get here mid-load, don't leave the transaction hanging
+        if conn.in_transaction:
+            conn.rollback()
         
-        # open the door to the database
-        conn = sqlite3.connect(db_path)
+        conn.execute(f"PRAGMA synchronous={previous_synchronous}")
+        conn.execute(f"PRAGMA cache_size={previous_cache_size}")
+        conn.execute("PRAGMA temp_store=DEFAULT")
+
+@instrumentation.instrumented(rows=lambda result, args, kwargs: len(args[0] if args else kwargs['df']))
+def save_data_to_db(df, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Validate a products frame and bulk insert it in one transaction.
+    Rows go in chunk_size at a time through executemany.
+    """
+    return save_batches_to_db([df], chunk_size=chunk_size)
+
+class InvalidProductsError(ValueError):
+    """
+    A batch failed validate_products, the message says why
+    """
+
+@instrumentation.instrumented(rows=lambda result, args, kwargs: sum(len(records) for records in result))
+def prepare_records(df, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Validate a products frame and turn it into insert-ready record chunks, each
+    row ending in its hash. Pure python work with no database access, so it can
+    run in another process.
+    """
+    valid, message = validate_products(df)
+    if not valid:
+        raise InvalidProductsError(message)
+    
+    return list(_iter_record_chunks(df, chunk_size))
+
+def _validated_record_chunks(batches, chunk_size):
+    for batch_number, df in enumerate(batches, start=1):
+        valid, message = validate_products(df)
+        if not valid:
+            if batch_number > 1:
+                message = f"{message} (batch {batch_number}, nothing was saved)"
+            raise InvalidProductsError(message)
         
-        # put all the data in one by one
-        for _, row in df.iterrows():
+        yield from _iter_record_chunks(df, chunk_size)
+
+@instrumentation.instrumented
+def save_batches_to_db(batches, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, files=None, result=None):
+    """
+    Stream an iterable of products frames into the database.
+    Every batch is validated and written as soon as it arrives, all inside one
+    transaction, so a bad batch rolls the whole load back. progress is called
+    with the running row count after each executemany chunk. files and result
+    are passed on to save_records_to_db.
+    """
+    return save_records_to_db(_validated_record_chunks(batches, chunk_size), progress=progress, files=files, result=result)
+
+def _create_load_tables(cursor):
+    # temp tables a load works through, on this connection only. Every chunk is
+    # staged once and each table gets it in one INSERT ... SELECT instead of
+    # binding every row again
+    cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS staged_rows (
+        seq INTEGER PRIMARY KEY,
+        product_id TEXT,
+        product_name TEXT,
+        our_price REAL,
+        competitor_name TEXT,
+        competitor_price REAL,
+        last_updated DATE,
+        row_hash BLOB
+    )
+    ''')
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS touched_products (product_id TEXT PRIMARY KEY)")
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS touched_days (day DATE PRIMARY KEY)")
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS renamed_pairs (id INTEGER PRIMARY KEY, product_name TEXT, competitor_name TEXT)")
+    
+    for table in ('staged_rows', 'touched_products', 'touched_days', 'renamed_pairs'):
+        cursor.execute(f"DELETE FROM temp.{table}")
+
+def _stage_chunk(cursor, records):
+    cursor.execute("DELETE FROM temp.staged_rows")
+    cursor.executemany('''
+    INSERT INTO temp.staged_rows (product_id, product_name, our_price, competitor_name, competitor_price, last_updated, row_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', records)
+
+def _drop_repeated_rows(cursor, last_id):
+    # keep the staged rows INSERT OR IGNORE actually added, the ones whose hash is
+    # past the old high-water mark; a repeat inside the chunk only counts the first time
+    cursor.execute('''
+    DELETE FROM temp.staged_rows WHERE seq NOT IN (
+        SELECT MIN(staged_rows.seq) FROM temp.staged_rows
+        JOIN price_history ON price_history.row_hash = staged_rows.row_hash
+        WHERE price_history.id > ?
+        GROUP BY staged_rows.row_hash
+    )
+    ''', (last_id,))
+
+def _pause_fts_triggers(cursor):
+    # the per-row fts triggers cost a bulk upsert several times its own time, so a
+    # load drops them inside its transaction and puts them back before committing;
+    # other connections only ever see them in place
+    for name in LATEST_PRICES_FTS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+def _resume_fts_triggers(cursor):
+    for trigger in LATEST_PRICES_FTS_TRIGGERS.values():
+        cursor.execute(trigger)
+
+def _stage_fts_renames(cursor):
+    # pairs already in latest_prices under a different name than a staged row has,
+    # with the name the index knows them by. The upsert decides which really change
+    cursor.execute("DELETE FROM temp.renamed_pairs")
+    cursor.execute('''
+    INSERT OR IGNORE INTO temp.renamed_pairs (id, product_name, competitor_name)
+    SELECT latest_prices.id, latest_prices.product_name, latest_prices.competitor_name
+    FROM temp.staged_rows
+    JOIN latest_prices
+      ON latest_prices.product_id = staged_rows.product_id
+     AND latest_prices.competitor_name = staged_rows.competitor_name
+    WHERE latest_prices.product_name IS NOT staged_rows.product_name
+    ''')
+
+def _index_fts_chunk(cursor, last_id):
+    # what the triggers would have done for a chunk, in three statements: pairs
+    # past last_id are new, staged pairs whose name moved get reindexed
+    cursor.execute('''
+    DELETE FROM temp.renamed_pairs
+    WHERE product_name IS (SELECT product_name FROM latest_prices WHERE latest_prices.id = renamed_pairs.id)
+    ''')
+    cursor.execute('''
+    INSERT INTO latest_prices_fts (latest_prices_fts, rowid, product_name, competitor_name)
+    SELECT 'delete', id, product_name, competitor_name FROM temp.renamed_pairs
+    ''')
+    cursor.execute('''
+    INSERT INTO latest_prices_fts (rowid, product_name, competitor_name)
+    SELECT id, product_name, competitor_name FROM latest_prices
+    WHERE id > ? OR id IN (SELECT id FROM temp.renamed_pairs)
+    ''', (last_id,))
+
+@instrumentation.instrumented
+def save_records_to_db(record_chunks, progress=None, files=None, result=None):
+    """
+    Write an iterable of record chunks (see prepare_records) in one transaction.
+    New rows are appended to price_history and upserted into latest_prices,
+    the daily rollups and product_summary. If the iterable raises
+    InvalidProductsError the load is rolled back and its message returned.
+    
+    Rows already in price_history are skipped, and so are whole chunks the
+    ingest ledger has seen before and rows older than the day retention
+    pruned price_history back to. files is a list of (hash, name) pairs to
+    add to the ledger with the load. result, a dict, gets the rows,
+    new_rows, duplicate_rows, expired_rows and skipped_batches counts.
+    """
+    try:
+        # open the door to the database
+        with connection() as conn, _bulk_pragmas(conn):
+            started = time.perf_counter()
+            rows_written = 0
+            new_rows = 0
+            expired_rows = 0
+            skipped_batches = 0
+            ingested_at = datetime.datetime.now().isoformat(timespec='seconds')
+            
+            # one transaction for the whole load, all or nothing
+            conn.execute("BEGIN")
             cursor = conn.cursor()
-            cursor.execute('''
-            INSERT INTO products (product_id, product_name, our_price, competitor_name, competitor_price, last_updated)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                row['product_id'], 
-                row['product_name'], 
-                row['our_price'], 
-                row['competitor_name'], 
-                row['competitor_price'],
-                row['last_updated']
-            ))
-        
-        # save our work and close up shop
-        conn.commit()
-        conn.close()
+            
+            _create_load_tables(cursor)
+            
+            fts = _has_fts(conn)
+            if fts:
+                _pause_fts_triggers(cursor)
+            
+            pruned_before = get_meta(PRUNED_BEFORE_KEY, conn=conn)
+            
+            for records in record_chunks:
+                batch_rows = len(records)
+                rows_written += batch_rows
+                
+                # a batch we've loaded before is skipped on one primary key lookup
+                batch_hash = _batch_hash(records)
+                if cursor.execute("SELECT 1 FROM ingest_ledger WHERE hash = ?", (batch_hash,)).fetchone():
+                    skipped_batches += 1
+                    if progress is not None:
+                        progress(rows_written)
+                    continue
+                
+                _stage_chunk(cursor, records)
+                staged_rows = batch_rows
+                
+                # the row_hash of anything before the prune is gone, so it can't be told apart from new
+                if pruned_before is not None:
+                    cursor.execute("DELETE FROM temp.staged_rows WHERE last_updated < ?", (pruned_before,))
+                    expired_rows += cursor.rowcount
+                    staged_rows -= cursor.rowcount
+                
+                # history just grows, a row already in it is ignored by the row_hash index
+                last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM price_history").fetchone()[0]
+                cursor.execute('''
+                INSERT OR IGNORE INTO price_history (product_id, product_name, our_price, competitor_name, competitor_price, last_updated, row_hash)
+                SELECT product_id, product_name, our_price, competitor_name, competitor_price, last_updated, row_hash
+                FROM temp.staged_rows ORDER BY seq
+                ''')
+                chunk_new_rows = cursor.rowcount
+                
+                # only when some rows were repeats do we need to find out which
+                if chunk_new_rows < staged_rows:
+                    _drop_repeated_rows(cursor, last_id)
+                
+                cursor.execute(
+                    "INSERT OR IGNORE INTO ingest_ledger (hash, kind, rows, new_rows, ingested_at) VALUES (?, 'batch', ?, ?, ?)",
+                    (batch_hash, batch_rows, chunk_new_rows, ingested_at)
+                )
+                new_rows += chunk_new_rows
+                
+                # nothing to rename in an empty table, the first load skips the staging
+                if fts:
+                    last_latest_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM latest_prices").fetchone()[0]
+                    if last_latest_id:
+                        _stage_fts_renames(cursor)
+                
+                # latest keeps one row per pair, and an older feed never overwrites a newer one.
+                # Rows go in in feed order, so the last one for a pair wins like it did one
+                # at a time (WHERE true stops sqlite reading ON CONFLICT as a join constraint)
+                cursor.execute('''
+                INSERT INTO latest_prices (product_id, product_name, our_price, competitor_name, competitor_price, last_updated)
+                SELECT product_id, product_name, our_price, competitor_name, competitor_price, last_updated
+                FROM temp.staged_rows WHERE true ORDER BY seq
+                ON CONFLICT (product_id, competitor_name) DO UPDATE SET
+                    product_name = excluded.product_name,
+                    our_price = excluded.our_price,
+                    competitor_price = excluded.competitor_price,
+                    last_updated = excluded.last_updated
+                WHERE excluded.last_updated >= latest_prices.last_updated
+                ''')
+                
+                if fts:
+                    _index_fts_chunk(cursor, last_latest_id)
+                
+                # daily rollup, later rows for the same day win like they do in latest
+                cursor.execute('''
+                INSERT INTO daily_prices (product_id, competitor_name, day, our_price, competitor_price,
+                                          min_competitor_price, max_competitor_price, observations)
+                SELECT product_id, competitor_name, last_updated, our_price, competitor_price,
+                       competitor_price, competitor_price, 1
+                FROM temp.staged_rows WHERE true ORDER BY seq
+                ON CONFLICT (product_id, competitor_name, day) DO UPDATE SET
+                    our_price = excluded.our_price,
+                    competitor_price = excluded.competitor_price,
+                    min_competitor_price = MIN(min_competitor_price, excluded.competitor_price),
+                    max_competitor_price = MAX(max_competitor_price, excluded.competitor_price),
+                    observations = observations + 1
+                ''')
+                
+                # the summaries are refreshed once at the end, for whatever the chunks touched
+                cursor.execute("INSERT OR IGNORE INTO temp.touched_days SELECT last_updated FROM temp.staged_rows")
+                cursor.execute("INSERT OR IGNORE INTO temp.touched_products SELECT product_id FROM temp.staged_rows")
+                
+                if progress is not None:
+                    progress(rows_written)
+            
+            _refresh_daily_competitor_stats(cursor)
+            _refresh_product_summary(cursor, touched_only=True)
+            
+            if fts:
+                _resume_fts_triggers(cursor)
+            
+            # the files go in last, only a load that got this far counts as done.
+            # Their rows interleave in a multi-file load, so counts are only kept for a single file
+            files = files or []
+            file_rows, file_new_rows = (rows_written, new_rows) if len(files) == 1 else (None, None)
+            for file_hash, source in files:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO ingest_ledger (hash, kind, source, rows, new_rows, ingested_at) VALUES (?, 'file', ?, ?, ?, ?)",
+                    (file_hash, source, file_rows, file_new_rows, ingested_at)
+                )
+            
+            # save our work, anything that blew up before here got rolled back
+            conn.commit()
+        
+        elapsed = time.perf_counter() - started
+        rows_per_sec = rows_written / elapsed if elapsed > 0 else float(rows_written)
+        duplicate_rows = rows_written - new_rows - expired_rows
+        
+        if result is not None:
+            result.update(rows=rows_written, new_rows=new_rows, duplicate_rows=duplicate_rows,
+                          expired_rows=expired_rows, skipped_batches=skipped_batches)
         
-        return True, "Data saved successfully"
+        expired = f", {expired_rows:,} rows older than the kept history skipped" if expired_rows else ""
+        return True, f"Data saved successfully ({new_rows:,} new rows, {duplicate_rows:,} duplicates skipped{expired}, {rows_per_sec:,.0f} rows/sec)"
+    except InvalidProductsError as e:
+        # _bulk_pragmas already rolled the transaction back
+        return False, str(e)
     except Exception as e:
         # uh oh something went wrong
         print(f"Error saving data: {str(e)}")
         return False, f"Error saving data: {str(e)}"
 
-def get_all_products():
+@instrumentation.instrumented
+def get_ingested_file(file_hash, conn=None):
+    """
+    The ledger entry (source, rows, new_rows, ingested_at) of a file with
+    this content hash, None if it was never loaded
+    """
+    with _use_connection(conn, readonly=True) as conn:
+        row = conn.execute(
+            "SELECT source, rows, new_rows, ingested_at FROM ingest_ledger WHERE hash = ? AND kind = 'file'",
+            (file_hash,)
+        ).fetchone()
+    
+    if row is None:
+        return None
+    return dict(zip(['source', 'rows', 'new_rows', 'ingested_at'], row))
+
+@instrumentation.instrumented
+def get_all_products(conn=None, compact=False):
+    """
+    Every row of latest_prices. compact=True shrinks the frame for keeping in
+    memory, see compact_products.
+    """
     try:
-        # where's that database again?
-        db_path = get_db_path()
-        
         # let pandas do the heavy lifting
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql_query("SELECT * FROM products", conn)
-        conn.close()
+        with _use_connection(conn, readonly=True) as conn:
+            df = pd.read_sql_query(f"SELECT {PRODUCT_SELECT} FROM latest_prices", conn)
         
-        return df
+        return compact_products(df) if compact else df
     except Exception as e:
         # don't crash if we can't find the data
         print(f"Database error: {str(e)}")
         return pd.DataFrame()
 
-def search_products(search_term):
+@instrumentation.instrumented
+def compact_products(df):
+    """
+    Shrink a products frame for holding in memory: repeated strings become
+    categoricals, last_updated becomes datetime64, id gets int32 and prices
+    get float32 when every one of them survives the round trip to the cent.
+    """
+    if df.empty:
+        return df
+    
+    df = df.copy()
+    
+    # a categorical only pays off when values repeat, a column of unique ids is better left alone
+    for col in ['product_id', 'product_name', 'competitor_name']:
+        if df[col].nunique() <= len(df) * CATEGORY_MAX_UNIQUE_RATIO:
+            df[col] = df[col].astype('category')
+    
+    df['last_updated'] = pd.to_datetime(df['last_updated'], format='%Y-%m-%d', errors='coerce')
+    
+    if df['id'].max() < np.iinfo(np.int32).max:
+        df['id'] = df['id'].astype(np.int32)
+    
+    for col in ['our_price', 'competitor_price']:
+        narrow = df[col].astype(np.float32)
+        # float32 keeps ~7 digits, fine for cents on everyday prices but not on huge ones
+        if np.array_equal(np.round(narrow.to_numpy(dtype=float), 2), np.round(df[col].to_numpy(dtype=float), 2), equal_nan=True):
+            df[col] = narrow
+    
+    return df
+
+def _fts_query(search_term):
+    # every word becomes a quoted prefix term, so "gam lap" finds "Gaming Laptop"
+    # and nothing the user types can be read as fts syntax
+    words = re.findall(r"\w+", search_term)
+    return " ".join(f'"{word}"*' for word in words)
+
+def _has_fts(conn):
+    result = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latest_prices_fts'"
+    ).fetchone()
+    return result is not None
+
+@instrumentation.instrumented
+def search_products(search_term, limit=None, conn=None):
+    """
+    Full-text prefix search over product and competitor names, best matches first.
+    limit caps how many rows come back (None for all of them).
+    """
     try:
-        # find the database
-        db_path = get_db_path()
+        # sqlite treats a negative limit as no limit at all
+        row_limit = -1 if limit is None else limit
         
         # open up the database
-        conn = sqlite3.connect(db_path)
+        with _use_connection(conn, readonly=True) as conn:
+            if _has_fts(conn):
+                match = _fts_query(search_term)
+                if not match:
+                    return pd.DataFrame(columns=PRODUCT_COLUMNS)
+                
+                # let's find what they're looking for, ranked by bm25
+                columns = ", ".join("latest_prices." + col for col in PRODUCT_COLUMNS)
+                query = f"""
+                SELECT {columns}
+                FROM latest_prices_fts
+                JOIN latest_prices ON latest_prices.id = latest_prices_fts.rowid
+                WHERE latest_prices_fts MATCH ?
+                ORDER BY latest_prices_fts.rank
+                LIMIT ?
+                """
+                params = (match, row_limit)
+            else:
+                # no fts5 in this sqlite build, plain (but still parameterised) LIKE
+                pattern = f"%{search_term}%"
+                query = f"""
+                SELECT {PRODUCT_SELECT} FROM latest_prices 
+                WHERE product_name LIKE ? 
+                OR competitor_name LIKE ?
+                LIMIT ?
+                """
+                params = (pattern, pattern, row_limit)
+            
+            # run the search and give back what we found
+            df = pd.read_sql_query(query, conn, params=params)
         
-        # let's find what they're looking for
+        return df
+    except Exception as e:
+        print(f"Search error: {str(e)}")
+        return pd.DataFrame()
+
+@instrumentation.instrumented
+def filter_cheaper_competitors(conn=None):
+    try:
+        # range scan on the price_gap index, biggest undercut first
         query = f"""
-        SELECT * FROM products 
-        WHERE product_name LIKE '%{search_term}%' 
-        OR competitor_name LIKE '%{search_term}%'
+        SELECT {PRODUCT_SELECT} FROM latest_prices 
+        WHERE price_gap > 0
+        ORDER BY price_gap DESC
         """
         
-        # run the search and give back what we found
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        # execute query and return results
+        with _use_connection(conn, readonly=True) as conn:
+            df = pd.read_sql_query(query, conn)
         
         return df
     except Exception as e:
-        print(f"Search error: {str(e)}")
+        print(f"Filter error: {str(e)}")
         return pd.DataFrame()
 
-def filter_cheaper_competitors():
+@instrumentation.instrumented
+def filter_we_are_cheaper(conn=None):
     try:
-        # get database path
-        db_path = get_db_path()
+        # same index, other end of the range
+        query = f"""
+        SELECT {PRODUCT_SELECT} FROM latest_prices 
+        WHERE price_gap < 0
+        ORDER BY price_gap ASC
+        """
         
-        # connect to database
-        conn = sqlite3.connect(db_path)
+        # execute query and return results
+        with _use_connection(conn, readonly=True) as conn:
+            df = pd.read_sql_query(query, conn)
         
-        # query
-        query = """
-        SELECT * FROM products 
-        WHERE competitor_price < our_price
+        return df
+    except Exception as e:
+        print(f"Filter error: {str(e)}")
+        return pd.DataFrame()
+
+@instrumentation.instrumented
+def get_top_price_gaps(limit=5, conn=None):
+    """
+    The limit rows where competitors undercut us by the most, with a price_diff column
+    """
+    try:
+        # walks the price_gap index backwards and stops after limit rows
+        query = f"""
+        SELECT {PRODUCT_SELECT}, price_gap AS price_diff FROM latest_prices 
+        WHERE price_gap > 0
+        ORDER BY price_gap DESC
+        LIMIT ?
         """
         
         # execute query and return results
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with _use_connection(conn, readonly=True) as conn:
+            df = pd.read_sql_query(query, conn, params=(limit,))
         
         return df
     except Exception as e:
         print(f"Filter error: {str(e)}")
         return pd.DataFrame()
 
-def filter_we_are_cheaper():
+# what the table view is allowed to ORDER BY, never spliced in from user input directly
+SORTABLE_COLUMNS = PRODUCT_COLUMNS + ['price_gap']
+
+@instrumentation.instrumented
+def get_products_page(limit, offset=0, sort_by='id', ascending=True, columns=None, conn=None):
+    """
+    One page of products, sorted and projected in SQL.
+    columns picks which product columns come back (all of them by default);
+    our_price and competitor_price always do since status is worked out from them.
+    """
     try:
-        # get database path
-        db_path = get_db_path()
+        if sort_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"Can't sort by {sort_by}")
         
-        # connect to database
-        conn = sqlite3.connect(db_path)
+        selected = [col for col in PRODUCT_COLUMNS if columns is None or col in columns]
+        for col in ['our_price', 'competitor_price']:
+            if col not in selected:
+                selected.append(col)
         
-        # query
-        query = """
-        SELECT * FROM products 
-        WHERE our_price < competitor_price
+        # id breaks ties so pages never overlap or skip rows
+        direction = "ASC" if ascending else "DESC"
+        query = f"""
+        SELECT {", ".join(selected)} FROM latest_prices
+        ORDER BY {sort_by} {direction}, id {direction}
+        LIMIT ? OFFSET ?
         """
         
         # execute query and return results
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with _use_connection(conn, readonly=True) as conn:
+            df = pd.read_sql_query(query, conn, params=(limit, offset))
         
         return df
     except Exception as e:
-        print(f"Filter error: {str(e)}")
+        print(f"Page query error: {str(e)}")
         return pd.DataFrame()
 
-def get_last_update_date():
+# what the price matrix can be ordered by
+SUMMARY_SORTABLE_COLUMNS = [
+    'product_id', 'product_name', 'our_price', 'competitors', 'min_competitor_price',
+    'median_competitor_price', 'max_competitor_price', 'gap_to_cheapest', 'our_rank', 'last_updated'
+]
+
+@instrumentation.instrumented
+def get_summary_page(limit, offset=0, sort_by='product_id', ascending=True, undercut_only=False, conn=None):
+    """
+    One page of product_summary, sorted in SQL. undercut_only keeps the
+    products where at least one competitor is cheaper than us.
+    """
     try:
-        # get database path
-        db_path = get_db_path()
+        if sort_by not in SUMMARY_SORTABLE_COLUMNS:
+            raise ValueError(f"Can't sort by {sort_by}")
         
-        # connect to database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        direction = "ASC" if ascending else "DESC"
+        where = "WHERE our_rank > 1" if undercut_only else ""
+        query = f"""
+        SELECT * FROM product_summary {where}
+        ORDER BY {sort_by} {direction}, product_id {direction}
+        LIMIT ? OFFSET ?
+        """
         
+        with _use_connection(conn, readonly=True) as conn:
+            return pd.read_sql_query(query, conn, params=(limit, offset))
+    except Exception as e:
+        print(f"Summary query error: {str(e)}")
+        return pd.DataFrame()
+
+@instrumentation.instrumented
+def count_summary_products(undercut_only=False, conn=None):
+    try:
+        where = "WHERE our_rank > 1" if undercut_only else ""
+        with _use_connection(conn, readonly=True) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM product_summary {where}").fetchone()[0]
+    except Exception as e:
+        print(f"Summary query error: {str(e)}")
+        return 0
+
+@instrumentation.instrumented
+def get_first_product_id(conn=None):
+    # a default for the product pickers, None when nothing has been loaded yet
+    try:
+        with _use_connection(conn, readonly=True) as conn:
+            row = conn.execute("SELECT product_id FROM product_summary LIMIT 1").fetchone()
+            return row[0] if row else None
+    except Exception as e:
+        print(f"Summary query error: {str(e)}")
+        return None
+
+@instrumentation.instrumented
+def get_competitor_prices(product_ids, conn=None):
+    """
+    product_id / competitor_name / competitor_price for just these products,
+    the long form of their rows in the price matrix
+    """
+    try:
+        if len(product_ids) == 0:
+            return pd.DataFrame(columns=['product_id', 'competitor_name', 'competitor_price'])
+        
+        placeholders = ", ".join("?" * len(product_ids))
+        with _use_connection(conn, readonly=True) as conn:
+            return pd.read_sql_query(
+                f"SELECT product_id, competitor_name, competitor_price FROM latest_prices WHERE product_id IN ({placeholders})",
+                conn,
+                params=list(product_ids)
+            )
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return pd.DataFrame()
+
+@instrumentation.instrumented
+def count_products(conn=None):
+    try:
+        with _use_connection(conn, readonly=True) as conn:
+            result = conn.execute("SELECT COUNT(*) FROM latest_prices").fetchone()
+        
+        return result[0]
+    except Exception as e:
+        print(f"Count query error: {str(e)}")
+        return 0
+
+def stats_from_row(total, competitors_cheaper, we_are_cheaper, avg_competitor_advantage, avg_our_advantage):
+    """
+    The dashboard stats dict (same shape as price_compare.get_price_change_stats)
+    from counts and average gaps, None averages meaning there's no such row
+    """
+    return {
+        'total_products': total or 0,
+        'competitors_cheaper': competitors_cheaper or 0,
+        'we_are_cheaper': we_are_cheaper or 0,
+        'identical_prices': (total or 0) - (competitors_cheaper or 0) - (we_are_cheaper or 0),
+        'avg_competitor_advantage': round(avg_competitor_advantage or 0, 2),
+        'avg_our_advantage': round(avg_our_advantage or 0, 2)
+    }
+
+@instrumentation.instrumented
+def get_price_stats(by_competitor=False, conn=None):
+    """
+    The price_compare.get_price_change_stats numbers worked out in one SQL pass,
+    without loading any rows. With by_competitor=True you get a dict of
+    competitor name -> stats instead.
+    """
+    empty_stats = stats_from_row(0, 0, 0, None, None)
+    
+    try:
+        # AVG skips the NULLs the CASEs hand back for rows in the other bucket
+        query = f"""
+        SELECT {"competitor_name, " if by_competitor else ""}
+            COUNT(*),
+            SUM(CASE WHEN price_gap > 0 THEN 1 ELSE 0 END),
+            SUM(CASE WHEN price_gap < 0 THEN 1 ELSE 0 END),
+            AVG(CASE WHEN price_gap > 0 THEN price_gap END),
+            AVG(CASE WHEN price_gap < 0 THEN -price_gap END)
+        FROM latest_prices
+        {"GROUP BY competitor_name ORDER BY competitor_name" if by_competitor else ""}
+        """
+        
+        with _use_connection(conn, readonly=True) as conn:
+            rows = conn.execute(query).fetchall()
+        
+        if by_competitor:
+            return {row[0]: stats_from_row(*row[1:]) for row in rows}
+        return stats_from_row(*rows[0])
+    except Exception as e:
+        print(f"Stats query error: {str(e)}")
+        return {} if by_competitor else empty_stats
+
+@instrumentation.instrumented
+def get_history_high_water(conn=None):
+    """
+    Newest price_history id, 0 for an empty history. Every change to
+    latest_prices comes with a history row, so anything holding a copy of
+    latest_prices is current up to its high-water mark.
+    """
+    with _use_connection(conn, readonly=True) as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM price_history").fetchone()[0]
+
+@instrumentation.instrumented(rows=lambda result, args, kwargs: len(result[1]) if result[1] is not None else None)
+def get_changed_products(since_id, conn=None):
+    """
+    (high_water, df): the newest price_history id and the current latest_prices
+    rows of every pair with history newer than since_id. Reads the id first, so
+    a load committing in between shows up now and again next time rather than
+    never. On error the frame is None.
+    """
+    try:
+        with _use_connection(conn, readonly=True) as conn:
+            high_water = conn.execute("SELECT COALESCE(MAX(id), 0) FROM price_history").fetchone()[0]
+            
+            # the pairs come off the history id range, then one key lookup each into latest_prices
+            changed = pd.read_sql_query(
+                f'''
+                WITH changed AS (
+                    SELECT DISTINCT product_id, competitor_name FROM price_history
+                    WHERE id > ? AND id <= ?
+                )
+                SELECT {", ".join(f"latest_prices.{col}" for col in PRODUCT_COLUMNS)}
+                FROM changed
+                JOIN latest_prices
+                  ON latest_prices.product_id = changed.product_id
+                 AND latest_prices.competitor_name = changed.competitor_name
+                ORDER BY latest_prices.id
+                ''',
+                conn,
+                params=(since_id, high_water)
+            )
+        
+        return high_water, changed
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return since_id, None
+
+@instrumentation.instrumented
+def get_last_update_date(conn=None):
+    try:
         # query for the most recent date
-        cursor.execute("SELECT MAX(last_updated) as last_date FROM products")
-        result = cursor.fetchone()
-        conn.close()
+        with _use_connection(conn, readonly=True) as conn:
+            result = conn.execute("SELECT MAX(last_updated) as last_date FROM latest_prices").fetchone()
         
         if result and result[0]:
             return result[0]
@@ -214,15 +1559,29 @@ def get_last_update_date():
         print(f"Date query error: {str(e)}")
         return "Database error"
 
+@instrumentation.instrumented
 def delete_database():
     """
     Deletes the entire database file.
     """
     try:
         db_path = get_db_path()
+        
+        # nobody gets to keep using a handle on the file we're about to remove
+        close_connections()
+        
         if os.path.exists(db_path):
             os.remove(db_path)
+            
+            # WAL mode leaves these next to the database, a stale one would confuse a new file
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+            
+            # snapshots of the old data would only ever be stale
+            shutil.rmtree(get_snapshot_dir(), ignore_errors=True)
+            
             return True, "Database deleted successfully."
         return False, "Database file not found."
     except Exception as e:
-        return False, f"Error deleting database: {str(e)}"
\ No newline at end of file
+        return False, f"Error deleting database: {str(e)}"
@@ -1,46 +1,75 @@
-import pandas as pd
 import os
-from datetime import datetime
 
-# Email alert is in process
-# This module will be implemented in a future update
+import alert_dispatcher
+import alert_log
+
+# Digests go out through the background alert dispatcher. Without SMTP settings
+# in the environment they're written to logs/outbox as .eml files instead.
 
 # Default configuration - placeholder values only
-DEFAULT_SENDER = "price-alerts@company.com"
+DEFAULT_SENDER = alert_dispatcher.DEFAULT_SENDER
 DEFAULT_RECIPIENT = "your-email@example.com"
 
-def send_price_alert(alert_products, recipient_email=DEFAULT_RECIPIENT):
+# shared dispatcher, started the first time something gets sent
+_dispatcher = None
+
+def get_dispatcher():
     """
-    Send an email alert for products where competitors have lower prices
-    CURRENTLY NOT IMPLEMENTED - EMAIL ALERT IS IN PROCESS
+    The process-wide alert dispatcher, using SMTP when MARKETPULSE_SMTP_HOST is set
     """
-    # placeholder implementation that just logs instead of sending emails
-    log_alert_instead(alert_products)
-    return False, "Email alerts are currently in development. Alert data has been logged."
+    global _dispatcher
+    
+    if _dispatcher is None:
+        smtp_host = os.environ.get('MARKETPULSE_SMTP_HOST')
+        
+        if smtp_host:
+            transport = alert_dispatcher.SmtpTransport(
+                host=smtp_host,
+                port=int(os.environ.get('MARKETPULSE_SMTP_PORT', 25)),
+                username=os.environ.get('MARKETPULSE_SMTP_USER'),
+                password=os.environ.get('MARKETPULSE_SMTP_PASSWORD'),
+                use_tls=os.environ.get('MARKETPULSE_SMTP_TLS', '').lower() in ('1', 'true', 'yes')
+            )
+        else:
+            transport = alert_dispatcher.FileTransport()
+        
+        _dispatcher = alert_dispatcher.AlertDispatcher(
+            transport,
+            sender=os.environ.get('MARKETPULSE_SMTP_SENDER', DEFAULT_SENDER)
+        ).start()
+    
+    return _dispatcher
 
-def log_alert_instead(alert_products):
+def get_dispatcher_stats():
+    """
+    Send/retry counters for the shared dispatcher, None if nothing was sent yet
     """
-    Log the alert to a file for demonstration purposes
+    if _dispatcher is None:
+        return None
+    return _dispatcher.get_stats()
+
+def send_price_alert(alert_products, recipient_email=DEFAULT_RECIPIENT):
+    """
+    Queue an email digest for products where competitors have lower prices.
+    Returns as soon as the alerts are on the dispatcher's queue, sending happens
+    in the background.
     """
-    # gotta make sure we got a logs folder ya know
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    alerts = alert_dispatcher.alert_records(alert_products)
     
-    # create a log file with current date so we can find it later
-    filename = f"logs/price_alert_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    if not alerts:
+        return False, "No alerts to send."
     
-    with open(filename, 'w') as f:
-        f.write(f"PRICE ALERT: {len(alert_products)} products with competitor price drops\n")
-        f.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        
-        for _, row in alert_products.iterrows():
-            price_diff = row['our_price'] - row['competitor_price']
-            percentage = (price_diff / row['our_price']) * 100
-            f.write(f"Product: {row['product_name']}\n")
-            f.write(f"Our Price: ${row['our_price']:.2f}\n")
-            f.write(f"Competitor: {row['competitor_name']}\n")
-            f.write(f"Their Price: ${row['competitor_price']:.2f}\n")
-            f.write(f"Difference: ${price_diff:.2f} ({percentage:.1f}%)\n\n")
+    accepted = get_dispatcher().submit(recipient_email, alerts)
+    
+    if accepted < len(alerts):
+        return False, f"Alert queue is full, only {accepted} of {len(alerts)} alerts were queued."
+    return True, f"Queued {accepted} alerts for {recipient_email}."
+
+def log_alert_instead(alert_products):
+    """
+    Log the alerts to the structured alert log instead of sending them
+    """
+    written = alert_log.log_alerts(alert_products)
     
-    print(f"Alert logged to {filename}")
-    return True
\ No newline at end of file
+    print(f"Logged {written} alerts to {alert_log.get_alert_log().active_path}")
+    return written > 0
@@ -0,0 +1,364 @@
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty
+
+import pandas as pd
+
+import db
+
+# rows per batch when streaming a file into the database
+DEFAULT_BATCH_SIZE = 100000
+
+def iter_csv_batches(source, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield a CSV file (path or file object) as DataFrames of batch_size rows.
+    Only one batch is ever held in memory, no matter how big the file is.
+    """
+    # read_csv with chunksize hands back a lazy reader instead of one big frame
+    with pd.read_csv(source, chunksize=batch_size) as reader:
+        for batch in reader:
+            yield batch
+
+def preview_csv(source, rows=5):
+    """
+    Read just the first few rows of a CSV for a preview / header check
+    """
+    preview = pd.read_csv(source, nrows=rows)
+    
+    # rewind file objects so the real ingest starts from the top again
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    
+    return preview
+
+# extensions each Excel reader handles
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+XLS_EXTENSIONS = ('.xls',)
+
+def _file_extension(source, name=None):
+    # uploads are file objects, their name comes from the uploader
+    return os.path.splitext(str(name or getattr(source, 'name', source)))[1].lower()
+
+def _sheet_batches(rows, batch_size):
+    # rows is an iterator of value tuples, the first non-empty one is the header
+    header = None
+    batch = []
+    
+    for row in rows:
+        # formatting alone keeps a row in the sheet, skip rows with nothing in them
+        if all(value is None or value == '' for value in row):
+            continue
+        
+        if header is None:
+            header = [str(value).strip() if value is not None else '' for value in row]
+            
+            # notes, pivots and other sheets without our columns aren't product data
+            if any(col not in header for col in db.REQUIRED_COLUMNS):
+                return
+            continue
+        
+        batch.append(row[:len(header)])
+        if len(batch) == batch_size:
+            yield pd.DataFrame.from_records(batch, columns=header)
+            batch = []
+    
+    if batch:
+        yield pd.DataFrame.from_records(batch, columns=header)
+
+def iter_xlsx_batches(source, batch_size=DEFAULT_BATCH_SIZE, sheets=None):
+    """
+    Yield every sheet of an .xlsx workbook (or just the named sheets) as
+    DataFrames of batch_size rows. The workbook is opened read-only, so
+    openpyxl streams rows out of the file instead of building the whole
+    workbook in memory. Sheets without the required columns are skipped.
+    """
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        for name in sheets or workbook.sheetnames:
+            yield from _sheet_batches(workbook[name].iter_rows(values_only=True), batch_size)
+    finally:
+        # read-only workbooks keep the file open until closed
+        workbook.close()
+
+def _xls_rows(book, sheet):
+    from xlrd import XL_CELL_DATE, xldate_as_datetime
+    
+    for index in range(sheet.nrows):
+        values = sheet.row_values(index)
+        types = sheet.row_types(index)
+        
+        # dates are stored as day numbers, turn them back into dates
+        yield tuple(
+            xldate_as_datetime(value, book.datemode) if cell_type == XL_CELL_DATE else value
+            for value, cell_type in zip(values, types)
+        )
+
+def iter_xls_batches(source, batch_size=DEFAULT_BATCH_SIZE, sheets=None):
+    """
+    Yield every sheet of a legacy .xls workbook (or just the named sheets) as
+    DataFrames of batch_size rows. Sheets are loaded one at a time and
+    released once read.
+    """
+    import xlrd
+    
+    if hasattr(source, 'read'):
+        book = xlrd.open_workbook(file_contents=source.read(), on_demand=True)
+    else:
+        book = xlrd.open_workbook(source, on_demand=True)
+    
+    try:
+        for name in sheets or book.sheet_names():
+            sheet = book.sheet_by_name(name)
+            yield from _sheet_batches(_xls_rows(book, sheet), batch_size)
+            book.unload_sheet(name)
+    finally:
+        book.release_resources()
+
+def iter_excel_batches(source, batch_size=DEFAULT_BATCH_SIZE, sheets=None, name=None):
+    """
+    Yield an Excel workbook (.xlsx or .xls, path or file object) as DataFrames
+    of batch_size rows, sheet after sheet
+    """
+    if _file_extension(source, name) in XLS_EXTENSIONS:
+        return iter_xls_batches(source, batch_size, sheets)
+    return iter_xlsx_batches(source, batch_size, sheets)
+
+def preview_excel(source, rows=5, name=None):
+    """
+    First few rows of the first sheet with product data, for a preview /
+    header check. Empty when no sheet has the required columns.
+    """
+    batches = iter_excel_batches(source, rows, name=name)
+    try:
+        preview = next(batches, pd.DataFrame())
+    finally:
+        # closing the reader closes the workbook
+        batches.close()
+    
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    
+    return preview
+
+def is_excel_file(source, name=None):
+    return _file_extension(source, name) in XLSX_EXTENSIONS + XLS_EXTENSIONS
+
+def iter_file_batches(path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Pick the batch reader for a file from its extension (.csv, .xlsx, .xlsm or .xls)
+    """
+    if is_excel_file(path):
+        return iter_excel_batches(path, batch_size)
+    return iter_csv_batches(path, batch_size)
+
+# bytes read at a time when hashing a file
+HASH_BLOCK_SIZE = 1 << 20
+
+def file_digest(source):
+    """
+    Content hash of a file (path or file object), read a block at a time.
+    File objects are rewound afterwards.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    
+    if hasattr(source, 'read'):
+        source.seek(0)
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+        source.seek(0)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+    
+    return digest.digest()
+
+def already_ingested_message(name, entry):
+    rows = f" ({entry['rows']:,} rows)" if entry['rows'] is not None else ""
+    return f"{name} was already ingested on {entry['ingested_at']}{rows}, nothing new to save"
+
+def ingest_file(source, name=None, batch_size=DEFAULT_BATCH_SIZE, progress=None, result=None):
+    """
+    Load one CSV or Excel file (path or file object) in this process. A file
+    whose exact contents are in the ingest ledger is skipped without being
+    parsed; otherwise repeated batches and rows are skipped by
+    save_batches_to_db. Returns (success, message).
+    """
+    name = name or os.path.basename(str(getattr(source, 'name', source)))
+    digest = file_digest(source)
+    
+    entry = db.get_ingested_file(digest)
+    if entry is not None:
+        if result is not None:
+            result.update(rows=0, new_rows=0, duplicate_rows=0, expired_rows=0, skipped_batches=0, skipped_file=True)
+        return True, already_ingested_message(name, entry)
+    
+    if is_excel_file(source, name):
+        batches = iter_excel_batches(source, batch_size, name=name)
+    else:
+        batches = iter_csv_batches(source, batch_size)
+    
+    return db.save_batches_to_db(batches, progress=progress, files=[(digest, name)], result=result)
+
+# bounded so fast parsers can't pile up more batches than the writer keeps up with
+DEFAULT_QUEUE_BATCHES = 8
+
+# set in each worker process by _init_worker
+_worker_queue = None
+_worker_cancel = None
+
+def _init_worker(queue, cancel):
+    global _worker_queue, _worker_cancel
+    _worker_queue = queue
+    _worker_cancel = cancel
+
+def _parse_file(path, batch_size, chunk_size):
+    # runs in a worker: read, validate and build the insert tuples, then hand
+    # them to the writer. The file's report always goes last, even on error.
+    started = time.perf_counter()
+    rows = 0
+    batches = 0
+    error = None
+    
+    try:
+        for df in iter_file_batches(path, batch_size):
+            if _worker_cancel.is_set():
+                error = "cancelled"
+                break
+            
+            try:
+                records = db.prepare_records(df, chunk_size)
+            except db.InvalidProductsError as e:
+                error = f"{e} (batch {batches + 1})"
+                break
+            
+            _worker_queue.put(('batch', path, records))
+            rows += len(df)
+            batches += 1
+    except Exception as e:
+        error = str(e)
+    
+    _worker_queue.put(('done', path, {
+        'file': path,
+        'rows': rows,
+        'batches': batches,
+        'parse_seconds': time.perf_counter() - started,
+        'error': error,
+        'skipped': None
+    }))
+
+def ingest_files(paths, workers=None, batch_size=DEFAULT_BATCH_SIZE, chunk_size=db.DEFAULT_CHUNK_SIZE,
+                 queue_batches=DEFAULT_QUEUE_BATCHES, progress=None):
+    """
+    Load several files at once: a process pool parses and validates them in
+    parallel and this process is the only SQLite writer, draining their
+    batches into one transaction as they arrive.
+    
+    Any file failing rolls the whole load back. Returns (success, message,
+    reports) with one dict per file: rows, batches, parse_seconds, error and
+    skipped (why the file wasn't loaded at all). Files whose contents the
+    ingest ledger already has, or that repeat another file in the list, are
+    skipped without being parsed. Batches from different files interleave,
+    latest_prices still only takes the newest last_updated for each pair.
+    """
+    # the same path twice would wait forever on a second report
+    paths = list(dict.fromkeys(str(path) for path in paths))
+    if not paths:
+        return False, "No files to ingest.", []
+    
+    # hashing is one sequential read per file, far cheaper than parsing a repeat
+    digests = {}
+    skipped = {}
+    for path in paths:
+        digest = file_digest(path)
+        entry = db.get_ingested_file(digest)
+        
+        if entry is not None:
+            skipped[path] = already_ingested_message(os.path.basename(path), entry)
+        elif digest in digests.values():
+            skipped[path] = f"{os.path.basename(path)} has the same contents as another file in this load"
+        else:
+            digests[path] = digest
+    
+    reports = {
+        path: {'file': path, 'rows': 0, 'batches': 0, 'parse_seconds': 0.0, 'error': None, 'skipped': reason}
+        for path, reason in skipped.items()
+    }
+    pending = list(digests)
+    
+    if not pending:
+        return True, f"Nothing new to load, all {len(paths)} files were already ingested", [reports[path] for path in paths]
+    
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    
+    queue = multiprocessing.Queue(maxsize=queue_batches)
+    cancel = multiprocessing.Event()
+    counts = {}
+    
+    def next_message():
+        # a worker that dies outright never posts its report, so keep an eye on the futures
+        while True:
+            try:
+                return queue.get(timeout=1)
+            except Empty:
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise RuntimeError(f"ingest worker failed: {future.exception()}")
+    
+    def record_chunks():
+        while len(reports) < len(paths):
+            kind, path, payload = next_message()
+            
+            if kind == 'done':
+                reports[path] = payload
+                if payload['error'] is not None:
+                    raise db.InvalidProductsError(f"{os.path.basename(path)}: {payload['error']}, nothing was saved")
+                continue
+            
+            yield from payload
+    
+    started = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(queue, cancel)) as pool:
+        futures = [pool.submit(_parse_file, path, batch_size, chunk_size) for path in pending]
+        
+        success, message = db.save_records_to_db(
+            record_chunks(),
+            progress=progress,
+            files=[(digest, os.path.basename(path)) for path, digest in digests.items()],
+            result=counts
+        )
+        
+        # on failure stop the other workers and drain the queue so they can exit
+        if not success:
+            cancel.set()
+            while not all(future.done() for future in futures) or not queue.empty():
+                try:
+                    kind, path, payload = queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                if kind == 'done':
+                    reports[path] = payload
+    
+    elapsed = time.perf_counter() - started
+    
+    if success:
+        rows = sum(report['rows'] for report in reports.values())
+        message = (
+            f"Loaded {len(pending)} files with {workers} workers ({rows:,} rows in {elapsed:,.1f}s, "
+            f"{rows / elapsed if elapsed > 0 else rows:,.0f} rows/sec): "
+            f"{counts['new_rows']:,} new rows, {counts['duplicate_rows']:,} duplicates skipped"
+        )
+        if counts['expired_rows']:
+            message += f", {counts['expired_rows']:,} rows older than the kept history skipped"
+        if skipped:
+            message += f", {len(skipped)} repeated files skipped"
+    
+    # a file whose worker died has no report of its own
+    missing = {'rows': 0, 'batches': 0, 'parse_seconds': 0.0, 'error': "worker failed", 'skipped': None}
+    return success, message, [reports.get(path, dict(missing, file=path)) for path in paths]
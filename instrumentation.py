@@ -0,0 +1,219 @@
+import bisect
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Call counts, latency histograms and row counts for the db / price_compare hot
+# paths. Every measurement lands in the process-wide collector and, when the
+# current thread has one, the collector of the session that made the call.
+#
+# Off unless MARKETPULSE_INSTRUMENT is set (or enable() is called). While off,
+# an instrumented call costs one flag check on top of the real call.
+
+_enabled = os.environ.get('MARKETPULSE_INSTRUMENT', '').lower() in ('1', 'true', 'yes')
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+BUCKET_LABELS = [f"<{bound}ms" for bound in BUCKET_BOUNDS_MS] + [f">={BUCKET_BOUNDS_MS[-1]}ms"]
+
+# how many lines of profile / allocation output a capture keeps
+PROFILE_LINES = 30
+ALLOCATION_LINES = 15
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+class Collector:
+    """
+    Per-name call statistics, safe to record into from several threads
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def record(self, name, seconds, rows=None, error=False):
+        bucket = bisect.bisect_right(BUCKET_BOUNDS_MS, seconds * 1000)
+        
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {
+                    'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                    'rows': 0, 'buckets': [0] * len(BUCKET_LABELS)
+                }
+            
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['buckets'][bucket] += 1
+            if rows is not None:
+                stats['rows'] += rows
+    
+    def summary(self):
+        """
+        One row per instrumented name, slowest total first
+        """
+        with self._lock:
+            rows = [
+                {
+                    'name': name,
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'total_ms': stats['total_seconds'] * 1000,
+                    'mean_ms': stats['total_seconds'] * 1000 / stats['calls'],
+                    'max_ms': stats['max_seconds'] * 1000,
+                    'rows': stats['rows'],
+                }
+                for name, stats in self._stats.items()
+            ]
+        
+        if not rows:
+            return pd.DataFrame(columns=['name', 'calls', 'errors', 'total_ms', 'mean_ms', 'max_ms', 'rows'])
+        return pd.DataFrame(rows).sort_values('total_ms', ascending=False).reset_index(drop=True)
+    
+    def histograms(self):
+        """
+        Calls per latency bucket, one row per name
+        """
+        with self._lock:
+            data = {name: list(stats['buckets']) for name, stats in self._stats.items()}
+        
+        return pd.DataFrame.from_dict(data, orient='index', columns=BUCKET_LABELS)
+    
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+# everything the process has recorded, plus whatever collector this thread's session set
+_global = Collector()
+_local = threading.local()
+
+def get_global_collector():
+    return _global
+
+def set_session_collector(collector):
+    """
+    Route this thread's measurements to collector as well (None to stop)
+    """
+    _local.collector = collector
+
+def _record(name, seconds, rows, error):
+    _global.record(name, seconds, rows, error)
+    
+    session = getattr(_local, 'collector', None)
+    if session is not None:
+        session.record(name, seconds, rows, error)
+
+def _count_rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series, list)):
+        return len(result)
+    return None
+
+def instrumented(func=None, name=None, rows=None):
+    """
+    Decorator timing every call of a function. rows(result, args, kwargs)
+    can say how many rows a call handled, by default it's len() of a returned
+    DataFrame / Series / list.
+    """
+    if func is None:
+        return functools.partial(instrumented, name=name, rows=rows)
+    
+    label = name or f"{func.__module__}.{func.__name__}"
+    count_rows = rows or (lambda result, args, kwargs: _count_rows(result))
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            _record(label, time.perf_counter() - started, None, True)
+            raise
+        
+        _record(label, time.perf_counter() - started, count_rows(result, args, kwargs), False)
+        return result
+    
+    return wrapper
+
+@contextmanager
+def timed(name, rows=None):
+    """
+    Time a block, e.g. the streamlit rendering of a page
+    """
+    if not _enabled:
+        yield
+        return
+    
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _record(name, time.perf_counter() - started, rows, error)
+
+@contextmanager
+def capture_profile(result):
+    """
+    Run a block under cProfile and tracemalloc, filling result (a dict) with
+    the top functions by cumulative time, the top allocation sites and the
+    peak traced memory
+    """
+    profiler = cProfile.Profile()
+    
+    # only one profiler can run at a time on newer pythons, another session may have it
+    try:
+        profiler.enable()
+    except ValueError as e:
+        result['error'] = f"Profiler unavailable: {str(e)}"
+        yield result
+        return
+    profiler.disable()
+    
+    # someone else may already be tracing allocations, leave theirs running
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        
+        result['profile'] = output.getvalue()
+        result['allocations'] = [str(stat) for stat in after.compare_to(before, 'lineno')[:ALLOCATION_LINES]]
+        result['peak_bytes'] = peak
@@ -1,9 +1,17 @@
 import pandas as pd
 import numpy as np
 
-def compare_prices(df):
+import instrumentation
+
+# status values in the order of their categorical codes
+STATUS_CATEGORIES = ['alert', 'good', 'neutral']
+
+@instrumentation.instrumented
+def compare_prices(df, with_messages=True):
     """
-    Compare our prices with competitor prices and add status and message columns
+    Compare our prices with competitor prices and add status and message columns.
+    Pass with_messages=False to skip building the message strings, then call
+    add_messages on just the rows that actually get shown.
     """
     if df.empty:
         return df
@@ -11,35 +19,78 @@ def compare_prices(df):
     # making a copy to avoid warnings
     result_df = df.copy()
     
-    # add status column for styling
-    result_df['status'] = ''
-    result_df['message'] = ''
-    
-    # look at each product and check if the other guys are cheaper
-    for idx, row in result_df.iterrows():
-        my_price = row['our_price']
-        comp_price = row['competitor_price']
-        
-        # figure out who's winning the price war
-        if comp_price < my_price:
-            # oh no they're beating us on price
-            price_diff = my_price - comp_price
-            percentage = (price_diff / my_price) * 100
-            result_df.at[idx, 'status'] = 'alert'
-            result_df.at[idx, 'message'] = f"Price Drop Alert (${price_diff:.2f} / {percentage:.1f}% cheaper)"
-        elif my_price < comp_price:
-            # we're cheaper, looking good!
-            price_diff = comp_price - my_price
-            percentage = (price_diff / comp_price) * 100
-            result_df.at[idx, 'status'] = 'good'
-            result_df.at[idx, 'message'] = f"We are cheaper (${price_diff:.2f} / {percentage:.1f}% cheaper)"
-        else:
-            # same price, nothing exciting
-            result_df.at[idx, 'status'] = 'neutral'
-            result_df.at[idx, 'message'] = "Prices are identical"
+    our_price = result_df['our_price'].to_numpy(dtype=float)
+    comp_price = result_df['competitor_price'].to_numpy(dtype=float)
+    
+    # figure out who's winning the price war for every row at once,
+    # anything else (same price or missing) counts as neutral
+    codes = np.select(
+        [comp_price < our_price, our_price < comp_price],
+        [0, 1],
+        default=2
+    ).astype(np.int8)
+    result_df['status'] = pd.Categorical.from_codes(codes, categories=STATUS_CATEGORIES)
+    
+    if with_messages:
+        result_df['message'] = build_messages(result_df)
+    
+    return result_df
+
+@instrumentation.instrumented(rows=lambda result, args, kwargs: len(result[0]))
+def price_differences(df):
+    """
+    Absolute price gap and the gap as a percentage of the higher price.
+    That's the competitor's advantage over our price for alerts and our
+    advantage over theirs when we're cheaper.
+    """
+    our_price = df['our_price'].to_numpy(dtype=float)
+    comp_price = df['competitor_price'].to_numpy(dtype=float)
+    
+    price_diff = np.abs(our_price - comp_price)
+    
+    # identical prices are the only way to get 0/0 here and those never show a percentage
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage = (price_diff / np.maximum(our_price, comp_price)) * 100
     
+    return price_diff, percentage
+
+@instrumentation.instrumented
+def build_messages(df):
+    """
+    Build the human readable status message for rows already run through compare_prices
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    
+    price_diff, percentage = price_differences(df)
+    status = df['status'].to_numpy(dtype=object)
+    
+    # same number formatting as the old per-row f-strings, just done in bulk
+    amounts = np.char.mod('$%.2f / ', price_diff).astype(object) + np.char.mod('%.1f%% cheaper)', percentage).astype(object)
+    
+    messages = np.full(len(df), "Prices are identical", dtype=object)
+    
+    alerts = status == 'alert'
+    messages[alerts] = "Price Drop Alert (" + amounts[alerts]
+    
+    cheaper = status == 'good'
+    messages[cheaper] = "We are cheaper (" + amounts[cheaper]
+    
+    return pd.Series(messages, index=df.index)
+
+@instrumentation.instrumented
+def add_messages(df):
+    """
+    Attach message strings to a (usually small) slice of compared rows for display
+    """
+    if 'message' in df.columns:
+        return df
+    
+    result_df = df.copy()
+    result_df['message'] = build_messages(result_df)
     return result_df
 
+@instrumentation.instrumented
 def get_price_change_stats(df):
     """
     Calculate stats about price differences for dashboard
@@ -0,0 +1,298 @@
+import datetime
+import json
+import time
+
+import db
+import instrumentation
+import trends
+
+# Retention for the history tables, oldest data first:
+#   price_history   every uploaded row, kept for raw_days
+#   daily_prices    one row per pair per day, kept for daily_days, then folded into
+#   weekly_prices   one row per pair per week, kept until horizon_days
+# Ages are counted back from the newest day on record, so a feed that stops
+# doesn't slowly purge everything. latest_prices and product_summary are the
+# current state and never expire.
+
+# meta keys for the policy and the schedule's bookkeeping
+RAW_DAYS_KEY = 'retention.raw_days'
+DAILY_DAYS_KEY = 'retention.daily_days'
+HORIZON_DAYS_KEY = 'retention.horizon_days'
+LAST_RUN_KEY = 'retention.last_run'
+LAST_VACUUM_KEY = 'retention.last_vacuum'
+LAST_REPORT_KEY = 'retention.last_report'
+
+DEFAULT_RAW_DAYS = 90
+DEFAULT_DAILY_DAYS = 365
+
+# 0 keeps the weekly rollups forever
+DEFAULT_HORIZON_DAYS = 730
+
+# how often run_scheduled actually does something
+RUN_INTERVAL = datetime.timedelta(days=1)
+VACUUM_INTERVAL = datetime.timedelta(days=7)
+
+# pages freed per incremental_vacuum call, writers get a look in between calls
+VACUUM_STEP_PAGES = 2000
+
+# monday of the week a day falls in
+WEEK_OF_DAY = "date(day, '-6 days', 'weekday 1')"
+
+def get_policy(conn=None):
+    """
+    The saved (raw_days, daily_days, horizon_days)
+    """
+    raw_days = int(db.get_meta(RAW_DAYS_KEY, DEFAULT_RAW_DAYS, conn=conn))
+    daily_days = int(db.get_meta(DAILY_DAYS_KEY, DEFAULT_DAILY_DAYS, conn=conn))
+    horizon_days = int(db.get_meta(HORIZON_DAYS_KEY, DEFAULT_HORIZON_DAYS, conn=conn))
+    
+    return raw_days, daily_days, horizon_days
+
+def _check_policy(raw_days, daily_days, horizon_days):
+    if raw_days < 1 or daily_days < 1 or horizon_days < 0:
+        raise ValueError("Retention periods must be at least a day")
+    if raw_days > daily_days:
+        raise ValueError("Raw history can't be kept longer than the daily rollups")
+    if horizon_days and daily_days > horizon_days:
+        raise ValueError("Daily rollups can't be kept past the horizon")
+
+def set_policy(raw_days, daily_days, horizon_days):
+    """
+    Save the retention policy, in days. horizon_days 0 never purges the weekly rollups.
+    """
+    _check_policy(raw_days, daily_days, horizon_days)
+    
+    with db.connection() as conn:
+        db.set_meta(RAW_DAYS_KEY, int(raw_days), conn=conn)
+        db.set_meta(DAILY_DAYS_KEY, int(daily_days), conn=conn)
+        db.set_meta(HORIZON_DAYS_KEY, int(horizon_days), conn=conn)
+        conn.commit()
+
+def _database_size(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    
+    return {'bytes': page_size * page_count, 'free_bytes': page_size * free_pages}
+
+def _time_queries(repeat=3):
+    # a few reads that get slower as the history tables grow, fastest of repeat runs
+    queries = {
+        'price_stats': db.get_price_stats,
+        'most_volatile_30d': lambda: trends.get_most_volatile(30),
+        'history_per_day': _history_per_day,
+    }
+    
+    timings = {}
+    for name, query in queries.items():
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+def _history_per_day():
+    with db.connection(readonly=True) as conn:
+        return conn.execute("SELECT last_updated, COUNT(*) FROM price_history GROUP BY last_updated").fetchall()
+
+def _cutoff(as_of, days):
+    return (datetime.date.fromisoformat(as_of) - datetime.timedelta(days=days)).isoformat()
+
+def _fold_into_weeks(cursor, cutoff):
+    # one row per pair per week out of the days before cutoff. A week that was
+    # partly folded before gets merged, the later day's prices win
+    cursor.execute(f'''
+    INSERT INTO weekly_prices (product_id, competitor_name, week, last_day, our_price, competitor_price,
+                               min_competitor_price, max_competitor_price, observations)
+    SELECT product_id, competitor_name, week, day, our_price, competitor_price,
+           min_competitor_price, max_competitor_price, observations
+    FROM (
+        SELECT product_id, competitor_name, {WEEK_OF_DAY} AS week, day, our_price, competitor_price,
+               MIN(min_competitor_price) OVER pair_week AS min_competitor_price,
+               MAX(max_competitor_price) OVER pair_week AS max_competitor_price,
+               SUM(observations) OVER pair_week AS observations,
+               ROW_NUMBER() OVER (PARTITION BY product_id, competitor_name, {WEEK_OF_DAY} ORDER BY day DESC) AS row_number
+        FROM daily_prices
+        WHERE day < ?
+        WINDOW pair_week AS (PARTITION BY product_id, competitor_name, {WEEK_OF_DAY})
+    )
+    WHERE row_number = 1
+    ON CONFLICT (product_id, competitor_name, week) DO UPDATE SET
+        our_price = CASE WHEN excluded.last_day >= last_day THEN excluded.our_price ELSE our_price END,
+        competitor_price = CASE WHEN excluded.last_day >= last_day THEN excluded.competitor_price ELSE competitor_price END,
+        last_day = MAX(last_day, excluded.last_day),
+        min_competitor_price = MIN(min_competitor_price, excluded.min_competitor_price),
+        max_competitor_price = MAX(max_competitor_price, excluded.max_competitor_price),
+        observations = observations + excluded.observations
+    ''', (cutoff,))
+    weeks_written = cursor.rowcount
+    
+    cursor.execute("DELETE FROM daily_prices WHERE day < ?", (cutoff,))
+    return weeks_written, cursor.rowcount
+
+@instrumentation.instrumented(rows=lambda result, args, kwargs: sum(result['deleted'].values()))
+def apply_retention(raw_days=None, daily_days=None, horizon_days=None, as_of=None, dry_run=False, measure=True):
+    """
+    Downsample and purge the history tables by the policy (the saved one for
+    anything not given), all in one transaction:
+    
+      price_history older than raw_days is deleted, daily_prices already has those
+        days, and later loads skip rows that old (see db.PRUNED_BEFORE_KEY)
+      daily_prices older than daily_days is folded into weekly_prices
+      weekly_prices and daily_competitor_stats older than horizon_days are deleted
+    
+    Then the query planner statistics are refreshed. dry_run rolls everything
+    back and just reports. Returns a report dict: cutoffs, rows deleted per
+    table, weekly rows written, database size before and after, and with
+    measure the timings of a few history queries before and after.
+    Freed pages stay in the file until vacuum().
+    """
+    saved = get_policy()
+    raw_days = saved[0] if raw_days is None else raw_days
+    daily_days = saved[1] if daily_days is None else daily_days
+    horizon_days = saved[2] if horizon_days is None else horizon_days
+    _check_policy(raw_days, daily_days, horizon_days)
+    
+    started = time.perf_counter()
+    report = {
+        'dry_run': dry_run,
+        'policy': {'raw_days': raw_days, 'daily_days': daily_days, 'horizon_days': horizon_days},
+        'deleted': {'price_history': 0, 'daily_prices': 0, 'weekly_prices': 0, 'daily_competitor_stats': 0},
+        'weekly_rows_written': 0,
+    }
+    
+    if measure:
+        report['query_seconds_before'] = _time_queries()
+    
+    with db.connection() as conn:
+        report['size_before'] = _database_size(conn)
+        
+        as_of = as_of or conn.execute("SELECT MAX(day) FROM daily_prices").fetchone()[0]
+        report['as_of'] = as_of
+        if as_of is None:
+            # no history to age yet, the report still has every key a real run has
+            report['cutoffs'] = None
+            report['size_after'] = report['size_before']
+            if measure:
+                report['query_seconds_after'] = report['query_seconds_before']
+            report['seconds'] = time.perf_counter() - started
+            return report
+        
+        cutoffs = {
+            'raw': _cutoff(as_of, raw_days),
+            'daily': _cutoff(as_of, daily_days),
+            'horizon': _cutoff(as_of, horizon_days) if horizon_days else None,
+        }
+        report['cutoffs'] = cutoffs
+        deleted = report['deleted']
+        
+        # take the write lock up front, an ingest waits for us or we wait for it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM price_history WHERE last_updated < ?", (cutoffs['raw'],))
+            deleted['price_history'] = cursor.rowcount
+            
+            # the pruned rows take their row_hash with them, so from here on ingest
+            # drops rows before the cutoff rather than loading them a second time
+            if deleted['price_history']:
+                pruned_before = db.get_meta(db.PRUNED_BEFORE_KEY, conn=conn)
+                db.set_meta(db.PRUNED_BEFORE_KEY, max(pruned_before or cutoffs['raw'], cutoffs['raw']), conn=conn)
+            
+            report['weekly_rows_written'], deleted['daily_prices'] = _fold_into_weeks(cursor, cutoffs['daily'])
+            
+            if cutoffs['horizon']:
+                # the first week kept is the one the horizon falls in
+                cursor.execute("DELETE FROM weekly_prices WHERE week < date(?, '-6 days', 'weekday 1')", (cutoffs['horizon'],))
+                deleted['weekly_prices'] = cursor.rowcount
+                
+                cursor.execute("DELETE FROM daily_competitor_stats WHERE day < ?", (cutoffs['horizon'],))
+                deleted['daily_competitor_stats'] = cursor.rowcount
+            
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        # ANALYZE in optimize only runs where the row counts moved enough to matter
+        if not dry_run:
+            conn.execute("PRAGMA optimize")
+        
+        report['size_after'] = _database_size(conn)
+    
+    if measure:
+        report['query_seconds_after'] = _time_queries()
+    
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+@instrumentation.instrumented
+def vacuum(full=False):
+    """
+    Hand the free pages back to the filesystem. With incremental auto-vacuum
+    (every database made since retention exists) that's a few thousand pages
+    at a time; older files, or full, get one full VACUUM, which also switches
+    them to incremental. Returns the size before and after and the bytes
+    reclaimed.
+    """
+    with db.connection() as conn:
+        before = _database_size(conn)
+        
+        if full or conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+                conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall()
+        
+        # in WAL mode the file only shrinks once the log is checkpointed
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        after = _database_size(conn)
+    
+    return {'size_before': before, 'size_after': after, 'bytes_reclaimed': before['bytes'] - after['bytes']}
+
+def _due(key, interval, now):
+    last = db.get_meta(key)
+    return last is None or now - datetime.datetime.fromisoformat(last) >= interval
+
+def run_scheduled(now=None, force=False, measure=True):
+    """
+    For cron: apply retention if it hasn't run for RUN_INTERVAL, and vacuum
+    if that hasn't run for VACUUM_INTERVAL (force runs both). Returns the
+    report, with 'vacuum' when it vacuumed, or None when nothing was due.
+    """
+    now = now or datetime.datetime.now()
+    run_retention = force or _due(LAST_RUN_KEY, RUN_INTERVAL, now)
+    run_vacuum = force or _due(LAST_VACUUM_KEY, VACUUM_INTERVAL, now)
+    
+    if not run_retention and not run_vacuum:
+        return None
+    
+    report = apply_retention(measure=measure) if run_retention else {}
+    if run_vacuum:
+        report['vacuum'] = vacuum()
+    
+    with db.connection() as conn:
+        stamp = now.isoformat(timespec='seconds')
+        if run_retention:
+            db.set_meta(LAST_RUN_KEY, stamp, conn=conn)
+        if run_vacuum:
+            db.set_meta(LAST_VACUUM_KEY, stamp, conn=conn)
+        db.set_meta(LAST_REPORT_KEY, json.dumps(report), conn=conn)
+        conn.commit()
+    
+    return report
+
+def get_last_report():
+    """
+    The report of the last scheduled run, None if there hasn't been one
+    """
+    report = db.get_meta(LAST_REPORT_KEY)
+    return json.loads(report) if report else None
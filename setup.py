@@ -6,6 +6,26 @@ setup(
     description="E-commerce Price Monitoring Dashboard",
     author="Your Name",
     packages=find_packages(),
+    py_modules=[
+        "alert_dispatcher",
+        "alert_engine",
+        "alert_log",
+        "cli",
+        "data_cache",
+        "db",
+        "email_alert",
+        "ingest",
+        "instrumentation",
+        "price_compare",
+        "retention",
+        "snapshot",
+        "trends",
+    ],
+    entry_points={
+        "console_scripts": [
+            "marketpulse=cli:main",
+        ],
+    },
     install_requires=[
         "streamlit>=1.28.0,<2.0.0",
         "pandas>=2.0.0,<3.0.0",
@@ -15,6 +35,10 @@ setup(
         "openpyxl>=3.1.0,<4.0.0",
         "xlrd>=2.0.1,<3.0.0",
     ],
+    extras_require={
+        # Arrow / parquet snapshots, see snapshot.py
+        "snapshots": ["pyarrow>=14.0.0"],
+    },
     python_requires=">=3.9",
     classifiers=[
         "Development Status :: 4 - Beta",
@@ -0,0 +1,205 @@
+import json
+import os
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+import db
+
+# pyarrow is optional, without it there are no snapshots and everything reads sqlite
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# A snapshot of a table is written twice, by default under db.get_snapshot_dir():
+#   <table>.arrow    one uncompressed Arrow IPC file, memory-mapped when loaded
+#   <table>/         parquet partitioned by last_updated and competitor_name (hive
+#                    style), for reads that only need some columns or some rows
+#   <table>.json     manifest saying which database, and what state of it, it was taken at
+
+SNAPSHOT_TABLES = ('latest_prices', 'price_history')
+PARTITION_COLUMNS = ['last_updated', 'competitor_name']
+
+# rows pulled from sqlite per record batch while exporting
+EXPORT_CHUNK_SIZE = 100000
+
+def is_available():
+    return pa is not None
+
+def _schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('product_id', pa.string()),
+        ('product_name', pa.string()),
+        ('our_price', pa.float64()),
+        ('competitor_name', pa.string()),
+        ('competitor_price', pa.float64()),
+        ('last_updated', pa.string()),
+    ])
+
+def _partitioning():
+    return ds.partitioning(
+        pa.schema([(name, pa.string()) for name in PARTITION_COLUMNS]),
+        flavor='hive'
+    )
+
+def _paths(table, directory):
+    base = os.path.join(directory or db.get_snapshot_dir(), table)
+    return base + '.arrow', base, base + '.json'
+
+def _database_marker(conn):
+    # the id and path say which database file this is, a new file at the same
+    # path gets a new id. Within it latest_prices only changes on ingest, and
+    # every ingest appends history, so the newest history id plus the row
+    # count says which data we've got
+    history_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM price_history").fetchone()[0]
+    rows = conn.execute("SELECT COUNT(*) FROM latest_prices").fetchone()[0]
+    return {
+        'database_id': db.get_database_id(conn),
+        'db_path': db.get_db_path(),
+        'history_id': history_id,
+        'latest_rows': rows,
+    }
+
+def export_snapshot(table='latest_prices', directory=None):
+    """
+    Snapshot a table to Arrow IPC and partitioned parquet, streaming it out of
+    sqlite a record batch at a time. Returns (success, message).
+    """
+    if not is_available():
+        return False, "pyarrow is not installed, snapshots are unavailable."
+    if table not in SNAPSHOT_TABLES:
+        return False, f"Can't snapshot table: {table}"
+    
+    arrow_path, parquet_path, manifest_path = _paths(table, directory)
+    schema = _schema()
+    
+    try:
+        directory = os.path.dirname(arrow_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        with db.connection(readonly=True) as conn:
+            # one read transaction so the rows and the marker agree
+            conn.execute("BEGIN")
+            marker = _database_marker(conn)
+            rows = 0
+            
+            # pyarrow refuses to write more partitions than it's told to expect
+            partitions = set()
+            
+            # written next to the real files and swapped in at the end, so
+            # readers never see half a snapshot
+            with pa.OSFile(arrow_path + '.tmp', 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                for chunk in pd.read_sql_query(
+                    f"SELECT {db.PRODUCT_SELECT} FROM {table} ORDER BY id",
+                    conn,
+                    chunksize=EXPORT_CHUNK_SIZE
+                ):
+                    writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+                    rows += len(chunk)
+                    partitions.update(chunk[PARTITION_COLUMNS].drop_duplicates().itertuples(index=False, name=None))
+            
+            conn.rollback()
+        
+        # the parquet copy streams off the memory-mapped arrow file
+        ds.write_dataset(
+            ds.dataset(arrow_path + '.tmp', format='ipc'),
+            parquet_path + '.tmp',
+            format='parquet',
+            partitioning=_partitioning(),
+            existing_data_behavior='delete_matching',
+            max_partitions=max(len(partitions), 1)
+        )
+        
+        os.replace(arrow_path + '.tmp', arrow_path)
+        if os.path.exists(parquet_path):
+            shutil.rmtree(parquet_path)
+        os.replace(parquet_path + '.tmp', parquet_path)
+        
+        with open(manifest_path, 'w') as f:
+            json.dump(dict(marker, table=table, rows=rows, created=datetime.now().isoformat(timespec='seconds')), f)
+        
+        return True, f"Snapshot of {table} written ({rows:,} rows)"
+    except Exception as e:
+        # whatever got half written is no use to anyone
+        if os.path.exists(arrow_path + '.tmp'):
+            os.remove(arrow_path + '.tmp')
+        shutil.rmtree(parquet_path + '.tmp', ignore_errors=True)
+        
+        print(f"Snapshot error: {str(e)}")
+        return False, f"Snapshot error: {str(e)}"
+
+def get_manifest(table='latest_prices', directory=None):
+    _, _, manifest_path = _paths(table, directory)
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_fresh(table='latest_prices', directory=None):
+    """
+    True if a snapshot exists and the database hasn't changed since it was taken
+    """
+    manifest = get_manifest(table, directory)
+    if not is_available() or manifest is None:
+        return False
+    
+    with db.connection(readonly=True) as conn:
+        marker = _database_marker(conn)
+    
+    # a database init_db never saw can't prove a snapshot is its own
+    if marker['database_id'] is None:
+        return False
+    
+    return all(manifest.get(key) == value for key, value in marker.items())
+
+def load_arrow(table='latest_prices', columns=None, directory=None):
+    """
+    Load a snapshot from its memory-mapped Arrow file. The file is written a
+    record batch per EXPORT_CHUNK_SIZE rows, and pandas joins the batches into
+    one copy per column, so only a snapshot of a single batch gets numeric
+    columns that are zero-copy views of the mapping. Either way nothing is
+    read through sqlite.
+    """
+    arrow_path, _, _ = _paths(table, directory)
+    
+    # not closed here, the frame's buffers keep the mapping alive for as long as they need it
+    source = pa.memory_map(arrow_path, 'r')
+    data = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        data = data.select(columns)
+    
+    return data.to_pandas()
+
+def read_parquet(table='latest_prices', columns=None, filters=None, directory=None):
+    """
+    Read part of a snapshot from the partitioned parquet copy.
+    
+    columns limits what gets decoded, filters are pyarrow's DNF tuples, e.g.
+    [('competitor_name', '=', 'Amazon'), ('last_updated', '>=', '2025-08-01')].
+    Filters on last_updated / competitor_name skip whole partitions, anything
+    else is pushed down to the parquet row group statistics.
+    """
+    _, parquet_path, _ = _paths(table, directory)
+    
+    data = pq.read_table(parquet_path, columns=columns, filters=filters, partitioning=_partitioning())
+    return data.to_pandas()
+
+def load_products(directory=None):
+    """
+    latest_prices from the Arrow snapshot if it's current, None if it isn't
+    (or pyarrow is missing) so the caller reads sqlite instead
+    """
+    try:
+        if not is_fresh('latest_prices', directory):
+            return None
+        return load_arrow('latest_prices', columns=db.PRODUCT_COLUMNS, directory=directory)
+    except Exception as e:
+        print(f"Snapshot read error: {str(e)}")
+        return None
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# the app modules live at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_cache
+import db
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    A fresh database in a scratch directory, which is also the working
+    directory so logs and snapshots land there too
+    """
+    monkeypatch.chdir(tmp_path)
+    db.set_db_path(str(tmp_path / 'price_monitor.db'))
+    db.init_db()
+    data_cache.clear()
+    
+    yield db.get_db_path()
+    
+    data_cache.clear()
+    db.close_connections()
+
+def make_products(rows):
+    """
+    A products frame with the upload columns from (product_id, competitor_name,
+    our_price, competitor_price, last_updated) tuples
+    """
+    df = pd.DataFrame(rows, columns=['product_id', 'competitor_name', 'our_price', 'competitor_price', 'last_updated'])
+    df.insert(1, 'product_name', 'Product ' + df['product_id'])
+    return df[['product_id', 'product_name', 'our_price', 'competitor_name', 'competitor_price', 'last_updated']]
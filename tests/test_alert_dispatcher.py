@@ -0,0 +1,92 @@
+import alert_dispatcher
+
+class FakeTransport:
+    """
+    Records every digest, failing the first fail_times sends
+    """
+    
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.attempts = 0
+        self.sent = []
+    
+    async def send(self, message):
+        self.attempts += 1
+        if self.attempts <= self.fail_times:
+            raise ConnectionError("smtp down")
+        self.sent.append(message)
+
+def make_alerts(count):
+    return [
+        {'product_name': f"Product {n}", 'our_price': 10.0, 'competitor_name': 'ShopA',
+         'competitor_price': 9.0, 'price_diff': 1.0, 'percentage': 10.0}
+        for n in range(count)
+    ]
+
+def alert_count(message):
+    return int(message['Subject'].split()[2])
+
+def no_sleep(monkeypatch):
+    # record the backoff delays instead of waiting them out
+    delays = []
+    
+    async def sleep(delay):
+        delays.append(delay)
+    
+    monkeypatch.setattr(alert_dispatcher.asyncio, 'sleep', sleep)
+    monkeypatch.setattr(alert_dispatcher.random, 'uniform', lambda low, high: 0)
+    return delays
+
+def test_alerts_are_batched_into_digests_per_recipient():
+    transport = FakeTransport()
+    dispatcher = alert_dispatcher.AlertDispatcher(transport, digest_size=3, flush_interval=0.05)
+    
+    assert dispatcher.submit('a@example.com', make_alerts(7)) == 7
+    assert dispatcher.submit('b@example.com', make_alerts(2)) == 2
+    dispatcher.stop()
+    
+    digests = {}
+    for message in transport.sent:
+        digests.setdefault(message['To'], []).append(alert_count(message))
+    assert sorted(digests['a@example.com']) == [1, 3, 3]
+    assert digests['b@example.com'] == [2]
+    
+    stats = dispatcher.get_stats()
+    assert (stats['queued'], stats['sent_digests'], stats['sent_alerts'], stats['rejected']) == (9, 4, 9, 0)
+
+def test_failed_sends_are_retried_with_backoff(monkeypatch):
+    delays = no_sleep(monkeypatch)
+    transport = FakeTransport(fail_times=2)
+    dispatcher = alert_dispatcher.AlertDispatcher(transport, flush_interval=0.05, max_retries=3, backoff_seconds=1.0)
+    
+    dispatcher.submit('a@example.com', make_alerts(2))
+    dispatcher.stop()
+    
+    assert len(transport.sent) == 1
+    assert delays == [1.0, 2.0]
+    assert dispatcher.get_stats()['retries'] == 2
+    assert not dispatcher.failed
+
+def test_digests_that_keep_failing_are_kept_up_to_max_failed(monkeypatch):
+    no_sleep(monkeypatch)
+    transport = FakeTransport(fail_times=100)
+    dispatcher = alert_dispatcher.AlertDispatcher(transport, digest_size=1, flush_interval=0.05,
+                                                  max_retries=1, max_failed=2)
+    
+    dispatcher.submit('a@example.com', make_alerts(3))
+    dispatcher.stop()
+    
+    assert transport.attempts == 6
+    assert dispatcher.get_stats()['failed_digests'] == 3
+    assert len(dispatcher.failed) == 2
+    assert all(error == "smtp down" for _, _, error in dispatcher.failed)
+
+def test_alerts_that_dont_fit_are_rejected():
+    dispatcher = alert_dispatcher.AlertDispatcher(FakeTransport(), queue_size=2, flush_interval=0.05)
+    
+    # nothing drains the queue within a zero timeout, so only the first two fit
+    assert dispatcher.submit('a@example.com', make_alerts(5), timeout=0) == 2
+    dispatcher.stop()
+    
+    stats = dispatcher.get_stats()
+    assert (stats['queued'], stats['rejected'], stats['sent_alerts']) == (2, 3, 2)
@@ -0,0 +1,57 @@
+import alert_engine
+import db
+
+from conftest import make_products
+
+def events_by_pair(events):
+    return {(row.product_id, row.competitor_name): row.event for row in events.itertuples(index=False)}
+
+def test_alerts_move_through_new_worsened_and_resolved(database):
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+        ('P1', 'ShopB', 10.0, 11.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 15.0, '2025-08-01'),
+    ]))
+    
+    assert events_by_pair(alert_engine.check_alerts()) == {('P1', 'ShopA'): 'new', ('P2', 'ShopA'): 'new'}
+    
+    # nothing new ingested, nothing to report
+    assert alert_engine.check_alerts().empty
+    
+    # ShopA undercuts P1 further, P2 matches our price, ShopB starts undercutting
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 8.0, '2025-08-02'),
+        ('P1', 'ShopB', 10.0, 9.5, '2025-08-02'),
+        ('P2', 'ShopA', 20.0, 20.0, '2025-08-02'),
+    ]))
+    events = alert_engine.check_alerts()
+    assert events_by_pair(events) == {
+        ('P1', 'ShopA'): 'worsened',
+        ('P1', 'ShopB'): 'new',
+        ('P2', 'ShopA'): 'resolved',
+    }
+    worsened = events[events['event'] == 'worsened'].iloc[0]
+    assert (worsened['price_diff'], worsened['previous_price_diff']) == (2.0, 1.0)
+    
+    # a smaller gap than the one already alerted on is not news
+    db.save_data_to_db(make_products([('P1', 'ShopA', 10.0, 8.5, '2025-08-03')]))
+    assert alert_engine.check_alerts().empty
+    
+    active = alert_engine.get_active_alerts()
+    assert sorted(zip(active['product_id'], active['competitor_name'])) == [('P1', 'ShopA'), ('P1', 'ShopB')]
+
+def test_thresholds_filter_small_gaps(database):
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 100.0, 99.0, '2025-08-01'),
+        ('P2', 'ShopA', 100.0, 94.0, '2025-08-01'),
+        ('P3', 'ShopA', 10.0, 7.0, '2025-08-01'),
+    ]))
+    
+    # P1 is under both thresholds, P3 is 30% but only $3 under
+    alert_engine.set_thresholds(min_diff=5, min_percentage=2)
+    assert alert_engine.get_thresholds() == (5.0, 2.0)
+    assert events_by_pair(alert_engine.check_alerts()) == {('P2', 'ShopA'): 'new'}
+    
+    # thresholds passed in win over the saved ones
+    db.save_data_to_db(make_products([('P3', 'ShopA', 10.0, 6.0, '2025-08-02')]))
+    assert events_by_pair(alert_engine.check_alerts(min_diff=1, min_percentage=0)) == {('P3', 'ShopA'): 'new'}
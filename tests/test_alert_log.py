@@ -0,0 +1,77 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import alert_log
+
+def alerts_on(day, *product_ids):
+    frame = pd.DataFrame({
+        'event': 'new',
+        'product_id': list(product_ids),
+        'product_name': [f"Product {product_id}" for product_id in product_ids],
+        'competitor_name': 'ShopA',
+        'our_price': 10.0,
+        'competitor_price': 9.0,
+    })
+    return alert_log.alert_log_records(frame, timestamp=day)
+
+def test_full_logs_rotate_to_gzip_named_by_their_time_range(tmp_path):
+    directory = str(tmp_path / 'logs')
+    # every write after the first goes over max_bytes
+    log = alert_log.AlertLog(directory=directory, max_bytes=1, buffer_size=1)
+    
+    first_day = datetime(2025, 8, 1, 9, 0, 0)
+    log.write(alerts_on(first_day, 'P1', 'P2'))
+    log.write(alerts_on(first_day + timedelta(days=1), 'P3'))
+    log.write(alerts_on(first_day + timedelta(days=2), 'P4'))
+    
+    rotated = alert_log.rotated_files(directory)
+    assert [(first, last) for _, first, last in rotated] == [
+        (first_day, first_day),
+        (first_day + timedelta(days=1), first_day + timedelta(days=1)),
+    ]
+    assert all(path.endswith('.jsonl.gz') for path, _, _ in rotated)
+    
+    with gzip.open(rotated[0][0], 'rt', encoding='utf-8') as f:
+        assert [json.loads(line)['product_id'] for line in f] == ['P1', 'P2']
+    with open(log.active_path, encoding='utf-8') as f:
+        assert [json.loads(line)['product_id'] for line in f] == ['P4']
+
+def test_old_logs_rotate_and_only_max_files_are_kept(tmp_path):
+    directory = str(tmp_path / 'logs')
+    log = alert_log.AlertLog(directory=directory, max_age=timedelta(hours=1), compress=False, max_files=1)
+    
+    # the active file's first record is already older than max_age on every flush
+    for days_ago in (3, 2, 1):
+        log.write(alerts_on(datetime.now() - timedelta(days=days_ago), f"P{days_ago}"))
+        log.flush()
+    
+    rotated = alert_log.rotated_files(directory)
+    assert len(rotated) == 1
+    assert rotated[0][0].endswith('.jsonl')
+    assert list(alert_log.read_alerts(directory=directory)['product_id']) == ['P2', 'P1']
+
+def test_read_alerts_returns_only_the_window(tmp_path):
+    directory = str(tmp_path / 'logs')
+    log = alert_log.AlertLog(directory=directory, max_bytes=1, buffer_size=1)
+    
+    first_day = datetime(2025, 8, 1, 9, 0, 0)
+    for offset, product_id in enumerate(['P1', 'P2', 'P3']):
+        log.write(alerts_on(first_day + timedelta(days=offset), product_id))
+    
+    def window(start=None, end=None):
+        return list(alert_log.read_alerts(start, end, directory=directory)['product_id'])
+    
+    assert window() == ['P1', 'P2', 'P3']
+    assert window(start=datetime(2025, 8, 2)) == ['P2', 'P3']
+    assert window(end=datetime(2025, 8, 2, 23, 59)) == ['P1', 'P2']
+    assert window(datetime(2025, 8, 2), datetime(2025, 8, 2, 23, 59)) == ['P2']
+    
+    # bounds are inclusive to the second
+    assert window(first_day, first_day) == ['P1']
+    
+    empty = alert_log.read_alerts(datetime(2025, 9, 1), directory=directory)
+    assert empty.empty
+    assert list(empty.columns) == ['ts'] + alert_log.RECORD_COLUMNS
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pandas as pd
+
+import cli
+import db
+
+from conftest import make_products
+
+def write_feed(path, rows):
+    make_products(rows).to_csv(path, index=False)
+    return str(path)
+
+def run(capsys, *argv):
+    code = cli.main(list(argv))
+    return code, capsys.readouterr().out
+
+def test_subcommands_against_their_own_database(database, tmp_path, capsys):
+    # not the fixture's database, everything has to go through --db
+    other = str(tmp_path / 'cli.db')
+    feed = write_feed(tmp_path / 'feed.csv', [
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+        ('P1', 'ShopB', 10.0, 11.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 20.0, '2025-08-01'),
+    ])
+    
+    code, out = run(capsys, '--db', other, 'ingest', feed, '--workers', '1', '--check-alerts', '--no-log')
+    assert code == 0
+    assert 'feed.csv: 3 rows' in out
+    assert '1 new, 0 worsened, 0 resolved' in out
+    assert db.get_db_path() == other
+    
+    code, out = run(capsys, '--db', other, 'ingest', feed, '--workers', '1')
+    assert code == 0
+    assert 'skipped' in out
+    
+    code, out = run(capsys, '--db', other, 'alerts')
+    assert (code, out.strip()) == (0, "No new, worsened or resolved price alerts.")
+    
+    code, out = run(capsys, '--db', other, 'compare', '--status', 'alert')
+    assert code == 0
+    assert [line.split()[:2] for line in out.splitlines()[1:]] == [['P1', 'Product']]
+    
+    code, out = run(capsys, '--db', other, 'stats', '--json')
+    assert code == 0
+    assert json.loads(out)
+    
+    output = str(tmp_path / 'export.json')
+    assert cli.main(['--db', other, 'export', '--output', output]) == 0
+    with open(output) as f:
+        exported = json.load(f)
+    assert sorted((row['product_id'], row['competitor_name']) for row in exported) == [
+        ('P1', 'ShopA'), ('P1', 'ShopB'), ('P2', 'ShopA'),
+    ]
+    
+    output = str(tmp_path / 'alerts.csv')
+    assert cli.main(['--db', other, 'export', '--status', 'alert', '--output', output]) == 0
+    assert list(pd.read_csv(output)['competitor_name']) == ['ShopA']
+    
+    # the fixture's database never saw any of it
+    db.set_db_path(database)
+    assert db.get_all_products().empty
+
+def test_bad_input_exits_non_zero(database, tmp_path, capsys):
+    missing = write_feed(tmp_path / 'broken.csv', [('P1', 'ShopA', 10.0, 9.0, '2025-08-01')])
+    pd.read_csv(missing).drop(columns=['our_price']).to_csv(missing, index=False)
+    
+    code, out = run(capsys, '--db', database, 'ingest', missing, '--workers', '1')
+    assert code == 1
+    assert 'error' in out
+    
+    assert cli.main(['--db', database, 'export', '--output', str(tmp_path / 'out.parquet')]) == 2
+    assert not os.path.exists(tmp_path / 'out.parquet')
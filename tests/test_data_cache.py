@@ -0,0 +1,76 @@
+import sqlite3
+
+import data_cache
+import db
+import instrumentation
+
+from conftest import make_products
+
+def assert_stats_match_sql():
+    assert data_cache.get_price_change_stats() == db.get_price_stats()
+    assert data_cache.get_competitor_stats() == db.get_price_stats(by_competitor=True)
+
+def test_stats_match_sql_on_sub_cent_gaps(database):
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 9.996, '2025-08-01'),
+        ('P1', 'ShopB', 10.0, 9.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 20.004, '2025-08-01'),
+        ('P3', 'ShopB', 5.0, 5.0, '2025-08-01'),
+    ] + [
+        # enough pairs that the next load is a delta, not a reload
+        (f"F{n}", 'ShopC', 3.0, 3.0, '2025-08-01') for n in range(20)
+    ]))
+    
+    stats = data_cache.get_price_change_stats()
+    assert stats['competitors_cheaper'] == 2
+    assert stats['we_are_cheaper'] == 1
+    assert (data_cache.get_compared_products()['status'] == 'alert').sum() == 2
+    assert_stats_match_sql()
+    
+    # the same again through a delta refresh rather than a full load
+    db.save_data_to_db(make_products([
+        ('P3', 'ShopB', 5.0, 4.996, '2025-08-02'),
+        ('P4', 'ShopC', 7.0, 7.004, '2025-08-02'),
+    ]))
+    
+    assert data_cache.get_price_change_stats()['competitors_cheaper'] == 3
+    assert data_cache.cache_info()['delta_refreshes'] == 1
+    assert_stats_match_sql()
+
+def test_changed_products_error_falls_back_to_reload(database, monkeypatch):
+    monkeypatch.setattr(instrumentation, '_enabled', True)
+    
+    db.save_data_to_db(make_products([(f"P{n}", 'ShopA', 10.0, 9.0, '2025-08-01') for n in range(20)]))
+    data_cache.get_compared_products()
+    db.save_data_to_db(make_products([('P1', 'ShopA', 10.0, 11.0, '2025-08-02')]))
+    
+    # only the delta query fails, the full reload still reads fine
+    read_sql_query = db.pd.read_sql_query
+    def delta_query_fails(sql, *args, **kwargs):
+        if 'WITH changed' in sql:
+            raise sqlite3.OperationalError("database is locked")
+        return read_sql_query(sql, *args, **kwargs)
+    monkeypatch.setattr(db.pd, 'read_sql_query', delta_query_fails)
+    
+    since_id = db.get_history_high_water()
+    assert db.get_changed_products(since_id) == (since_id, None)
+    
+    assert len(data_cache.get_compared_products()) == 20
+    assert data_cache.get_price_change_stats() == db.get_price_stats()
+    assert data_cache.cache_info()['full_loads'] == 2
+    assert data_cache.cache_info()['delta_refreshes'] == 0
+
+def test_home_stats_load_no_rows_on_a_cold_cache(database):
+    db.save_data_to_db(make_products([(f"P{n}", 'ShopA', 10.0, 9.0 + n % 3, '2025-08-01') for n in range(20)]))
+    
+    # nothing has loaded the products yet, so the stats come from sql
+    assert data_cache.get_price_change_stats() == db.get_price_stats()
+    assert data_cache.get_competitor_stats() == db.get_price_stats(by_competitor=True)
+    assert data_cache.cache_info()['full_loads'] == 0
+    
+    # once they're loaded, a small ingest is applied to them instead
+    data_cache.get_compared_products()
+    db.save_data_to_db(make_products([('P1', 'ShopA', 10.0, 8.0, '2025-08-02')]))
+    assert data_cache.get_price_change_stats() == db.get_price_stats()
+    assert data_cache.cache_info()['full_loads'] == 1
+    assert data_cache.cache_info()['delta_refreshes'] == 1
@@ -0,0 +1,186 @@
+import pandas as pd
+
+import db
+
+from conftest import make_products
+
+def fts_integrity(conn):
+    # raises if the index doesn't match what's in latest_prices
+    conn.execute("INSERT INTO latest_prices_fts (latest_prices_fts) VALUES ('integrity-check')")
+
+def triggers(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+def test_bulk_load_keeps_search_index_in_step(database):
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+        ('P1', 'ShopB', 10.0, 11.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 20.0, '2025-08-01'),
+    ]))
+    
+    # P1 gets a new name at ShopA only, P3 is new, and an older row must not rename P2
+    renamed = make_products([
+        ('P1', 'ShopA', 10.0, 8.0, '2025-08-02'),
+        ('P3', 'ShopC', 5.0, 6.0, '2025-08-02'),
+        ('P2', 'ShopA', 20.0, 19.0, '2025-07-01'),
+    ])
+    renamed.loc[0, 'product_name'] = 'Gaming Laptop'
+    renamed.loc[2, 'product_name'] = 'Stale Name'
+    success, message = db.save_data_to_db(renamed)
+    assert success, message
+    
+    with db.connection() as conn:
+        fts_integrity(conn)
+        assert set(db.LATEST_PRICES_FTS_TRIGGERS) <= triggers(conn)
+    
+    assert list(db.search_products('gaming')['competitor_name']) == ['ShopA']
+    assert db.search_products('stale').empty
+    assert len(db.search_products('product p3')) == 1
+    assert sorted(db.search_products('product p1')['competitor_name']) == ['ShopB']
+
+def test_failed_load_leaves_the_triggers(database):
+    def batches():
+        yield make_products([('P1', 'ShopA', 10.0, 9.0, '2025-08-01')])
+        yield make_products([('P2', 'ShopA', -1.0, 9.0, '2025-08-01')])
+    
+    success, _ = db.save_batches_to_db(batches())
+    assert not success
+    
+    with db.connection(readonly=True) as conn:
+        assert set(db.LATEST_PRICES_FTS_TRIGGERS) <= triggers(conn)
+        assert conn.execute("SELECT COUNT(*) FROM latest_prices").fetchone()[0] == 0
+    
+    # single-row edits outside a bulk load still go through the triggers
+    with db.connection() as conn:
+        conn.execute(
+            "INSERT INTO latest_prices (product_id, product_name, our_price, competitor_name, competitor_price, last_updated) "
+            "VALUES ('P9', 'Desk Lamp', 1.0, 'ShopZ', 2.0, '2025-08-01')"
+        )
+        conn.execute("UPDATE latest_prices SET product_name = 'Floor Lamp' WHERE product_id = 'P9'")
+        conn.commit()
+        fts_integrity(conn)
+    
+    assert len(db.search_products('floor')) == 1
+    assert db.search_products('desk').empty
+
+def test_first_product_id(database):
+    assert db.get_first_product_id() is None
+    
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+    ]))
+    assert db.get_first_product_id() == 'P1'
+
+def history_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM price_history").fetchone()[0]
+
+def test_repeated_rows_are_loaded_once(database):
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+    ]))
+    
+    # a row already in history, one repeated inside the load, and a later price the same day
+    result = {}
+    success, message = db.save_batches_to_db([make_products([
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 19.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 19.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 18.0, '2025-08-01'),
+    ])], result=result)
+    assert success, message
+    assert (result['new_rows'], result['duplicate_rows']) == (2, 2)
+    
+    with db.connection(readonly=True) as conn:
+        assert history_rows(conn) == 3
+        daily = conn.execute(
+            "SELECT competitor_price, min_competitor_price, max_competitor_price, observations FROM daily_prices WHERE product_id = 'P2'"
+        ).fetchone()
+        latest = conn.execute("SELECT competitor_price FROM latest_prices WHERE product_id = 'P2'").fetchone()
+    
+    # the last row of the feed wins, and the repeat isn't counted as an observation
+    assert daily == (18.0, 18.0, 19.0, 2)
+    assert latest == (18.0,)
+
+def test_row_hashes_match_what_comes_back_out(database):
+    # numeric ids and whole-number prices, the way a csv often reads
+    feed = pd.DataFrame({
+        'product_id': [101, 102],
+        'product_name': ['Desk Lamp', 'Floor Lamp'],
+        'our_price': [10, 20],
+        'competitor_name': ['ShopA', 'ShopA'],
+        'competitor_price': [9, 21],
+        'last_updated': ['2025-08-01', '2025-08-01'],
+    })
+    db.save_data_to_db(feed)
+    
+    with db.connection(readonly=True) as conn:
+        stored = pd.read_sql_query(f"SELECT {', '.join(db.REQUIRED_COLUMNS)}, row_hash FROM price_history ORDER BY id", conn)
+    assert db._row_hashes(stored) == list(stored['row_hash'])
+    
+    result = {}
+    db.save_batches_to_db([stored[db.REQUIRED_COLUMNS]], result=result)
+    assert result['new_rows'] == 0
+
+def test_migration_10_rehashes_older_history(database):
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 21.0, '2025-08-01'),
+    ]))
+    
+    # put the database back how migration 7 left it
+    with db.connection() as conn:
+        conn.create_function('row_hash', len(db.REQUIRED_COLUMNS), lambda *values: db._row_hash(values))
+        conn.execute(f"UPDATE price_history SET row_hash = row_hash({', '.join(db.REQUIRED_COLUMNS)})")
+        conn.execute("DELETE FROM schema_version WHERE version >= 10")
+        conn.commit()
+        
+        assert db.migrate_db(conn) >= 10
+    
+    # a different batch, so only the row hashes can tell the repeats apart
+    result = {}
+    db.save_batches_to_db([make_products([
+        ('P2', 'ShopA', 20.0, 21.0, '2025-08-01'),
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+    ])], result=result)
+    assert result['new_rows'] == 0
+
+def product_summary(conn):
+    return pd.read_sql_query("SELECT * FROM product_summary ORDER BY product_id", conn)
+
+def test_incremental_product_summary_matches_a_full_rebuild(database):
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopA', 10.0, 9.0, '2025-08-01'),
+        ('P1', 'ShopB', 10.0, 11.0, '2025-08-01'),
+        ('P1', 'ShopC', 10.0, 12.0, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 18.0, '2025-08-01'),
+        ('P2', 'ShopB', 20.0, 18.0, '2025-08-01'),
+        ('P3', 'ShopA', 5.0, 6.0, '2025-08-01'),
+    ]))
+    
+    # P1 gets a fourth competitor and a new price of ours, P2 an older feed that
+    # must not count, P3 is left alone and P4 is new
+    db.save_data_to_db(make_products([
+        ('P1', 'ShopD', 11.0, 10.0, '2025-08-02'),
+        ('P2', 'ShopA', 25.0, 15.0, '2025-07-01'),
+        ('P4', 'ShopB', 7.0, 7.0, '2025-08-02'),
+    ]))
+    
+    with db.connection() as conn:
+        incremental = product_summary(conn)
+        db._refresh_product_summary(conn.cursor())
+        rebuilt = product_summary(conn)
+        conn.rollback()
+    
+    pd.testing.assert_frame_equal(incremental, rebuilt)
+    
+    summary = incremental.set_index('product_id')
+    assert summary.loc['P1', ['our_price', 'competitors', 'min_competitor_price', 'median_competitor_price',
+                              'max_competitor_price', 'cheapest_competitor', 'our_rank']].tolist() == [
+        11.0, 4, 9.0, 10.5, 12.0, 'ShopA', 3
+    ]
+    # a tie for cheapest goes to the first name
+    assert summary.loc['P2', ['our_price', 'median_competitor_price', 'cheapest_competitor', 'gap_to_cheapest', 'our_rank']].tolist() == [
+        20.0, 18.0, 'ShopA', 2.0, 3
+    ]
+    assert summary.loc['P3', 'our_rank'] == 1
+    assert summary.loc['P4', ['competitors', 'gap_to_cheapest', 'our_rank']].tolist() == [1, 0.0, 1]
@@ -0,0 +1,68 @@
+import pandas as pd
+
+import db
+import ingest
+
+from conftest import make_products
+
+def write_feed(path):
+    make_products([
+        ('P1', 'ShopA', 10.0, 9.5, '2025-08-01'),
+        ('P1', 'ShopB', 10.0, 10.5, '2025-08-01'),
+        ('P2', 'ShopA', 20.0, 20.0, '2025-08-01'),
+    ]).to_csv(path, index=False)
+    return str(path)
+
+def test_ingest_files_skips_a_file_it_has_seen(database, tmp_path):
+    path = write_feed(tmp_path / 'feed.csv')
+    
+    success, _, reports = ingest.ingest_files([path], workers=1)
+    assert success
+    assert reports[0]['skipped'] is None
+    
+    # the ledger keys the file on its content hash, with the file name as the source
+    entry = db.get_ingested_file(ingest.file_digest(path))
+    assert entry is not None
+    assert entry['source'] == 'feed.csv'
+    assert entry['rows'] == 3
+    
+    success, message, reports = ingest.ingest_files([path], workers=1)
+    assert success
+    assert reports[0]['skipped'] is not None
+    assert 'already ingested' in reports[0]['skipped']
+    
+    success, message = ingest.ingest_file(path)
+    assert success
+    assert 'already ingested' in message
+
+def test_excel_ingest_reads_every_product_sheet(database, tmp_path):
+    path = str(tmp_path / 'feed.xlsx')
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        pd.DataFrame({'note': ['prices as of Monday']}).to_excel(writer, sheet_name='Notes', index=False)
+        make_products([
+            ('P1', 'ShopA', 10.0, 9.5, '2025-08-01'),
+            ('P2', 'ShopA', 20.0, 21.0, '2025-08-01'),
+            ('P3', 'ShopA', 30.0, 30.0, '2025-08-01'),
+        ]).to_excel(writer, sheet_name='ShopA', index=False)
+        # extra columns and a blank row in the middle don't matter
+        shop_b = make_products([
+            ('P1', 'ShopB', 10.0, 10.5, '2025-08-01'),
+            ('P2', 'ShopB', 20.0, 19.0, '2025-08-01'),
+        ])
+        shop_b['buyer'] = 'sam'
+        shop_b.iloc[:1].to_excel(writer, sheet_name='ShopB', index=False)
+        shop_b.iloc[1:].to_excel(writer, sheet_name='ShopB', index=False, header=False, startrow=3)
+    
+    # batches never span sheets
+    assert [len(batch) for batch in ingest.iter_excel_batches(path, batch_size=2)] == [2, 1, 2]
+    assert list(ingest.preview_excel(path)['competitor_name']) == ['ShopA', 'ShopA', 'ShopA']
+    
+    result = {}
+    success, message = ingest.ingest_file(path, result=result)
+    assert success, message
+    assert (result['rows'], result['new_rows']) == (5, 5)
+    
+    latest = db.get_all_products()
+    assert sorted(zip(latest['product_id'], latest['competitor_name'])) == [
+        ('P1', 'ShopA'), ('P1', 'ShopB'), ('P2', 'ShopA'), ('P2', 'ShopB'), ('P3', 'ShopA'),
+    ]
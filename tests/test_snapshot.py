@@ -0,0 +1,89 @@
+import datetime
+import os
+
+import pytest
+
+import data_cache
+import db
+import snapshot
+
+from conftest import make_products
+
+pytest.importorskip('pyarrow')
+
+COMPETITORS = [f"Shop{n}" for n in range(8)]
+
+def long_history(days):
+    # one product per competitor per day, more day x competitor partitions than pyarrow's default 1024
+    start = datetime.date(2025, 1, 1)
+    return make_products([
+        ('P1', competitor, 100.0, 90.0 + day % 20, (start + datetime.timedelta(days=day)).isoformat())
+        for day in range(days)
+        for competitor in COMPETITORS
+    ])
+
+def snapshot_files(directory):
+    return sorted(os.listdir(directory)) if os.path.exists(directory) else []
+
+def test_export_with_more_than_1024_partitions(database, tmp_path):
+    success, _ = db.save_data_to_db(long_history(140))
+    assert success
+    
+    directory = str(tmp_path / 'snapshots')
+    success, message = snapshot.export_snapshot('price_history', directory)
+    assert success, message
+    
+    assert snapshot_files(directory) == ['price_history', 'price_history.arrow', 'price_history.json']
+    assert len(snapshot.read_parquet('price_history', directory=directory)) == 140 * len(COMPETITORS)
+    assert len(snapshot.load_arrow('price_history', directory=directory)) == 140 * len(COMPETITORS)
+
+def test_failed_export_leaves_no_temp_files(database, tmp_path, monkeypatch):
+    db.save_data_to_db(long_history(3))
+    
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(snapshot.ds, 'write_dataset', fail)
+    
+    directory = str(tmp_path / 'snapshots')
+    success, message = snapshot.export_snapshot('price_history', directory)
+    assert not success
+    assert 'disk full' in message
+    assert snapshot_files(directory) == []
+
+def two_products(first, second):
+    return make_products([
+        (first, 'ShopA', 10.0, 9.0, '2025-08-01'),
+        (second, 'ShopA', 20.0, 21.0, '2025-08-01'),
+    ])
+
+def test_snapshot_of_a_deleted_database_is_not_used(database, tmp_path):
+    db.save_data_to_db(two_products('P1', 'P2'))
+    
+    # one in the database's own directory, one somewhere delete_database doesn't know about
+    elsewhere = str(tmp_path / 'elsewhere')
+    for directory in (None, elsewhere):
+        success, message = snapshot.export_snapshot('latest_prices', directory)
+        assert success, message
+        assert snapshot.is_fresh('latest_prices', directory)
+    
+    db.delete_database()
+    assert not os.path.exists(db.get_snapshot_dir())
+    
+    # same row counts and history ids as before, only the products differ
+    db.init_db()
+    db.save_data_to_db(two_products('X9', 'X8'))
+    
+    assert not snapshot.is_fresh('latest_prices', elsewhere)
+    assert sorted(data_cache.get_compared_products()['product_id']) == ['X8', 'X9']
+
+def test_databases_keep_their_own_snapshots(database, tmp_path):
+    first_dir = db.get_snapshot_dir()
+    db.save_data_to_db(two_products('P1', 'P2'))
+    snapshot.export_snapshot('latest_prices')
+    
+    db.set_db_path(str(tmp_path / 'other.db'))
+    db.init_db()
+    db.save_data_to_db(two_products('X9', 'X8'))
+    
+    assert db.get_snapshot_dir() != first_dir
+    assert not snapshot.is_fresh('latest_prices')
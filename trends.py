@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+import db
+import instrumentation
+
+# Price trends over the daily rollups db keeps up to date on every ingest:
+#   daily_prices            one row per product / competitor / day
+#   daily_competitor_stats  one row per competitor / day
+#   weekly_prices           what retention folds daily_prices into once it's old
+# Rolling figures use sqlite window functions, so only the rows that get
+# charted ever leave the database.
+
+DEFAULT_WINDOW_DAYS = 7
+
+@instrumentation.instrumented
+def get_competitor_trends(start=None, end=None):
+    """
+    Per competitor per day: products seen, how many undercut us and the
+    average gap as a percentage of our price (positive means they're cheaper)
+    """
+    try:
+        with db.connection(readonly=True) as conn:
+            return pd.read_sql_query(
+                '''
+                SELECT day, competitor_name, products, competitors_cheaper, we_are_cheaper,
+                       avg_our_price, avg_competitor_price, avg_gap_percentage
+                FROM daily_competitor_stats
+                WHERE day >= COALESCE(?, day) AND day <= COALESCE(?, day)
+                ORDER BY day, competitor_name
+                ''',
+                conn,
+                params=(start, end),
+                parse_dates=['day']
+            )
+    except Exception as e:
+        print(f"Trend query error: {str(e)}")
+        return pd.DataFrame()
+
+@instrumentation.instrumented
+def get_price_series(product_id, competitor_name=None, start=None, end=None, window=DEFAULT_WINDOW_DAYS):
+    """
+    Daily price series for one product (all its competitors, or just one) with
+    a rolling average and rolling volatility of the competitor price over the
+    last window observations, and the days since that competitor last changed
+    its price.
+    """
+    try:
+        with db.connection(readonly=True) as conn:
+            series = pd.read_sql_query(
+                '''
+                WITH daily AS (
+                    SELECT competitor_name, day, our_price, competitor_price,
+                           min_competitor_price, max_competitor_price,
+                           competitor_price IS NOT LAG(competitor_price) OVER pair AS changed
+                    FROM daily_prices
+                    WHERE product_id = ? AND competitor_name = COALESCE(?, competitor_name)
+                    WINDOW pair AS (PARTITION BY competitor_name ORDER BY day)
+                )
+                SELECT competitor_name, day, our_price, competitor_price,
+                       min_competitor_price, max_competitor_price,
+                       AVG(competitor_price) OVER recent AS rolling_average,
+                       AVG(competitor_price * competitor_price) OVER recent
+                           - AVG(competitor_price) OVER recent * AVG(competitor_price) OVER recent AS rolling_variance,
+                       julianday(day) - julianday(MAX(CASE WHEN changed THEN day END) OVER so_far) AS days_since_change
+                FROM daily
+                WINDOW recent AS (PARTITION BY competitor_name ORDER BY day ROWS BETWEEN ? PRECEDING AND CURRENT ROW),
+                       so_far AS (PARTITION BY competitor_name ORDER BY day ROWS UNBOUNDED PRECEDING)
+                ORDER BY competitor_name, day
+                ''',
+                conn,
+                params=(product_id, competitor_name, max(window - 1, 0)),
+                parse_dates=['day']
+            )
+    except Exception as e:
+        print(f"Trend query error: {str(e)}")
+        return pd.DataFrame()
+    
+    # the window filter runs after the rolling figures so the first days in range still get a full window
+    if start is not None:
+        series = series[series['day'] >= pd.Timestamp(start)]
+    if end is not None:
+        series = series[series['day'] <= pd.Timestamp(end)]
+    
+    # sqlite has no sqrt everywhere, so the standard deviation is finished here
+    series['rolling_volatility'] = np.sqrt(series.pop('rolling_variance').clip(lower=0))
+    return series.reset_index(drop=True)
+
+@instrumentation.instrumented
+def get_weekly_series(product_id, competitor_name=None, start=None, end=None):
+    """
+    Weekly price series for one product from the days retention has folded
+    into weeks: the week's last prices, its range and how many rows went in
+    """
+    try:
+        with db.connection(readonly=True) as conn:
+            return pd.read_sql_query(
+                '''
+                SELECT competitor_name, week, our_price, competitor_price,
+                       min_competitor_price, max_competitor_price, observations
+                FROM weekly_prices
+                WHERE product_id = ? AND competitor_name = COALESCE(?, competitor_name)
+                  AND week >= COALESCE(?, week) AND week <= COALESCE(?, week)
+                ORDER BY competitor_name, week
+                ''',
+                conn,
+                params=(product_id, competitor_name, start, end),
+                parse_dates=['week']
+            )
+    except Exception as e:
+        print(f"Trend query error: {str(e)}")
+        return pd.DataFrame()
+
+@instrumentation.instrumented
+def get_most_volatile(days=30, limit=20, end=None):
+    """
+    Product / competitor pairs whose competitor price moved the most over the
+    last days days (up to end, default the newest day on record): standard
+    deviation relative to the average price, number of changes and days since
+    the last one.
+    """
+    try:
+        with db.connection(readonly=True) as conn:
+            end = end or conn.execute("SELECT MAX(day) FROM daily_prices").fetchone()[0]
+            if end is None:
+                return pd.DataFrame()
+            
+            volatile = pd.read_sql_query(
+                '''
+                WITH recent AS (
+                    SELECT product_id, competitor_name, day, competitor_price,
+                           competitor_price IS NOT LAG(competitor_price) OVER pair
+                               AND LAG(competitor_price) OVER pair IS NOT NULL AS changed
+                    FROM daily_prices
+                    WHERE day > date(?, ?) AND day <= ?
+                    WINDOW pair AS (PARTITION BY product_id, competitor_name ORDER BY day)
+                )
+                SELECT product_id, competitor_name,
+                       COUNT(*) AS observations,
+                       AVG(competitor_price) AS average_price,
+                       AVG(competitor_price * competitor_price) - AVG(competitor_price) * AVG(competitor_price) AS variance,
+                       SUM(changed) AS price_changes,
+                       julianday(?) - julianday(MAX(CASE WHEN changed THEN day END)) AS days_since_change
+                FROM recent
+                GROUP BY product_id, competitor_name
+                HAVING COUNT(*) > 1
+                ''',
+                conn,
+                params=(end, f"-{days} days", end, end)
+            )
+            
+            names = pd.read_sql_query(
+                "SELECT DISTINCT product_id, product_name FROM latest_prices",
+                conn
+            )
+    except Exception as e:
+        print(f"Trend query error: {str(e)}")
+        return pd.DataFrame()
+    
+    if volatile.empty:
+        return volatile
+    
+    volatile['volatility'] = np.sqrt(volatile.pop('variance').clip(lower=0))
+    volatile['relative_volatility'] = volatile['volatility'] / volatile['average_price'] * 100
+    
+    volatile = volatile.nlargest(limit, 'relative_volatility')
+    volatile = volatile.merge(names.drop_duplicates('product_id'), on='product_id', how='left')
+    return volatile.reset_index(drop=True)
+
+@instrumentation.instrumented
+def get_trend_range():
+    """
+    First and last day in the rollups, (None, None) when there's no data
+    """
+    try:
+        with db.connection(readonly=True) as conn:
+            return tuple(conn.execute("SELECT MIN(day), MAX(day) FROM daily_competitor_stats").fetchone())
+    except Exception as e:
+        print(f"Trend query error: {str(e)}")
+        return None, None